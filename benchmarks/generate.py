@@ -0,0 +1,161 @@
+"""Generator for synthetic GitOps deployment repositories"""
+import argparse
+import pathlib
+import random
+from dataclasses import asdict, dataclass
+
+KUBERNETES_MANIFEST = """# Generated deployment
+apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: {name}
+  labels:
+    app: {name}
+spec:
+  replicas: 2
+  selector:
+    matchLabels:
+      app: {name}
+  template:
+    metadata:
+      labels:
+        app: {name}
+    spec:
+      containers:
+{containers}"""
+KUBERNETES_CONTAINER = """      - name: container-{i}
+        image: {image}  # Updated by nautikos
+        ports:
+        - containerPort: {port}
+"""
+KUBERNETES_PADDING = """        env:
+{variables}"""
+KUBERNETES_VARIABLE = """        - name: VARIABLE_{i}
+          value: "{value}"
+"""
+KUSTOMIZE_MANIFEST = """# Generated kustomization
+resources:
+- ../base
+images:
+{images}"""
+KUSTOMIZE_IMAGE = """- name: {repository}
+  newTag: '{tag}'
+"""
+KUSTOMIZE_PADDING = """configMapGenerator:
+- name: {name}
+  literals:
+{literals}"""
+KUSTOMIZE_LITERAL = """  - VARIABLE_{i}={value}
+"""
+
+
+@dataclass
+class RepoSpec:
+    environments: int = 5
+    # Number of manifests of each type per environment
+    kubernetes_manifests: int = 40
+    kustomize_manifests: int = 40
+    containers: int = 3
+    repositories: int = 50
+    # Number of distinct labels, and number of labels per manifest
+    labels: int = 20
+    labels_per_manifest: int = 2
+    # Approximate minimum size of each manifest in bytes
+    file_size: int = 0
+    seed: int = 0
+
+
+def generate(root: pathlib.Path, spec: RepoSpec) -> pathlib.Path:
+    """Creates a deployment repository in root, and returns the path of its config"""
+    rng = random.Random(spec.seed)
+    repositories = [
+        f"registry.example.com/team/repo-{i}" for i in range(spec.repositories)
+    ]
+    labels = [f"label-{i}" for i in range(spec.labels)]
+    config = ["environments:\n"]
+    for e in range(spec.environments):
+        env = f"env-{e}"
+        config.append(f"- name: {env}\n  manifests:\n")
+        for type, count in (
+            ("kubernetes", spec.kubernetes_manifests),
+            ("kustomize", spec.kustomize_manifests),
+        ):
+            for m in range(count):
+                name = f"app-{m}"
+                images = rng.sample(
+                    repositories, min(spec.containers, len(repositories))
+                )
+                tags = [f"{rng.randint(0, 9)}.{rng.randint(0, 99)}" for _ in images]
+                if type == "kubernetes":
+                    path = pathlib.Path(env) / name / "deployment.yaml"
+                    content = _kubernetes_manifest(name, images, tags, spec.file_size)
+                else:
+                    path = pathlib.Path(env) / name / "kustomization.yaml"
+                    content = _kustomize_manifest(name, images, tags, spec.file_size)
+                (root / path).parent.mkdir(parents=True, exist_ok=True)
+                (root / path).write_text(content)
+                config.append(f"  - path: {path.as_posix()}\n    type: {type}\n")
+                manifest_labels = rng.sample(
+                    labels, min(spec.labels_per_manifest, len(labels))
+                )
+                if manifest_labels:
+                    config.append("    labels:\n")
+                    config += [f"    - {label}\n" for label in manifest_labels]
+    config_path = root / "nautikos.yaml"
+    config_path.write_text("".join(config))
+    return config_path
+
+
+def _kubernetes_manifest(
+    name: str, images: list[str], tags: list[str], file_size: int
+) -> str:
+    containers = "".join(
+        KUBERNETES_CONTAINER.format(i=i, image=f"{image}:{tag}", port=8000 + i)
+        for i, (image, tag) in enumerate(zip(images, tags))
+    )
+    content = KUBERNETES_MANIFEST.format(name=name, containers=containers)
+    variables = _padding(KUBERNETES_VARIABLE, file_size - len(content))
+    if variables:
+        content += KUBERNETES_PADDING.format(variables=variables)
+    return content
+
+
+def _kustomize_manifest(
+    name: str, images: list[str], tags: list[str], file_size: int
+) -> str:
+    content = KUSTOMIZE_MANIFEST.format(
+        images="".join(
+            KUSTOMIZE_IMAGE.format(repository=image, tag=tag)
+            for image, tag in zip(images, tags)
+        )
+    )
+    literals = _padding(KUSTOMIZE_LITERAL, file_size - len(content))
+    if literals:
+        content += KUSTOMIZE_PADDING.format(name=name, literals=literals)
+    return content
+
+
+def _padding(template: str, size: int) -> str:
+    lines: list[str] = []
+    i = 0
+    while size > 0:
+        line = template.format(i=i, value="x" * 40)
+        lines.append(line)
+        size -= len(line)
+        i += 1
+    return "".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("root", type=pathlib.Path)
+    for name, value in asdict(RepoSpec()).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=value)
+    args = vars(parser.parse_args())
+    root = args.pop("root")
+    root.mkdir(parents=True, exist_ok=True)
+    print(generate(root, RepoSpec(**args)))
+
+
+if __name__ == "__main__":
+    main()
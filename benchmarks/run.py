@@ -0,0 +1,175 @@
+"""Benchmarks of nautikos on a synthetic deployment repository
+
+Results are written as JSON, and can be compared against a stored baseline:
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --baseline results.json --threshold 0.2
+"""
+import argparse
+import json
+import pathlib
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import asdict, fields
+from typing import Any, Callable, Union
+
+from typer.testing import CliRunner
+
+from nautikos import cli
+from nautikos.nautikos import Nautikos
+
+from .generate import RepoSpec, generate
+
+REPOSITORY = "registry.example.com/team/repo-0"
+
+Setup = Callable[[pathlib.Path], Any]
+Benchmark = Callable[[pathlib.Path], Any]
+
+
+def _load_config(config: pathlib.Path, use_cache: bool = True) -> Nautikos:
+    nautikos = Nautikos()
+    nautikos.set_use_cache(use_cache)
+    nautikos.load_config(str(config))
+    return nautikos
+
+
+def _update(
+    config: pathlib.Path, use_index: bool = True, dry_run: bool = False
+) -> None:
+    nautikos = _load_config(config)
+    nautikos.set_use_index(use_index)
+    nautikos.set_dry_run(dry_run)
+    nautikos.update_manifests(REPOSITORY, "1.2.3")
+
+
+def _warm_up(config: pathlib.Path) -> None:
+    """Fills the config cache and manifest index"""
+    _update(config, dry_run=True)
+
+
+def _clear_caches(config: pathlib.Path) -> None:
+    shutil.rmtree(config.parent / ".nautikos", ignore_errors=True)
+
+
+def _cli(config: pathlib.Path) -> None:
+    cli._nautikos = None  # Like a new process, start without previous modifications
+    result = CliRunner().invoke(cli.app, [REPOSITORY, "1.2.3", "--config", str(config)])
+    if result.exit_code != 0:
+        raise Exception(f"CLI failed: {result.output}")
+
+
+# Name -> (setup, benchmark); only the benchmark itself is timed
+BENCHMARKS: dict[str, tuple[Setup, Benchmark]] = {
+    "load_config": (_clear_caches, lambda c: _load_config(c, use_cache=False)),
+    "load_config_cached": (_warm_up, lambda c: _load_config(c)),
+    "update_manifests_cold": (_clear_caches, _update),
+    "update_manifests_warm": (_warm_up, _update),
+    "update_manifests_no_index": (_clear_caches, lambda c: _update(c, use_index=False)),
+    "update_manifests_dry_run": (_warm_up, lambda c: _update(c, dry_run=True)),
+    "update_manifests_up_to_date": (_update, _update),
+    "cli": (_warm_up, _cli),
+}
+
+
+def run(
+    spec: RepoSpec, repeat: int = 5, names: Union[list[str], None] = None
+) -> dict[str, Any]:
+    """Runs the benchmarks, each on a fresh copy of a generated repository"""
+    results: dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        template = pathlib.Path(tmp) / "template"
+        template.mkdir()
+        generate(template, spec)
+        for name, (setup, benchmark) in BENCHMARKS.items():
+            if names and name not in names:
+                continue
+            timings: list[float] = []
+            for i in range(repeat):
+                root = pathlib.Path(tmp) / f"{name}-{i}"
+                shutil.copytree(template, root)
+                config = root / "nautikos.yaml"
+                setup(config)
+                start = time.perf_counter()
+                benchmark(config)
+                timings.append(time.perf_counter() - start)
+                shutil.rmtree(root)
+            results[name] = {
+                "min": min(timings),
+                "median": statistics.median(timings),
+                "mean": statistics.mean(timings),
+                "runs": repeat,
+            }
+    return {
+        "spec": asdict(spec),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(
+    results: dict[str, Any], baseline: dict[str, Any], threshold: float
+) -> list[str]:
+    """Prints a comparison with a baseline, and returns the names of regressions
+
+    A benchmark has regressed if its median is more than `threshold` (a fraction)
+    slower than in the baseline.
+    """
+    if results["spec"] != baseline["spec"]:
+        print("WARNING - Baseline was generated with a different repository spec")
+    regressions: list[str] = []
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before, after = baseline["results"][name]["median"], result["median"]
+        ratio = after / before if before else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(
+            f"{name:30} {before * 1000:10.1f} ms {after * 1000:10.1f} ms"
+            f" {ratio:6.2f}x{flag}"
+        )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--output", type=pathlib.Path)
+    parser.add_argument("--baseline", type=pathlib.Path)
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--benchmark", action="append", choices=list(BENCHMARKS))
+    for field in fields(RepoSpec):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=int)
+    args = parser.parse_args()
+
+    spec = RepoSpec()
+    if args.baseline:
+        # Use the same repository as the baseline, unless overridden
+        baseline = json.loads(args.baseline.read_text())
+        spec = RepoSpec(**baseline["spec"])
+    for field in fields(RepoSpec):
+        value = getattr(args, field.name)
+        if value is not None:
+            setattr(spec, field.name, value)
+
+    results = run(spec, repeat=args.repeat, names=args.benchmark)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        regressions = compare(results, baseline, args.threshold)
+        sys.exit(1 if regressions else 0)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
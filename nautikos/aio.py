@@ -0,0 +1,78 @@
+import asyncio
+import collections
+import pathlib
+from typing import Any, AsyncIterator, Union
+
+from .pipeline import ManifestResult, ManifestTask, process_manifest, read_task
+from .writer import StagedWriter
+
+
+class AsyncEngine:
+    """Overlaps reading and writing manifests with processing them
+
+    Blocking file operations run in threads. A semaphore caps the number of files
+    that are open at the same time, for reading and writing together.
+    """
+
+    def __init__(self, writer: StagedWriter, concurrency: int = 8) -> None:
+        self._writer = writer
+        self._concurrency = concurrency
+        self._limit = asyncio.Semaphore(concurrency)
+        self._reads: "collections.deque[asyncio.Future[Union[bytes, None]]]" = (
+            collections.deque()
+        )
+        # Bounded, so processing waits if writing can't keep up
+        self._writes: "asyncio.Queue[pathlib.Path]" = asyncio.Queue(concurrency)
+        self._workers = [
+            asyncio.ensure_future(self._write_worker()) for _ in range(concurrency)
+        ]
+
+    async def run(self, tasks: list[ManifestTask]) -> AsyncIterator[ManifestResult]:
+        """Processes manifests in order, while the next ones are read ahead"""
+        remaining = iter(tasks)
+        pending: collections.deque[ManifestTask] = collections.deque()
+        while True:
+            while len(pending) < self._concurrency:
+                task = next(remaining, None)
+                if task is None:
+                    break
+                pending.append(task)
+                self._reads.append(asyncio.ensure_future(self._read(task)))
+            if not pending:
+                return
+            raw = await self._reads[0]
+            self._reads.popleft()
+            yield process_manifest(pending.popleft(), raw)
+
+    async def prepare(self, path: pathlib.Path) -> None:
+        """Queues a staged file, to write its temporary file in the background"""
+        await self._writes.put(path)
+
+    async def join(self) -> None:
+        """Waits until all queued files are prepared"""
+        await self._writes.join()
+
+    async def close(self) -> None:
+        """Stops reading ahead and writing, after the run is done or was aborted"""
+        futures: list["asyncio.Future[Any]"] = [*self._reads, *self._workers]
+        for future in futures:
+            future.cancel()
+        await asyncio.gather(*futures, return_exceptions=True)
+
+    async def _read(self, task: ManifestTask) -> Union[bytes, None]:
+        async with self._limit:
+            try:
+                return await asyncio.to_thread(read_task, task)
+            except OSError:
+                return None  # Read again while processing, which reports the error
+
+    async def _write_worker(self) -> None:
+        while True:
+            path = await self._writes.get()
+            try:
+                async with self._limit:
+                    await asyncio.to_thread(self._writer.prepare, path)
+            except Exception:
+                ...  # Prepared again by the commit, which reports the error
+            finally:
+                self._writes.task_done()
@@ -0,0 +1,46 @@
+import hashlib
+import json
+import os
+import pathlib
+from typing import Any, Union
+
+CACHE_DIR = ".nautikos"
+
+
+def cache_path(workdir: Union[str, pathlib.Path], name: str) -> pathlib.Path:
+    """Path of a cache file in the cache directory next to the config file"""
+    return pathlib.Path(workdir) / CACHE_DIR / name
+
+
+def stat_key(path: Union[str, pathlib.Path]) -> tuple[int, int]:
+    """Cheap fingerprint of a file: modification time and size"""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def read_json(path: pathlib.Path) -> Any:
+    """Reads a cache file, returning None if it is missing or corrupt"""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path: pathlib.Path, data: Any) -> None:
+    """Writes a cache file atomically; failures are ignored, as caches are optional"""
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            ...
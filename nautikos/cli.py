@@ -1,51 +1,532 @@
+import json
+import os
 import sys
+from dataclasses import asdict
+from enum import Enum
+from typing import Any, Union
 
+import click
 import typer
+from typer.core import TyperGroup
 
+from .manifests import Modification
 from .nautikos import Nautikos
+from .pipeline import ManifestError
+from .timings import Timings
 
-app = typer.Typer()
 
-nautikos = Nautikos()
+class DefaultCommandGroup(TyperGroup):
+    """Runs the 'update' command if the arguments don't start with a command name
 
+    This keeps `nautikos my-repo 1.2.3` working next to commands like `nautikos serve`.
+    """
 
-@app.command()
+    default_command = "update"
+
+    def parse_args(self, ctx: click.Context, args: list[str]) -> list[str]:
+        group_options = [opt for param in self.get_params(ctx) for opt in param.opts]
+        if args and args[0] not in self.commands and args[0] not in group_options:
+            args = [self.default_command, *args]
+        return super().parse_args(ctx, args)
+
+
+app = typer.Typer(cls=DefaultCommandGroup)
+
+_nautikos: Union[Nautikos, None] = None
+
+
+def get_nautikos() -> Nautikos:
+    """Returns the instance used by the CLI
+
+    It is created on first use, so importing the CLI doesn't do any work.
+    """
+    global _nautikos
+    if _nautikos is None:
+        _nautikos = Nautikos()
+    return _nautikos
+
+
+def __getattr__(name: str) -> Any:
+    if name == "nautikos":
+        return get_nautikos()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class WriteMode(str, Enum):
+    dump = "dump"
+    patch = "patch"
+
+
+class Loader(str, Enum):
+    auto = "auto"
+    libyaml = "libyaml"
+    ruamel = "ruamel"
+
+
+class Engine(str, Enum):
+    sync = "sync"
+    asyncio = "async"
+
+
+class OutputFormat(str, Enum):
+    text = "text"
+    json = "json"
+    ndjson = "ndjson"
+
+
+def print_event(event: str, data: dict[str, Any]) -> None:
+    """Prints a single line of NDJSON output, flushed so it can be consumed directly"""
+    print(json.dumps({"event": event, **data}), flush=True)
+
+
+def exit_status(
+    found: int, updated: int, failed: int, target: str, sharded: bool = False
+) -> tuple[str, int]:
+    """Returns the final message and exit code of an update
+
+    A shard may well not contain any of the images; whether the update as a whole found
+    any is up to merge-results.
+    """
+    if found == 0 and sharded:
+        exit_msg = "Didn't find any images to modify in this shard"
+        exit_code = 0
+    elif found == 0:
+        exit_msg = "ERROR - Didn't find any images to modify"
+        exit_code = 1
+    else:
+        exit_msg = f"Updated {updated} out of {found} discovered occurences of {target}"
+        exit_code = 0
+    if failed:
+        exit_code = 1
+    return exit_msg, exit_code
+
+
+def get_tags(
+    repository: Union[str, None], tag: Union[str, None], batch: Union[str, None]
+) -> tuple[dict[str, str], str]:
+    """Returns the new tags from the arguments, and a description of them"""
+    if batch:
+        if repository or tag:
+            raise typer.BadParameter(
+                "can't be combined with a repository and tag", param_hint="'--batch'"
+            )
+        tags = read_batch(batch)
+        return tags, f"{len(tags)} repositories"
+    if repository and tag:
+        return {repository: tag}, f"'{repository}' to '{tag}'"
+    raise typer.BadParameter(
+        "pass a repository and tag, or use '--batch'",
+        param_hint="'REPOSITORY TAG'",
+    )
+
+
+def set_loader(nautikos: Nautikos, loader: Loader) -> None:
+    try:
+        nautikos.set_loader(loader.value)
+    except Exception as e:
+        raise typer.BadParameter(str(e), param_hint="'--loader'")
+
+
+def read_batch(path: str) -> dict[str, str]:
+    """Reads 'repository tag' pairs from a file, or from stdin if path is '-'
+
+    Empty lines and lines starting with '#' are ignored. If a repository occurs more
+    than once, the last tag wins.
+    """
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        try:
+            with open(path, "r") as f:
+                lines = f.read().splitlines()
+        except OSError as e:
+            raise typer.BadParameter(str(e), param_hint="'--batch'")
+    tags: dict[str, str] = {}
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = line.split()
+        if len(parts) != 2:
+            raise typer.BadParameter(
+                f"line {number} should contain a repository and a tag: '{line}'",
+                param_hint="'--batch'",
+            )
+        tags[parts[0]] = parts[1]
+    return tags
+
+
+@app.command("update")
 def main(
-    repository: str,
-    tag: str,
+    repository: str = typer.Argument(None),
+    tag: str = typer.Argument(None),
     env: str = typer.Option(None),
     labels: str = typer.Option(None),
     config: str = typer.Option("nautikos.yaml"),
     dry_run: bool = typer.Option(False, "--dry-run"),
+    batch: str = typer.Option(None),
+    no_index: bool = typer.Option(False, "--no-index"),
+    no_cache: bool = typer.Option(False, "--no-cache"),
+    write_mode: WriteMode = typer.Option(WriteMode.dump),
+    jobs: int = typer.Option(1, min=0),
+    timings: bool = typer.Option(False, "--timings"),
+    profile: str = typer.Option(None),
+    output: OutputFormat = typer.Option(OutputFormat.text),
+    fsync: bool = typer.Option(False, "--fsync"),
+    engine: Engine = typer.Option(Engine.sync),
+    concurrency: int = typer.Option(8, min=1),
+    shard: str = typer.Option(None, help="Only update shard i of n, like '2/4'"),
+    result_file: str = typer.Option(None, help="Write results for merge-results"),
+    resolve_kustomize: bool = typer.Option(False, "--resolve-kustomize"),
+    loader: Loader = typer.Option(Loader.auto, help="Loader for finding images"),
 ):
-    s = f"Updating '{repository}' to '{tag}'"
+    """Updates image tags of a repository, or of a batch of repositories"""
+    tags, target = get_tags(repository, tag, batch)
+    s = f"Updating {target}"
     if env:
         s += f" in '{env}'"
     else:
         s += " in all environments"
     if labels:
         s += f" with labels '{labels}'"
-    print(s)
+    if output == OutputFormat.text:
+        print(s)
 
+    nautikos = get_nautikos()
     nautikos.set_dry_run(dry_run)
+    nautikos.set_use_index(not no_index)
+    nautikos.set_use_cache(not no_cache)
+    nautikos.set_write_mode(write_mode.value)
+    nautikos.set_jobs(jobs)
+    nautikos.set_fsync(fsync)
+    nautikos.set_concurrency(concurrency)
+    nautikos.set_resolve_kustomize(resolve_kustomize)
+    set_loader(nautikos, loader)
+    shard_number: Union[tuple[int, int], None] = None
+    if shard:
+        from .sharding import parse_shard
+
+        try:
+            shard_number = parse_shard(shard)
+            nautikos.set_shard(shard_number)
+        except Exception as e:
+            raise typer.BadParameter(str(e), param_hint="'--shard'")
+    phase_timings = Timings()
+    if timings:
+        nautikos.add_hook(phase_timings)
+    if profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
     nautikos.load_config(config)
-    nautikos.update_manifests(
-        repository, tag, environment=env, labels=labels.split(",") if labels else None
+    label_list = labels.split(",") if labels else None
+    errors: list[ManifestError] = []
+    if output == OutputFormat.ndjson:
+        # Stream results as soon as each manifest is processed; modifications are only
+        # counted, unless they are needed for the result file
+        from .store import ModificationStore
+
+        modifications = ModificationStore(keep=bool(result_file))
+
+        def print_item(item: Union[Modification, ManifestError]) -> None:
+            if isinstance(item, ManifestError):
+                errors.append(item)
+                print_event("error", item.to_dict())
+            else:
+                print_event("modification", item.to_dict())
+
+        if engine == Engine.asyncio:
+            import asyncio
+
+            async def stream() -> None:
+                items = nautikos.iter_updates_async(
+                    tags, env, label_list, store=modifications
+                )
+                async for item in items:
+                    print_item(item)
+
+            asyncio.run(stream())
+        else:
+            items = nautikos.iter_updates(
+                tags, environment=env, labels=label_list, store=modifications
+            )
+            for item in items:
+                print_item(item)
+    else:
+        if engine == Engine.asyncio:
+            import asyncio
+
+            asyncio.run(
+                nautikos.update_manifests_batch_async(
+                    tags, environment=env, labels=label_list
+                )
+            )
+        elif batch:
+            nautikos.update_manifests_batch(tags, environment=env, labels=label_list)
+        else:
+            nautikos.update_manifests(
+                repository, tag, environment=env, labels=label_list
+            )
+        modifications = nautikos.modifications
+        errors = nautikos.errors
+    found = modifications.summary.total.found
+    count_updated_img = modifications.summary.total.updated
+    failed = len(errors)
+    if profile:
+        profiler.disable()
+        profiler.dump_stats(profile)
+
+    # Determine output
+    exit_msg, exit_code = exit_status(
+        found, count_updated_img, failed, target, sharded=shard_number is not None
     )
+    if result_file:
+        from .results import RunResults, write_results
+
+        selection = nautikos.shard_selection
+        write_results(
+            result_file,
+            RunResults(
+                target,
+                list(modifications),
+                errors,
+                nautikos.stats,
+                modifications.summary,
+                shard=shard_number,
+                selection=selection.fingerprint if selection else None,
+                paths=selection.paths if selection else [],
+            ),
+        )
+
+    if output == OutputFormat.text:
+        # Print modified files
+        for mod in nautikos.modifications:
+            print(mod)
 
-    # Print modified files
-    count_updated_img = 0
+        # Print manifests that couldn't be processed
+        for error in nautikos.errors:
+            print(error)
+
+        print(nautikos.stats)
+        if timings:
+            print(phase_timings)
+        if profile:
+            print(f"Wrote profile to '{profile}'")
+        print(exit_msg)
+        if failed:
+            print(f"ERROR - Failed to process {failed} manifest(s)")
+    else:
+        summary = {
+            "found": found,
+            "updated": count_updated_img,
+            "failed": failed,
+            "stats": {**asdict(nautikos.stats), "skipped": nautikos.stats.skipped},
+            **modifications.summary.to_dict(),
+            "message": exit_msg,
+        }
+        if timings:
+            summary["timings"] = asdict(phase_timings)
+        if output == OutputFormat.ndjson:
+            print_event("summary", summary)
+        else:
+            print(
+                json.dumps(
+                    {
+                        "modifications": [m.to_dict() for m in nautikos.modifications],
+                        "errors": [e.to_dict() for e in nautikos.errors],
+                        **summary,
+                    }
+                )
+            )
+    sys.exit(exit_code)
+
+
+@app.command()
+def plan(
+    repository: str = typer.Argument(None),
+    tag: str = typer.Argument(None),
+    env: str = typer.Option(None),
+    labels: str = typer.Option(None),
+    config: str = typer.Option("nautikos.yaml"),
+    batch: str = typer.Option(None),
+    no_index: bool = typer.Option(False, "--no-index"),
+    no_cache: bool = typer.Option(False, "--no-cache"),
+    write_mode: WriteMode = typer.Option(WriteMode.dump),
+    jobs: int = typer.Option(1, min=0),
+    file: str = typer.Option("nautikos-plan.json", help="Where to write the plan"),
+    resolve_kustomize: bool = typer.Option(False, "--resolve-kustomize"),
+    loader: Loader = typer.Option(Loader.auto, help="Loader for finding images"),
+):
+    """Writes the edits an update would make to a plan file, to apply later"""
+    from .plan import write_plan
+
+    tags, target = get_tags(repository, tag, batch)
+    nautikos = get_nautikos()
+    nautikos.set_use_index(not no_index)
+    nautikos.set_use_cache(not no_cache)
+    nautikos.set_write_mode(write_mode.value)
+    nautikos.set_jobs(jobs)
+    nautikos.set_resolve_kustomize(resolve_kustomize)
+    set_loader(nautikos, loader)
+    nautikos.load_config(config)
+    label_list = labels.split(",") if labels else None
+    planned = nautikos.make_plan(tags, target, environment=env, labels=label_list)
+    write_plan(file, planned)
     for mod in nautikos.modifications:
         print(mod)
-        if mod.updated:
-            count_updated_img += 1
+    for error in nautikos.errors:
+        print(error)
+    print(nautikos.stats)
+    summary = nautikos.modifications.summary
+    exit_msg, exit_code = exit_status(
+        summary.total.found, summary.total.updated, len(nautikos.errors), target
+    )
+    print(f"Wrote a plan for {len(planned.manifests)} manifest(s) to '{file}'")
+    if exit_code:
+        print(exit_msg)
+    sys.exit(exit_code)
 
-    # Determine output
-    if len(nautikos.modifications) == 0:
-        exit_msg = "ERROR - Didn't find any images to modify"
-        exit_code = 1
+
+@app.command()
+def apply(
+    file: str = typer.Argument(..., help="Plan written by 'nautikos plan'"),
+    config: str = typer.Option(None, help="Config, if not the one of the plan"),
+    fsync: bool = typer.Option(False, "--fsync"),
+):
+    """Applies a plan, refusing manifests that changed since it was made"""
+    from .plan import apply_plan, read_plan
+
+    try:
+        planned = read_plan(file)
+    except Exception as e:
+        raise typer.BadParameter(str(e), param_hint="'FILE'")
+    workdir = (os.path.dirname(config) or ".") if config else planned.workdir
+    modifications, errors = apply_plan(planned, workdir, fsync=fsync)
+    for mod in modifications:
+        print(mod)
+    for error in errors:
+        print(error)
+    total = len(planned.manifests)
+    applied = total - len(errors)
+    print(f"Applied {applied} out of {total} manifest(s) updating {planned.target}")
+    if errors:
+        print(f"ERROR - Failed to apply {len(errors)} manifest(s)")
+    sys.exit(1 if errors else 0)
+
+
+@app.command("merge-results")
+def merge_results_command(
+    files: list[str] = typer.Argument(..., help="Result files of all shards"),
+    output: OutputFormat = typer.Option(OutputFormat.text),
+):
+    """Combines the result files of a sharded update into its summary and exit code"""
+    from .results import merge_results, read_results
+
+    try:
+        results = merge_results([read_results(path) for path in files])
+    except Exception as e:
+        raise typer.BadParameter(str(e), param_hint="'FILES...'")
+    found = results.summary.total.found
+    updated = results.summary.total.updated
+    failed = len(results.errors)
+    exit_msg, exit_code = exit_status(found, updated, failed, results.target)
+    summary: dict[str, Any] = {
+        "found": found,
+        "updated": updated,
+        "failed": failed,
+        "stats": {**asdict(results.stats), "skipped": results.stats.skipped},
+        **results.summary.to_dict(),
+        "message": exit_msg,
+    }
+    if output == OutputFormat.text:
+        for mod in results.modifications:
+            print(mod)
+        for error in results.errors:
+            print(error)
+        print(results.stats)
+        print(exit_msg)
+        if failed:
+            print(f"ERROR - Failed to process {failed} manifest(s)")
+    elif output == OutputFormat.ndjson:
+        for mod in results.modifications:
+            print_event("modification", mod.to_dict())
+        for error in results.errors:
+            print_event("error", error.to_dict())
+        print_event("summary", summary)
     else:
-        exit_msg = f"Updated {count_updated_img} out of {len(nautikos.modifications)} discovered occurences of '{repository}' to '{tag}'"  # noqa: E501
-        exit_code = 0
-    print(exit_msg)
+        data = {
+            "modifications": [m.to_dict() for m in results.modifications],
+            "errors": [e.to_dict() for e in results.errors],
+            **summary,
+        }
+        print(json.dumps(data))
     sys.exit(exit_code)
+
+
+class StatusFormat(str, Enum):
+    table = "table"
+    json = "json"
+
+
+@app.command()
+def status(
+    repository: str = typer.Argument(None),
+    env: str = typer.Option(None),
+    labels: str = typer.Option(None),
+    config: str = typer.Option("nautikos.yaml"),
+    no_index: bool = typer.Option(False, "--no-index"),
+    no_cache: bool = typer.Option(False, "--no-cache"),
+    output: StatusFormat = typer.Option(StatusFormat.table),
+    loader: Loader = typer.Option(Loader.auto, help="Loader for finding images"),
+):
+    """Shows the current tags of images, per environment and manifest"""
+    from .status import format_table
+
+    nautikos = get_nautikos()
+    nautikos.set_use_index(not no_index)
+    nautikos.set_use_cache(not no_cache)
+    set_loader(nautikos, loader)
+    nautikos.load_config(config)
+    label_list = labels.split(",") if labels else None
+    images = nautikos.get_status(repository, environment=env, labels=label_list)
+    if output == StatusFormat.json:
+        data = {
+            "images": [image.to_dict() for image in images],
+            "errors": [error.to_dict() for error in nautikos.errors],
+        }
+        print(json.dumps(data))
+    else:
+        if images:
+            print(format_table(images))
+        for error in nautikos.errors:
+            print(error)
+        if repository and not images:
+            print(f"ERROR - Didn't find any images of '{repository}'")
+    sys.exit(1 if nautikos.errors or (repository and not images) else 0)
+
+
+@app.command()
+def serve(
+    config: str = typer.Option("nautikos.yaml"),
+    host: str = typer.Option("127.0.0.1"),
+    port: int = typer.Option(8080),
+    socket: str = typer.Option(None),
+    write_mode: WriteMode = typer.Option(WriteMode.dump),
+    window: float = typer.Option(0.05, min=0),
+):
+    """Serves update requests over HTTP, keeping config and manifests in memory"""
+    from .server import Updater, make_server
+
+    updater = Updater(config, write_mode=write_mode.value, window=window)
+    try:
+        server = make_server(updater, host=host, port=port, socket=socket)
+    except FileExistsError as e:
+        raise typer.BadParameter(str(e), param_hint="'--socket'")
+    print(f"Serving on {socket or f'http://{host}:{port}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        ...
+    finally:
+        server.server_close()
@@ -0,0 +1,124 @@
+import pathlib
+from typing import Any, TypedDict, Union
+
+from .cache import cache_path, content_hash, read_json, stat_key, write_json
+from .yaml import get_safe_yaml
+
+CONFIG_CACHE_VERSION = 2
+MANIFEST_TYPES = ("kubernetes", "kustomize", "helm")
+# Type of discovered manifests that is detected from their contents
+AUTO_TYPE = "auto"
+
+
+class ManifestConfig(TypedDict):
+    path: str
+    type: str
+    labels: list[str]
+    repositories: list[str]
+    # Patterns of files and directories to leave out when discovering manifests
+    ignore: list[str]
+
+
+class EnvironmentConfig(TypedDict):
+    name: str
+    manifests: list[ManifestConfig]
+
+
+class ConfigData(TypedDict):
+    environments: list[EnvironmentConfig]
+
+
+def read_config(path: Union[str, pathlib.Path], use_cache: bool = True) -> ConfigData:
+    """Reads and validates a config file
+
+    The validated config is cached as JSON in the cache directory next to the config
+    file. The cache is used as long as the modification time and size of the config
+    file, or otherwise its content hash, are unchanged.
+    """
+    path = pathlib.Path(path)
+    cache_file = cache_path(path.parent, f"config.{path.name}.json")
+    mtime_ns, size = stat_key(path)
+    cached = read_json(cache_file) if use_cache else None
+    if (
+        isinstance(cached, dict)
+        and cached.get("version") == CONFIG_CACHE_VERSION
+        and (cached["mtime_ns"], cached["size"]) == (mtime_ns, size)
+    ):
+        return cached["config"]
+
+    with open(path, "rb") as f:
+        raw = f.read()
+    sha256 = content_hash(raw)
+    if (
+        isinstance(cached, dict)
+        and cached.get("version") == CONFIG_CACHE_VERSION
+        and cached["sha256"] == sha256
+    ):
+        config = cached["config"]
+    else:
+        config = compile_config(get_safe_yaml().load(raw), str(path))
+    if use_cache:
+        write_json(
+            cache_file,
+            {
+                "version": CONFIG_CACHE_VERSION,
+                "mtime_ns": mtime_ns,
+                "size": size,
+                "sha256": sha256,
+                "config": config,
+            },
+        )
+    return config
+
+
+def compile_config(data: Any, source: str = "config") -> ConfigData:
+    """Validates the structure of a loaded config, and converts it to plain types"""
+    if not isinstance(data, dict) or not isinstance(data.get("environments"), list):
+        raise Exception(f"{source}: expected a list of 'environments'")
+    environments: list[EnvironmentConfig] = []
+    for i, env in enumerate(data["environments"]):
+        where = f"{source}: environments[{i}]"
+        if not isinstance(env, dict) or "name" not in env:
+            raise Exception(f"{where} should have a 'name'")
+        manifests: list[ManifestConfig] = []
+        for j, manifest in enumerate(env.get("manifests") or []):
+            manifests.append(_compile_manifest(manifest, f"{where}.manifests[{j}]"))
+        environments.append({"name": str(env["name"]), "manifests": manifests})
+    return {"environments": environments}
+
+
+def is_pattern(path: str) -> bool:
+    """Checks whether a manifest path is a glob pattern, rather than a single file"""
+    return any(char in path for char in "*?[")
+
+
+def _compile_manifest(manifest: Any, where: str) -> ManifestConfig:
+    if not isinstance(manifest, dict):
+        raise Exception(f"{where} should be a mapping")
+    if "path" in manifest and "dir" in manifest:
+        raise Exception(f"{where} should have either a 'path' or a 'dir'")
+    if "dir" in manifest:
+        # All manifests in a directory tree
+        directory = str(manifest["dir"]).strip("/")
+        path = f"{directory}/**" if directory not in ("", ".") else "**"
+    elif "path" in manifest:
+        path = str(manifest["path"])
+    else:
+        raise Exception(f"{where} should have a 'path'")
+    type = manifest.get("type", AUTO_TYPE if is_pattern(path) else None)
+    if type is None:
+        raise Exception(f"{where} should have a 'type'")
+    if type == AUTO_TYPE and not is_pattern(path):
+        raise Exception(
+            f"{where}: type '{AUTO_TYPE}' needs a 'dir' or a glob pattern as 'path'"
+        )
+    if type not in MANIFEST_TYPES and type != AUTO_TYPE:
+        raise Exception(f"{where}: '{type}' is not a correct manifest type.")
+    compiled: ManifestConfig = {
+        "path": path,
+        "type": type,
+        "labels": [str(label) for label in manifest.get("labels") or []],
+        "repositories": [str(repo) for repo in manifest.get("repositories") or []],
+        "ignore": [str(pattern) for pattern in manifest.get("ignore") or []],
+    }
+    return compiled
@@ -0,0 +1,249 @@
+import os
+import pathlib
+import re
+from typing import TypedDict, Union
+
+from .cache import cache_path, read_json, stat_key, write_json
+from .config import AUTO_TYPE, EnvironmentConfig, ManifestConfig, is_pattern
+
+DISCOVERY_FILE = "discovery.json"
+DISCOVERY_VERSION = 1
+MANIFEST_EXTENSIONS = (".yaml", ".yml")
+KUSTOMIZATION_FILES = ("kustomization.yaml", "kustomization.yml", "Kustomization")
+
+_KUSTOMIZATION_KIND = re.compile(rb"^kind:[ \t]*Kustomization\b", re.MULTILINE)
+_CONTAINERS = re.compile(rb"^[ \t-]*(init|ephemeral)?[cC]ontainers:", re.MULTILINE)
+
+
+class DirectoryEntry(TypedDict):
+    mtime_ns: int
+    files: list[str]
+    dirs: list[str]
+
+
+class TypeEntry(TypedDict):
+    mtime_ns: int
+    size: int
+    type: Union[str, None]
+
+
+def compile_pattern(pattern: str) -> "re.Pattern[str]":
+    """Translates a glob pattern to a regex that matches paths relative to the workdir
+
+    '*' and '?' don't match across directories; '**' matches any number of them.
+    """
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            chars = pattern[i + 1 : end]
+            if chars.startswith("!"):
+                chars = "^" + chars[1:]
+            regex += "[" + chars.replace("\\", "\\\\") + "]"
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    return re.compile(regex + r"\Z")
+
+
+def detect_type(name: str, raw: bytes) -> Union[str, None]:
+    """Detects the type of a manifest from its file name and raw contents
+
+    Returns None for files that don't contain images nautikos can update.
+    """
+    if name in KUSTOMIZATION_FILES or _KUSTOMIZATION_KIND.search(raw):
+        return "kustomize"
+    if _CONTAINERS.search(raw):
+        return "kubernetes"
+    return None
+
+
+class Discovery:
+    """Expands glob patterns and directories in the config to manifest files
+
+    Directory listings are cached, and only read again when the modification time of
+    the directory changes. Detected types are cached per file, and revalidated with
+    its modification time and size. Hidden files and directories are never included.
+    """
+
+    def __init__(self, workdir: Union[str, pathlib.Path]) -> None:
+        self._workdir = pathlib.Path(workdir)
+        self._path = cache_path(workdir, DISCOVERY_FILE)
+        self._dirs: dict[str, DirectoryEntry] = {}
+        self._types: dict[str, TypeEntry] = {}
+        self._dirty = False
+
+    def load(self) -> None:
+        data = read_json(self._path)
+        if isinstance(data, dict) and data.get("version") == DISCOVERY_VERSION:
+            self._dirs, self._types = data["dirs"], data["types"]
+        else:
+            self._dirs, self._types = {}, {}
+        self._dirty = False
+
+    def save(self) -> None:
+        if self._dirty:
+            data = {
+                "version": DISCOVERY_VERSION,
+                "dirs": self._dirs,
+                "types": self._types,
+            }
+            write_json(self._path, data)
+            self._dirty = False
+
+    def expand(self, environments: list[EnvironmentConfig]) -> list[EnvironmentConfig]:
+        """Replaces manifests with patterns by the manifests they match
+
+        Discovered manifests get the labels and repositories of their pattern. Files
+        are only included once per environment, in the position they were first found.
+        """
+        expanded: list[EnvironmentConfig] = []
+        for env in environments:
+            manifests: list[ManifestConfig] = []
+            seen: set[str] = set()
+            for manifest in env["manifests"]:
+                for discovered in self.discover(manifest):
+                    if discovered["path"] not in seen:
+                        seen.add(discovered["path"])
+                        manifests.append(discovered)
+            expanded.append({"name": env["name"], "manifests": manifests})
+        return expanded
+
+    def discover(self, manifest: ManifestConfig) -> list[ManifestConfig]:
+        if not is_pattern(manifest["path"]):
+            return [manifest]
+        pattern = compile_pattern(manifest["path"])
+        ignore = [compile_pattern(p) for p in manifest["ignore"]]
+        discovered: list[ManifestConfig] = []
+        for path in self._walk(_base_dir(manifest["path"]), ignore):
+            if not pattern.match(path):
+                continue
+            type = manifest["type"]
+            if type == AUTO_TYPE:
+                detected = self._detect_type(path)
+                if detected is None:
+                    continue
+                type = detected
+            discovered.append(
+                {
+                    "path": path,
+                    "type": type,
+                    "labels": manifest["labels"],
+                    "repositories": manifest["repositories"],
+                    "ignore": manifest["ignore"],
+                }
+            )
+        return discovered
+
+    def _walk(self, base: str, ignore: list["re.Pattern[str]"]) -> list[str]:
+        """Returns the manifest files below a directory, sorted, relative to workdir"""
+        paths: list[str] = []
+        stack = [base]
+        while stack:
+            directory = stack.pop()
+            listing = self._list(directory)
+            if listing is None:
+                continue
+            prefix = f"{directory}/" if directory else ""
+            for name in listing["files"]:
+                path = prefix + name
+                if not any(p.match(path) for p in ignore):
+                    paths.append(path)
+            for name in listing["dirs"]:
+                path = prefix + name
+                if not any(p.match(path) for p in ignore):
+                    stack.append(path)
+        return sorted(paths)
+
+    def _list(self, directory: str) -> Union[DirectoryEntry, None]:
+        full = self._workdir / directory
+        try:
+            mtime_ns = os.stat(full).st_mtime_ns
+        except OSError:
+            return None
+        cached = self._dirs.get(directory)
+        if cached is not None and cached["mtime_ns"] == mtime_ns:
+            return cached
+        entry: DirectoryEntry = {"mtime_ns": mtime_ns, "files": [], "dirs": []}
+        try:
+            with os.scandir(full) as entries:
+                for dir_entry in entries:
+                    if dir_entry.name.startswith("."):
+                        continue
+                    if dir_entry.is_dir(follow_symlinks=False):
+                        entry["dirs"].append(dir_entry.name)
+                    elif dir_entry.name.endswith(MANIFEST_EXTENSIONS) or (
+                        dir_entry.name in KUSTOMIZATION_FILES
+                    ):
+                        entry["files"].append(dir_entry.name)
+        except OSError:
+            return None
+        entry["files"].sort()
+        entry["dirs"].sort()
+        self._dirs[directory] = entry
+        self._dirty = True
+        return entry
+
+    def _detect_type(self, path: str) -> Union[str, None]:
+        full = self._workdir / path
+        try:
+            mtime_ns, size = stat_key(full)
+            cached = self._types.get(path)
+            if cached is not None and (cached["mtime_ns"], cached["size"]) == (
+                mtime_ns,
+                size,
+            ):
+                return cached["type"]
+            with open(full, "rb") as f:
+                raw = f.read()
+        except OSError:
+            return None
+        type = detect_type(pathlib.PurePosixPath(path).name, raw)
+        self._types[path] = {"mtime_ns": mtime_ns, "size": size, "type": type}
+        self._dirty = True
+        return type
+
+
+def _base_dir(pattern: str) -> str:
+    """Directory below which all matches of a pattern are, relative to the workdir"""
+    parts: list[str] = []
+    for part in pattern.split("/")[:-1]:
+        if is_pattern(part):
+            break
+        parts.append(part)
+    return "/".join(parts)
+
+
+def discover_manifests(
+    workdir: Union[str, pathlib.Path],
+    environments: list[EnvironmentConfig],
+    use_cache: bool = True,
+) -> list[EnvironmentConfig]:
+    """Expands the patterns in the config, if there are any"""
+    if not any(
+        is_pattern(manifest["path"])
+        for env in environments
+        for manifest in env["manifests"]
+    ):
+        return environments
+    discovery = Discovery(workdir)
+    if use_cache:
+        discovery.load()
+    expanded = discovery.expand(environments)
+    if use_cache:
+        discovery.save()
+    return expanded
@@ -0,0 +1,79 @@
+import pathlib
+from typing import TypedDict, Union
+
+from .cache import cache_path, content_hash, read_json, stat_key, write_json
+from .manifests import Image
+
+INDEX_FILE = "index.json"
+INDEX_VERSION = 5
+
+
+class IndexEntry(TypedDict):
+    type: str
+    mtime_ns: int
+    size: int
+    sha256: str
+    images: list[Image]
+
+
+class ManifestIndex:
+    """On-disk index of the images contained in each manifest
+
+    Entries are keyed by the manifest path as written in the config, and are
+    validated against the modification time and size of the file. If those changed,
+    the content hash decides whether the entry can still be used.
+    """
+
+    def __init__(self, workdir: Union[str, pathlib.Path]) -> None:
+        self._workdir = pathlib.Path(workdir)
+        self._path = cache_path(workdir, INDEX_FILE)
+        self._entries: dict[str, IndexEntry] = {}
+        self._dirty = False
+
+    def load(self) -> None:
+        data = read_json(self._path)
+        if isinstance(data, dict) and data.get("version") == INDEX_VERSION:
+            self._entries = data["entries"]
+        else:
+            self._entries = {}
+        self._dirty = False
+
+    def save(self) -> None:
+        if self._dirty:
+            write_json(self._path, {"version": INDEX_VERSION, "entries": self._entries})
+            self._dirty = False
+
+    def lookup(self, path: str, type: str) -> Union[list[Image], None]:
+        """Returns the images in a manifest, or None if the entry is missing or stale"""
+        entry = self._entries.get(path)
+        if entry is None or entry["type"] != type:
+            return None
+        try:
+            mtime_ns, size = stat_key(self._workdir / path)
+            if (mtime_ns, size) == (entry["mtime_ns"], entry["size"]):
+                return entry["images"]
+            if size != entry["size"]:
+                return None
+            with open(self._workdir / path, "rb") as f:
+                sha256 = content_hash(f.read())
+        except OSError:
+            return None
+        if sha256 != entry["sha256"]:
+            return None
+        entry["mtime_ns"] = mtime_ns
+        self._dirty = True
+        return entry["images"]
+
+    def update(self, path: str, type: str, images: list[Image]) -> None:
+        """Records the images currently contained in a manifest"""
+        mtime_ns, size = stat_key(self._workdir / path)
+        with open(self._workdir / path, "rb") as f:
+            sha256 = content_hash(f.read())
+        self._entries[path] = {
+            "type": type,
+            "mtime_ns": mtime_ns,
+            "size": size,
+            "sha256": sha256,
+            "images": images,
+        }
+        self._dirty = True
@@ -0,0 +1,174 @@
+import os
+import posixpath
+from dataclasses import dataclass, field
+from typing import Any, Union
+
+from .config import ManifestConfig
+from .discovery import KUSTOMIZATION_FILES
+from .locators import KUSTOMIZATION_KIND, find_image_holders, get_kustomize_names
+from .yaml import load_text
+
+# Fields of a kustomization that refer to other kustomizations or to resources
+RESOURCE_FIELDS = ("resources", "bases", "components")
+# Fields that refer to patch files, which may set images too
+PATCH_FIELDS = ("patches", "patchesStrategicMerge", "patchesJson6902")
+
+
+@dataclass
+class Kustomization:
+    """The parts of a kustomization file that matter for locating images"""
+
+    path: str
+    # Repositories in the 'images' field, as matched by KustomizeManifest
+    repositories: set[str] = field(default_factory=set)
+    # Kustomization files of the referenced directories
+    kustomizations: list[str] = field(default_factory=list)
+    # Referenced resource and patch files
+    files: list[str] = field(default_factory=list)
+
+
+class KustomizeGraph:
+    """Graph of kustomizations and the bases, components and files they refer to
+
+    Paths are relative to the workdir. Every kustomization is read and parsed at most
+    once, however many overlays refer to it, and so is the traversal from it for a
+    set of repositories. Remote resources are ignored.
+    """
+
+    def __init__(self, workdir: Union[str, os.PathLike], loader: str = "auto") -> None:
+        self._workdir = os.fspath(workdir)
+        self._loader = loader
+        self._nodes: dict[str, Kustomization] = {}
+        self._located: dict[tuple[str, frozenset[str]], dict[str, set[str]]] = {}
+
+    def __contains__(self, path: str) -> bool:
+        """Checks whether a kustomization was loaded"""
+        return path in self._nodes
+
+    def get(self, path: str) -> Kustomization:
+        node = self._nodes.get(path)
+        if node is None:
+            with open(os.path.join(self._workdir, path), "rb") as f:
+                documents = load_text(f.read(), self._loader)
+            data = documents[0] if documents else None
+            node = self._parse(path, data if isinstance(data, dict) else {})
+            self._nodes[path] = node
+        return node
+
+    def locate(self, path: str, repositories: set[str]) -> dict[str, set[str]]:
+        """Returns the files that declare the images of repositories, from path
+
+        An image in the 'images' of a kustomization overrides the ones below it, so
+        the search for a repository stops at the first kustomization that has it.
+        Otherwise, it continues in the resource and patch files, and in the bases.
+        Files are mapped to the repositories they may declare. Raises if the
+        kustomizations refer to each other in a cycle.
+        """
+        return self._locate(path, frozenset(repositories), ())
+
+    def _locate(
+        self, path: str, repositories: frozenset[str], chain: tuple[str, ...]
+    ) -> dict[str, set[str]]:
+        if path in chain:
+            cycle = " -> ".join((*chain[chain.index(path) :], path))
+            raise Exception(f"kustomizations refer to each other in a cycle: {cycle}")
+        key = (path, repositories)
+        if key in self._located:
+            return self._located[key]
+        node = self.get(path)
+        located: dict[str, set[str]] = {}
+        declared = repositories & node.repositories
+        if declared:
+            located[path] = set(declared)
+        remaining = repositories - declared
+        if remaining:
+            for file in node.files:
+                located.setdefault(file, set()).update(remaining)
+            for child in node.kustomizations:
+                for file, repos in self._locate(
+                    child, remaining, (*chain, path)
+                ).items():
+                    located.setdefault(file, set()).update(repos)
+        self._located[key] = located
+        return located
+
+    def _parse(self, path: str, data: dict[str, Any]) -> Kustomization:
+        node = Kustomization(path)
+        for holder in find_image_holders(data, default_kind=KUSTOMIZATION_KIND):
+            if "name" in holder:
+                node.repositories.update(get_kustomize_names(holder))
+        directory = posixpath.dirname(path)
+        for key in RESOURCE_FIELDS:
+            for reference in _list(data.get(key)):
+                if isinstance(reference, str) and not _is_remote(reference):
+                    self._add_reference(node, posixpath.join(directory, reference))
+        for key in PATCH_FIELDS:
+            for patch in _list(data.get(key)):
+                reference = patch.get("path") if isinstance(patch, dict) else patch
+                # Inline patches are strings with line breaks
+                if isinstance(reference, str) and "\n" not in reference:
+                    file = posixpath.normpath(posixpath.join(directory, reference))
+                    if file not in node.files:
+                        node.files.append(file)
+        return node
+
+    def _add_reference(self, node: Kustomization, reference: str) -> None:
+        reference = posixpath.normpath(reference)
+        full = os.path.join(self._workdir, reference)
+        if os.path.isdir(full):
+            for name in KUSTOMIZATION_FILES:
+                if os.path.isfile(os.path.join(full, name)):
+                    node.kustomizations.append(posixpath.join(reference, name))
+                    break
+        elif posixpath.basename(reference) in KUSTOMIZATION_FILES:
+            node.kustomizations.append(reference)
+        elif os.path.isfile(full):
+            node.files.append(reference)
+
+
+def _list(value: Any) -> list[Any]:
+    return value if isinstance(value, list) else []
+
+
+def _is_remote(reference: str) -> bool:
+    return "://" in reference or reference.startswith(("git@", "github.com/"))
+
+
+def resolve_kustomizations(
+    graph: KustomizeGraph, manifests: list[ManifestConfig], tags: dict[str, str]
+) -> tuple[list[ManifestConfig], dict[str, dict[str, str]], list[tuple[str, str]]]:
+    """Replaces kustomize manifests by the files that declare the images to update
+
+    Returns the manifests, the tags to update in each of them, and the kustomize
+    manifests that couldn't be resolved, with the reason. Other manifests are kept as
+    they are. Resolved files get the labels of the manifest they were found from, and
+    are only included once, in the position they were first found.
+    """
+    resolved: dict[str, ManifestConfig] = {}
+    file_tags: dict[str, dict[str, str]] = {}
+    errors: list[tuple[str, str]] = []
+    for manifest in manifests:
+        if manifest["type"] != "kustomize":
+            resolved.setdefault(manifest["path"], manifest)
+            file_tags.setdefault(manifest["path"], {}).update(tags)
+            continue
+        try:
+            located = graph.locate(posixpath.normpath(manifest["path"]), set(tags))
+        except Exception as e:
+            errors.append((manifest["path"], str(e) or type(e).__name__))
+            continue
+        for path, repositories in located.items():
+            resolved.setdefault(
+                path,
+                {
+                    "path": path,
+                    "type": "kustomize" if path in graph else "kubernetes",
+                    "labels": manifest["labels"],
+                    "repositories": manifest["repositories"],
+                    "ignore": manifest["ignore"],
+                },
+            )
+            file_tags.setdefault(path, {}).update(
+                {repository: tags[repository] for repository in repositories}
+            )
+    return list(resolved.values()), file_tags, errors
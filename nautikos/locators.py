@@ -0,0 +1,98 @@
+from typing import Any, Union
+
+# Lists of containers in a pod spec, in the order Kubernetes starts them
+CONTAINER_KEYS = ("initContainers", "containers", "ephemeralContainers")
+
+# Path from the root of a resource to its pod spec, per kind
+POD_SPEC_PATHS: dict[str, tuple[str, ...]] = {
+    "Pod": ("spec",),
+    "PodTemplate": ("template", "spec"),
+    "Deployment": ("spec", "template", "spec"),
+    "StatefulSet": ("spec", "template", "spec"),
+    "DaemonSet": ("spec", "template", "spec"),
+    "ReplicaSet": ("spec", "template", "spec"),
+    "ReplicationController": ("spec", "template", "spec"),
+    "Job": ("spec", "template", "spec"),
+    "CronJob": ("spec", "jobTemplate", "spec", "template", "spec"),
+}
+
+# Kind of documents in kustomize manifests, which don't always specify it
+KUSTOMIZATION_KIND = "Kustomization"
+KUSTOMIZE_KINDS = (KUSTOMIZATION_KIND, "Component")
+
+# Maximum depth of the tree walk for kinds without a known path
+MAX_WALK_DEPTH = 8
+
+# Path to a list of image holders, and the key each holder must have
+Locator = tuple[tuple[str, ...], str]
+
+
+def _compile_locators() -> dict[str, tuple[Locator, ...]]:
+    """Locators of the image holders, per kind"""
+    locators = {
+        kind: tuple(((*pod_spec, key), "image") for key in CONTAINER_KEYS)
+        for kind, pod_spec in POD_SPEC_PATHS.items()
+    }
+    for kind in KUSTOMIZE_KINDS:
+        locators[kind] = ((("images",), "name"),)
+    return locators
+
+
+LOCATORS = _compile_locators()
+
+
+def find_image_holders(data: Any, default_kind: Union[str, None] = None) -> list[Any]:
+    """Returns the mappings that hold images in a document
+
+    These are containers (with an 'image'), or kustomize image entries (with a
+    'name'). Known kinds are looked up along their precompiled paths; List kinds are
+    searched item by item. For other kinds, the containers are found with a single
+    walk of the document tree, bounded in depth.
+    """
+    if not isinstance(data, dict):
+        return []
+    kind = data.get("kind") or default_kind
+    if isinstance(kind, str) and kind.endswith("List"):
+        holders: list[Any] = []
+        for item in data.get("items") or []:
+            holders += find_image_holders(item, default_kind)
+        return holders
+    locator = LOCATORS.get(kind) if isinstance(kind, str) else None
+    if locator is None:
+        holders = []
+        _walk(data, MAX_WALK_DEPTH, holders)
+        return holders
+    holders = []
+    for path, required in locator:
+        node: Any = data
+        for key in path:
+            node = node.get(key) if isinstance(node, dict) else None
+        if isinstance(node, list):
+            holders += [h for h in node if isinstance(h, dict) and required in h]
+    return holders
+
+
+def get_kustomize_names(holder: Any) -> list[str]:
+    """Returns the repositories a kustomize image entry matches
+
+    An image renamed with 'newName' matches both its new and its original name, so it
+    is listed under both.
+    """
+    names = [str(holder["newName"])] if holder.get("newName") else []
+    if str(holder["name"]) not in names:
+        names.append(str(holder["name"]))
+    return names
+
+
+def _walk(node: Any, depth: int, holders: list[Any]) -> None:
+    if depth == 0:
+        return
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key in CONTAINER_KEYS and isinstance(value, list):
+                holders += [h for h in value if isinstance(h, dict) and "image" in h]
+            else:
+                _walk(value, depth - 1, holders)
+    elif isinstance(node, list):
+        for item in node:
+            _walk(item, depth - 1, holders)
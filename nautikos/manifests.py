@@ -1,18 +1,38 @@
 import abc
+import io
 import pathlib
-from dataclasses import dataclass
-from typing import Any, TypedDict, Union
+import re
+from dataclasses import dataclass, replace
+from typing import Any, Iterable, TypedDict, Union
 
-from .yaml import yaml
+from .locators import KUSTOMIZATION_KIND, find_image_holders, get_kustomize_names
+from .patch import Edit, Splice, locate_all, patch
+from .references import Reference, is_digest, parse_reference
+from .yaml import get_yaml, is_plain, is_textual, load_text
 
+WRITE_MODES = ("dump", "patch")
+
+
+class _ImageOptions(TypedDict, total=False):
+    alias: bool
+
+
+class Image(_ImageOptions):
+    """An image in a manifest
+
+    An alias is another name of the image before it, like the original name of a
+    renamed kustomize image; an update modifies only the first name it matches.
+    """
 
-class Image(TypedDict):
     repository: str
     tag: Union[str, None]
 
 
 @dataclass
 class Modification:
+    # Runs can have many of these, so they have no instance dict
+    __slots__ = ("path", "repository", "previous", "new")
+
     path: str
     repository: str
     previous: str
@@ -22,6 +42,15 @@ class Modification:
     def updated(self) -> bool:
         return self.previous != self.new
 
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "path": self.path,
+            "repository": self.repository,
+            "previous": self.previous,
+            "new": self.new,
+            "updated": self.updated,
+        }
+
     def __str__(self) -> str:
         if self.updated:
             return f"{self.path} -> modified '{self.repository}' to '{self.new}' (was '{self.previous}')"  # noqa: E501
@@ -29,29 +58,237 @@ class Modification:
             return f"{self.path} -> '{self.repository}' already up-to-date"
 
 
+# Start of a document: '---' at the beginning of a line, followed by a space or break
+_DOCUMENT_START = re.compile(r"^---(?=[ \t\r\n]|$)", re.MULTILINE)
+_HEADER = re.compile(r"---[ \t]*(#[^\r\n]*)?(\r\n|\r|\n|$)")
+# End of a document: '...' at the beginning of a line
+_DOCUMENT_END = re.compile(r"^\.\.\.(?=[ \t\r\n]|$)", re.MULTILINE)
+# Merge keys and explicit tags, which loading as text ignores
+_NOT_TEXT = re.compile(rb"<<|(?:^|[\s\[{,])!", re.MULTILINE)
+
+
+class Document:
+    """A single YAML document in a manifest file
+
+    The header holds the '---' marker that precedes the document, if any. Documents
+    are only parsed when needed; `images` is a snapshot of the images in the body.
+    """
+
+    def __init__(self, header: str, body: str) -> None:
+        self.header = header
+        self.body = body
+        self.data: Any = None
+        self.parsed = False
+        self.images: Union[list[Image], None] = None
+        self.edits: list[Edit] = []
+
+
+def split_documents(text: str) -> list[Document]:
+    """Splits a YAML stream into documents, without parsing them
+
+    Joining the headers and bodies of the documents results in the original text.
+    """
+    starts = [match.start() for match in _DOCUMENT_START.finditer(text)]
+    documents: list[Document] = []
+    if not starts or starts[0] > 0:
+        documents.append(Document("", text[: starts[0] if starts else len(text)]))
+    for start, end in zip(starts, [*starts[1:], len(text)]):
+        header = _HEADER.match(text, start, end)
+        split = header.end() if header else start + 3
+        documents.append(Document(text[start:split], text[split:end]))
+    return documents
+
+
 class AbstractManifest(abc.ABC):
-    def __init__(self, path: Union[str, pathlib.Path]) -> None:
+    def __init__(
+        self,
+        path: Union[str, pathlib.Path],
+        keep_parsed: bool = False,
+        raw: Union[bytes, None] = None,
+    ) -> None:
         self._path = path
+        self._keep_parsed = keep_parsed
+        # Contents of the file, if they were already read
+        self._raw = raw
+        self._documents: Union[list[Document], None] = None
         self._modifications: list[Modification] = []
 
+    @property
+    def path(self) -> Union[str, pathlib.Path]:
+        return self._path
+
     @property
     def modifications(self) -> list[Modification]:
         return self._modifications
 
+    def clear_modifications(self) -> None:
+        self._modifications = []
+
+    def read(self) -> bytes:
+        """Returns the raw contents of the manifest, reading the file only once"""
+        if self._raw is None:
+            with open(self._path, "rb") as f:
+                self._raw = f.read()
+        return self._raw
+
+    def prefilter(self, repositories: Iterable[str]) -> bool:
+        """Checks whether any of the repositories might occur in the manifest
+
+        This only searches the raw bytes, so it may give false positives, but never
+        false negatives: if it returns False, there is no need to parse the file.
+        """
+        raw = self.read()
+        return any(repository.encode() in raw for repository in repositories)
+
     def load(self) -> None:
-        with open(self._path, "r") as f:
-            self._data = yaml.load(f)
+        """Splits the manifest into documents; these are parsed one at a time later"""
+        self._documents = split_documents(self.read().decode())
+
+    def write(self, mode: str = "dump", fsync: bool = False) -> None:
+        """Writes the modified manifest atomically, unless its contents didn't change"""
+        from .writer import write_atomic
+
+        original = self.read()
+        content = self.apply_edits(mode)
+        if content != original:
+            write_atomic(self._path, content, fsync)
+
+    def apply_edits(self, mode: str = "dump") -> bytes:
+        """Renders the modified documents, and returns the new contents of the manifest
+
+        Afterwards the manifest describes the new contents, as if it was loaded from
+        them. The file itself isn't written.
+        """
+        if mode not in WRITE_MODES:
+            raise Exception(f"'{mode}' is not a correct write mode.")
+        for document in self.documents:
+            if document.edits:
+                document.header, document.body = self._render_document(document, mode)
+                document.images = self._get_document_images(document.data)
+                document.edits = []
+        self._raw = "".join(d.header + d.body for d in self.documents).encode()
+        return self._raw
+
+    def get_splices(self, mode: str = "dump") -> list[Splice]:
+        """Returns the pending edits as replacements of byte ranges of the file
 
-    def write(self) -> None:
-        with open(self._path, "w") as f:
-            yaml.dump(self._data, f)
+        `start` and `end` are byte offsets in the file as it was read, and applying
+        the replacements gives the same contents as `write(mode)`. Each modified
+        document is rendered as in `mode`, and the part of it that changed is replaced;
+        in 'patch' mode, the edited scalars are replaced one by one instead, if they
+        can be located. The manifest itself isn't changed.
+        """
+        splices: list[Splice] = []
+        offset = 0
+        for document in self.documents:
+            text = document.header + document.body
+            if document.edits:
+                start = len(document.header)
+                located = None
+                if mode == "patch":
+                    located = locate_all(document.body, document.edits)
+                if located is None:
+                    start = 0
+                    located = [
+                        _diff(text, "".join(self._render_document(document, mode)))
+                    ]
+                for splice in located:
+                    splices.append(
+                        Splice(
+                            offset + len(text[: start + splice.start].encode()),
+                            offset + len(text[: start + splice.end].encode()),
+                            splice.text,
+                        )
+                    )
+            offset += len(text.encode())
+        return sorted(splices, key=lambda splice: splice.start)
+
+    def render(self, mode: str = "dump") -> str:
+        """Returns the new contents of the manifest
+
+        Only documents that were modified are rendered again; all other documents are
+        copied as they are. In 'dump' mode a modified document is serialized again. In
+        'patch' mode only the modified scalars are replaced in the original text, which
+        leaves formatting untouched; if a modified scalar can't be located, the
+        document is dumped instead.
+        """
+        if mode not in WRITE_MODES:
+            raise Exception(f"'{mode}' is not a correct write mode.")
+        return "".join(
+            "".join(self._render_document(document, mode))
+            for document in self.documents
+        )
+
+    def _render_document(self, document: Document, mode: str) -> tuple[str, str]:
+        if not document.edits:
+            return document.header, document.body
+        if mode == "patch":
+            body = patch(document.body, document.edits)
+            if body is not None:
+                return document.header, body
+        stream = io.StringIO()
+        get_yaml().dump(document.data, stream)
+        # Dumped with the line breaks of the document, so a file doesn't mix them
+        newline = "\r\n" if "\r\n" in document.header + document.body else "\n"
+        header = document.header
+        if header and not header.endswith(("\n", "\r")):
+            header += newline
+        # The end marker and what follows it aren't part of the data, so are kept
+        end = _DOCUMENT_END.search(document.body)
+        trailer = document.body[end.start() :] if end else ""
+        return header, stream.getvalue().replace("\n", newline) + trailer
 
     @property
-    def data(self) -> Any:
-        if self._data:
-            return self._data
-        else:
+    def documents(self) -> list[Document]:
+        if self._documents is None:
             raise Exception("You must first load a manifest")
+        return self._documents
+
+    @property
+    def data(self) -> Any:
+        """Data of the first non-empty document"""
+        for document in self.documents:
+            self._parse(document)
+            if document.data is not None:
+                return document.data
+        raise Exception(f"{self._path} doesn't contain any documents")
+
+    def _parse(self, document: Document) -> None:
+        if not document.parsed:
+            document.data = get_yaml().load(document.body)
+            document.parsed = True
+            if document.images is None:
+                document.images = self._get_document_images(document.data)
+
+    def _release(self, document: Document) -> None:
+        """Drops the parsed data of a document, unless it has pending modifications"""
+        if not document.edits and not self._keep_parsed:
+            document.data = None
+            document.parsed = False
+
+    def _set_scalar(
+        self, document: Document, mapping: Any, key: str, value: str
+    ) -> None:
+        """Sets a value in a loaded mapping, and remembers where it is in the source
+
+        A value that is already set isn't recorded, so the document is left as it was.
+        """
+        if mapping.get(key) == value:
+            return
+        try:
+            line, column = mapping.lc.value(key)
+        except (AttributeError, KeyError):
+            # Position unknown; patching will fall back to a full dump
+            line, column = -1, -1
+        document.edits.append(Edit(line, column, str(mapping.get(key, "")), value))
+        mapping[key] = value
+
+    def _delete_key(self, document: Document, mapping: Any, key: str) -> None:
+        """Removes a key from a loaded mapping, if it is there"""
+        if key in mapping:
+            # Deletions can't be patched, so the document will be dumped
+            document.edits.append(Edit(-1, -1, str(mapping[key]), ""))
+            del mapping[key]
 
     def _record_modification(
         self, repository: str, old_tag: Union[str, None], new_tag: str
@@ -66,10 +303,77 @@ class AbstractManifest(abc.ABC):
         )
         self._modifications.append(m)
 
-    @abc.abstractmethod
     def modify(self, repository: str, new_tag: str) -> None:
+        self.modify_batch({repository: new_tag})
+
+    def modify_batch(self, tags: dict[str, str]) -> None:
+        """Modifies the documents that contain any of the repositories
+
+        Documents are parsed one at a time, and only kept in memory if modified, or if
+        the manifest was created with `keep_parsed`.
+        """
+        for document in self.documents:
+            if document.parsed or any(repo in document.body for repo in tags):
+                self._parse(document)
+                if document.data is not None:
+                    self._modify_document(document, tags)
+                self._release(document)
+
+    def get_images(self) -> list[Image]:
+        """Returns the images in the manifest, as it is stored on disk"""
+        images: list[Image] = []
+        for document in self.documents:
+            if document.images is None:
+                self._parse(document)
+                self._release(document)
+            images += document.images or []
+        return images
+
+    def scan(self, loader: str = "auto") -> Union[list[Image], None]:
+        """Returns the images in the manifest, read with a fast loader
+
+        The file is loaded with every scalar as text, which is a lot faster than the
+        round-trip loader. Returns None if the images might not be the ones the
+        round-trip loader reads, for instance if a tag isn't a plain string, or if the
+        file uses merge keys or explicit tags.
+        """
+        raw = self.read()
+        if _NOT_TEXT.search(raw):
+            return None
+        try:
+            documents = load_text(raw, loader)
+        except Exception:
+            return None
+        images: list[Image] = []
+        for data in documents:
+            if not _has_plain_kinds(data) or not self._is_textual(data):
+                return None
+            images += self._get_document_images(data)
+        return images
+
+    def scan_images(self, loader: str = "auto") -> list[Image]:
+        """Returns the images in the manifest, without loading it for modification
+
+        Files the fast loader can't read exactly are loaded as usual instead.
+        """
+        images = self.scan(loader)
+        if images is None:
+            self.load()
+            return self.get_images()
+        return images
+
+    @abc.abstractmethod
+    def _modify_document(self, document: Document, tags: dict[str, str]) -> None:
         ...
 
+    @abc.abstractmethod
+    def _get_document_images(self, data: Any) -> list[Image]:
+        ...
+
+    @abc.abstractmethod
+    def _is_textual(self, data: Any) -> bool:
+        """Checks whether the image values of a document loaded as text are exact"""
+
 
 KubernetesImageDefinition = str
 
@@ -79,58 +383,150 @@ class KubernetesContainer(TypedDict):
 
 
 class KubernetesManifest(AbstractManifest):
-    def modify(self, repository: str, new_tag: str) -> None:
-        for container in self._get_containers():
-            parsed_image = self._parse_image(container["image"])
-            if repository == parsed_image["repository"]:
-                container["image"] = self._unparse_image(
-                    {"repository": repository, "tag": new_tag}
+    def _modify_document(self, document: Document, tags: dict[str, str]) -> None:
+        for container in self._get_containers(document.data):
+            reference = parse_reference(container["image"])
+            repository = reference.repository
+            if repository in tags:
+                new_tag = tags[repository]
+                self._set_scalar(
+                    document,
+                    container,
+                    "image",
+                    self._unparse_image(reference, new_tag),
                 )
-                self._record_modification(repository, parsed_image["tag"], new_tag)
+                self._record_modification(
+                    repository, reference.digest or reference.tag, new_tag
+                )
+
+    def _get_document_images(self, data: Any) -> list[Image]:
+        return [self._parse_image(c["image"]) for c in self._get_containers(data)]
 
-    def _get_containers(self) -> list[KubernetesContainer]:
-        return self.data["spec"]["template"]["spec"]["containers"]
+    def _is_textual(self, data: Any) -> bool:
+        return all(is_plain(c["image"]) for c in self._get_containers(data))
+
+    def _get_containers(self, data: Any) -> list[KubernetesContainer]:
+        # Documents without containers, like services, are part of many bundles
+        return [
+            holder
+            for holder in find_image_holders(data)
+            if isinstance(holder.get("image"), str)
+        ]
 
     def _parse_image(self, image: KubernetesImageDefinition) -> Image:
-        if ":" in image:
-            repository, tag = tuple(image.split(":"))
-        else:
-            repository, tag = image, None
-        return {"repository": repository, "tag": tag}
+        reference = parse_reference(image)
+        return {
+            "repository": reference.repository,
+            "tag": reference.digest or reference.tag,
+        }
 
-    def _unparse_image(self, image: Image) -> str:
-        return f"{image['repository']}:{image['tag']}"
+    def _unparse_image(self, reference: Reference, new_tag: str) -> str:
+        """Sets a new tag or digest; a digest pinning the previous tag is dropped"""
+        if is_digest(new_tag):
+            return str(replace(reference, digest=new_tag))
+        return str(replace(reference, tag=new_tag, digest=None))
 
 
-class KustomizeImageDefinition(TypedDict):
+class KustomizeImageDefinition(TypedDict, total=False):
     name: str
+    newName: str
     newTag: str
+    digest: str
+
+
+KUSTOMIZE_IMAGE_FIELDS = ("name", "newName", "newTag", "digest")
 
 
 class KustomizeManifest(AbstractManifest):
-    def modify(self, repository: str, new_tag: str) -> None:
-        if "images" in self._data:
-            for kustomize_image in self.data["images"]:
-                if repository == kustomize_image["name"]:
-                    old_tag = kustomize_image["newTag"]
-                    kustomize_image["newTag"] = new_tag
-                    self._record_modification(repository, old_tag, new_tag)
+    def _modify_document(self, document: Document, tags: dict[str, str]) -> None:
+        for kustomize_image in self._get_kustomize_images(document.data):
+            tag = self._get_tag(kustomize_image)
+            # The new name takes precedence if both names are updated
+            repository = next(
+                (r for r in get_kustomize_names(kustomize_image) if r in tags), None
+            )
+            if repository is not None:
+                new_tag = tags[repository]
+                # A digest takes precedence over a tag, so only one of them is kept
+                if is_digest(new_tag):
+                    self._set_scalar(document, kustomize_image, "digest", new_tag)
+                    self._delete_key(document, kustomize_image, "newTag")
+                else:
+                    self._set_scalar(document, kustomize_image, "newTag", new_tag)
+                    self._delete_key(document, kustomize_image, "digest")
+                self._record_modification(repository, tag, new_tag)
+
+    def _get_document_images(self, data: Any) -> list[Image]:
+        images: list[Image] = []
+        for kustomize_image in self._get_kustomize_images(data):
+            tag = self._get_tag(kustomize_image)
+            for i, repository in enumerate(get_kustomize_names(kustomize_image)):
+                image: Image = {"repository": repository, "tag": tag}
+                if i:
+                    image["alias"] = True
+                images.append(image)
+        return images
+
+    def _is_textual(self, data: Any) -> bool:
+        # Numeric tags are common, and compared as the strings they convert to
+        return all(
+            isinstance(value, str) and is_textual(value)
+            for image in self._get_kustomize_images(data)
+            for key in KUSTOMIZE_IMAGE_FIELDS
+            if (value := image.get(key)) is not None
+        )
+
+    def _get_kustomize_images(self, data: Any) -> list[KustomizeImageDefinition]:
+        return [
+            holder
+            for holder in find_image_holders(data, default_kind=KUSTOMIZATION_KIND)
+            if "name" in holder
+        ]
+
+    def _get_tag(self, image: KustomizeImageDefinition) -> Union[str, None]:
+        tag = image.get("digest") or image.get("newTag")
+        return None if tag is None else str(tag)
+
+
+def _has_plain_kinds(data: Any) -> bool:
+    """Checks whether the kinds of a document, and of its items, are plain strings"""
+    if not isinstance(data, dict):
+        return True
+    kind = data.get("kind")
+    if kind is None:
+        return True
+    if not isinstance(kind, str) or not is_plain(kind):
+        return False
+    if kind.endswith("List") and isinstance(data.get("items"), list):
+        return all(_has_plain_kinds(item) for item in data["items"])
+    return True
+
 
-    def _parse_image(self, image: KustomizeImageDefinition) -> Image:
-        return {"repository": image["name"], "tag": image["newTag"]}
+def _diff(old: str, new: str) -> Splice:
+    """Returns the smallest single replacement that turns old into new"""
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    return Splice(prefix, len(old) - suffix, new[prefix : len(new) - suffix])
 
 
 def get_manifest(
     path: Union[str, pathlib.Path],
     type: str,
     workdir: Union[str, pathlib.Path, None] = None,
+    keep_parsed: bool = False,
+    raw: Union[bytes, None] = None,
 ) -> AbstractManifest:
     if workdir:
         path = pathlib.Path(workdir) / pathlib.Path(path)
     if type == "kubernetes":
-        return KubernetesManifest(path)
+        return KubernetesManifest(path, keep_parsed=keep_parsed, raw=raw)
     elif type == "kustomize":
-        return KustomizeManifest(path)
+        return KustomizeManifest(path, keep_parsed=keep_parsed, raw=raw)
     elif type == "helm":
         raise Exception("Helm manifests are not yet implemented.")
     else:
@@ -1,47 +1,190 @@
 from __future__ import annotations
 
 import pathlib
-from typing import TypedDict
+import posixpath
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterator, Iterator
 
-from .manifests import Modification, get_manifest
-from .yaml import yaml
+from .config import ConfigData as ConfigData
+from .config import EnvironmentConfig, read_config
+from .config import ManifestConfig as ManifestConfig
+from .index import ManifestIndex
+from .manifests import WRITE_MODES, Image, Modification, get_manifest
+from .pipeline import (
+    ManifestError,
+    ManifestResult,
+    ManifestTask,
+    resolve_from_index,
+    run_tasks,
+)
+from .selection import SelectionIndex
+from .timings import Hook, TimingEvent, timed
+from .yaml import resolve_loader
 
+if TYPE_CHECKING:
+    # Imported where they are used, so only the modules a command needs are loaded
+    from .kustomize import KustomizeGraph
+    from .plan import Plan
+    from .sharding import ShardSelection
+    from .status import DeployedImage
+    from .store import ModificationStore
+    from .writer import StagedWriter
 
-class ManifestConfig(TypedDict):
-    path: str
-    type: str
-    labels: list[str]
-    repositories: list[str]
+# Environments and labels of a manifest
+Scope = tuple[tuple[str, ...], tuple[str, ...]]
 
 
-class EnvironmentConfig(TypedDict):
-    name: str
-    manifests: list[ManifestConfig]
+@dataclass
+class Statistics:
+    parsed: int = 0
+    skipped_by_index: int = 0
+    skipped_by_prefilter: int = 0
+    # Dry runs of manifests in the index don't need to parse them
+    resolved_by_index: int = 0
+    # Manifests that the fast loader shows to be up to date aren't loaded either
+    resolved_by_scan: int = 0
 
+    @property
+    def skipped(self) -> int:
+        return self.skipped_by_index + self.skipped_by_prefilter
 
-class ConfigData(TypedDict):
-    environments: list[EnvironmentConfig]
+    def __str__(self) -> str:
+        s = f"Parsed {self.parsed} manifests, skipped {self.skipped} (index: {self.skipped_by_index}, prefilter: {self.skipped_by_prefilter})"  # noqa: E501
+        if self.resolved_by_index:
+            s += f", resolved {self.resolved_by_index} from index"
+        if self.resolved_by_scan:
+            s += f", resolved {self.resolved_by_scan} by scan"
+        return s
 
 
 class Nautikos:
     def __init__(self) -> None:
+        from .store import ModificationStore
+
         self._workdir: pathlib.Path = pathlib.Path(".")
         self._dry_run: bool = False
+        self._use_index: bool = True
+        self._use_cache: bool = True
+        self._write_mode: str = "dump"
+        self._jobs: int = 1
+        self._fsync: bool = False
+        self._concurrency: int = 8
+        self._shard: tuple[int, int] = (1, 1)
+        self._shard_selection: ShardSelection | None = None
+        self._resolve_kustomize: bool = False
+        self._loader: str = "auto"
         self._environments: list[EnvironmentConfig] = []
-        self._modifications: list[Modification] = []
+        self._selection = SelectionIndex([])
+        self._modifications = ModificationStore()
+        self._errors: list[ManifestError] = []
+        self._stats = Statistics()
+        self._hooks: list[Hook] = []
 
     @property
-    def modifications(self) -> list[Modification]:
+    def modifications(self) -> ModificationStore:
+        """Modifications of all updates so far, with a summary per environment and label
+
+        A manifest's modifications count for the environments it was selected in.
+        """
         return self._modifications
 
+    @property
+    def errors(self) -> list[ManifestError]:
+        return self._errors
+
+    @property
+    def stats(self) -> Statistics:
+        return self._stats
+
+    @property
+    def shard_selection(self) -> ShardSelection | None:
+        """Manifests of the shard that the last update selected, if it was sharded
+
+        Result files record these, so that merging them can check that the shards
+        together cover all manifests exactly once.
+        """
+        return self._shard_selection
+
     def set_dry_run(self, dry_run: bool) -> None:
         self._dry_run = dry_run
 
+    def set_use_index(self, use_index: bool) -> None:
+        self._use_index = use_index
+
+    def set_use_cache(self, use_cache: bool) -> None:
+        self._use_cache = use_cache
+
+    def set_write_mode(self, write_mode: str) -> None:
+        if write_mode not in WRITE_MODES:
+            raise Exception(f"'{write_mode}' is not a correct write mode.")
+        self._write_mode = write_mode
+
+    def set_jobs(self, jobs: int) -> None:
+        """Sets the number of worker processes; 0 means one per CPU"""
+        if jobs < 0:
+            raise Exception(f"'{jobs}' is not a correct number of jobs.")
+        self._jobs = jobs
+
+    def set_fsync(self, fsync: bool) -> None:
+        """Sets whether written manifests are flushed to disk before returning"""
+        self._fsync = fsync
+
+    def set_concurrency(self, concurrency: int) -> None:
+        """Sets the maximum number of files the async engine reads or writes at once"""
+        if concurrency < 1:
+            raise Exception(f"'{concurrency}' is not a correct concurrency.")
+        self._concurrency = concurrency
+
+    def set_shard(self, shard: tuple[int, int]) -> None:
+        """Only processes shard i of n of the selected manifests, passed as (i, n)
+
+        Runners that process all shards together process every manifest exactly once.
+        """
+        index, count = shard
+        if not 1 <= index <= count:
+            raise Exception(f"'{index}/{count}' is not a correct shard.")
+        self._shard = shard
+
+    def set_resolve_kustomize(self, resolve_kustomize: bool) -> None:
+        """Sets whether kustomize manifests are followed to where images are declared
+
+        Instead of only updating the 'images' of the configured kustomization, its
+        bases, components, resources and patches are searched for the image, stopping
+        at the first kustomization with the image in its 'images'.
+        """
+        self._resolve_kustomize = resolve_kustomize
+
+    def set_loader(self, loader: str) -> None:
+        """Sets the loader for reading manifests that aren't written: see LOADERS
+
+        It is used to find images, and to check whether manifests are up to date, so
+        that only manifests that need updating are loaded with the round-trip loader.
+        Results are the same with every loader; 'libyaml' is the fastest.
+        """
+        resolve_loader(loader)
+        self._loader = loader
+
+    def add_hook(self, hook: Hook) -> None:
+        """Registers a callback that receives a TimingEvent for every phase
+
+        Hooks are called for loading the config, selecting and indexing manifests, for
+        reading, loading, modifying and rendering each manifest, and for writing them.
+        Without hooks, nothing is timed.
+        """
+        self._hooks.append(hook)
+
     def load_config(self, path: str) -> None:
         self._workdir = pathlib.Path(path).parent
-        with open(path, "r") as f:
-            config_data: ConfigData = yaml.load(f)
-        self._environments = config_data["environments"]
+        with timed(self._hooks, "load_config", path):
+            config_data = read_config(path, use_cache=self._use_cache)
+        from .discovery import discover_manifests
+
+        with timed(self._hooks, "discover"):
+            self._environments = discover_manifests(
+                self._workdir, config_data["environments"], use_cache=self._use_cache
+            )
+            self._selection = SelectionIndex(self._environments)
 
     def update_manifests(
         self,
@@ -55,45 +198,473 @@ class Nautikos:
         If environment is passed, only environments with matching name are modified;
         otherwise all environments are modified.
 
-        If label is passed, only manifests with matching label are modified; otherwise
-        all manifests in selected environments are modified.
+        If labels are passed, only manifests matching all label expressions are
+        modified; otherwise all manifests in selected environments are modified. A label
+        expression is a label, a negated label ('!label'), a label prefix ('refs/*'), or
+        several of these separated by '|', of which at least one must match.
+        """
+        self.update_manifests_batch(
+            {repository: new_tag}, environment=environment, labels=labels
+        )
+
+    def update_manifests_batch(
+        self,
+        tags: dict[str, str],
+        environment: str | None = None,
+        labels: list[str] | None = None,
+    ) -> None:
+        """Updates image tags of multiple repositories in a single pass
+
+        `tags` maps repositories to their new tag. Every selected manifest is loaded
+        and written at most once, regardless of the number of repositories. Selection
+        by environment and labels works the same as in `update_manifests`.
+
+        Manifests that can't be processed are recorded in `errors`, and don't prevent
+        the other manifests from being updated. Modified manifests are written together
+        at the end: if writing any of them fails, none of them are changed.
+        """
+        items = self.iter_updates(
+            tags, environment=environment, labels=labels, store=self._modifications
+        )
+        for item in items:
+            if isinstance(item, ManifestError):
+                self._errors.append(item)
+
+    def iter_updates(
+        self,
+        tags: dict[str, str],
+        environment: str | None = None,
+        labels: list[str] | None = None,
+        store: ModificationStore | None = None,
+    ) -> Iterator[Modification | ManifestError]:
+        """Updates manifests like `update_manifests_batch`, yielding results as it goes
+
+        Modifications and errors are yielded as soon as the manifest they belong to has
+        been processed, in config order, and are not kept in `modifications` and
+        `errors`. Modifications are added to `store` if passed, which summarizes them
+        per environment and label. Manifests are only written when the generator is
+        exhausted; the index is saved when it is exhausted or closed.
+        """
+        from .writer import StagedWriter
+
+        index, plan = self._plan(tags, environment, labels)
+
+        # Modify manifests, keeping results in config order
+        results = run_tasks(
+            [item for item, _ in plan if isinstance(item, ManifestTask)],
+            jobs=self._jobs,
+        )
+        writer = StagedWriter(fsync=self._fsync)
+        staged: list[ManifestResult] = []
+        try:
+            for item, scope in plan:
+                result = next(results) if isinstance(item, ManifestTask) else item
+                for output in self._handle(result, index, writer, staged):
+                    if store is not None and isinstance(output, Modification):
+                        store.append(output, *scope)
+                    yield output
+            if staged:
+                yield from self._commit(writer, staged, index)
+        finally:
+            writer.discard()
+            if index:
+                with timed(self._hooks, "index"):
+                    index.save()
+
+    async def update_manifests_async(
+        self,
+        repository: str,
+        new_tag: str,
+        environment: str | None = None,
+        labels: list[str] | None = None,
+    ) -> None:
+        """Updates image tags like `update_manifests`, using the async engine"""
+        await self.update_manifests_batch_async(
+            {repository: new_tag}, environment=environment, labels=labels
+        )
+
+    async def update_manifests_batch_async(
+        self,
+        tags: dict[str, str],
+        environment: str | None = None,
+        labels: list[str] | None = None,
+    ) -> None:
+        """Updates image tags like `update_manifests_batch`, using the async engine"""
+        items = self.iter_updates_async(
+            tags, environment=environment, labels=labels, store=self._modifications
+        )
+        async for item in items:
+            if isinstance(item, ManifestError):
+                self._errors.append(item)
+
+    async def iter_updates_async(
+        self,
+        tags: dict[str, str],
+        environment: str | None = None,
+        labels: list[str] | None = None,
+        store: ModificationStore | None = None,
+    ) -> AsyncIterator[Modification | ManifestError]:
+        """Updates manifests like `iter_updates`, overlapping file I/O with processing
+
+        While a manifest is parsed and modified, the next ones are read in background
+        threads, and modified manifests are prepared for writing in the background.
+        At most `concurrency` files are read or written at the same time. Manifests
+        are processed in this process, so the number of jobs doesn't apply.
         """
-        # Get all relevant environments
-        environments = self._get_environments(environment)
+        # Imported here, so asyncio is only loaded when the async engine is used
+        from .aio import AsyncEngine
+        from .writer import StagedWriter
+
+        index, plan = self._plan(tags, environment, labels)
+        writer = StagedWriter(fsync=self._fsync)
+        staged: list[ManifestResult] = []
+        engine = AsyncEngine(writer, self._concurrency)
+        results = engine.run(
+            [item for item, _ in plan if isinstance(item, ManifestTask)]
+        )
+        try:
+            for item, scope in plan:
+                if isinstance(item, ManifestTask):
+                    result = await results.__anext__()
+                else:
+                    result = item
+                for output in self._handle(result, index, writer, staged):
+                    if store is not None and isinstance(output, Modification):
+                        store.append(output, *scope)
+                    yield output
+                if result.content is not None:
+                    await engine.prepare(self._workdir / result.path)
+            if staged:
+                await engine.join()
+                for error in self._commit(writer, staged, index):
+                    yield error
+        finally:
+            await engine.close()
+            writer.discard()
+            if index:
+                with timed(self._hooks, "index"):
+                    index.save()
+
+    def make_plan(
+        self,
+        tags: dict[str, str],
+        target: str,
+        environment: str | None = None,
+        labels: list[str] | None = None,
+    ) -> Plan:
+        """Determines the edits an update would make, without writing anything
+
+        Selection works the same as in `update_manifests`. The modifications and errors
+        are also recorded in `modifications` and `errors`. `target` describes the
+        update in the summary when the plan is applied.
+        """
+        from .plan import Plan, PlannedEdit, PlannedManifest
+        from .writer import StagedWriter
+
+        index, plan = self._plan(tags, environment, labels, planning=True)
+        results = run_tasks(
+            [item for item, _ in plan if isinstance(item, ManifestTask)],
+            jobs=self._jobs,
+        )
+        planned = Plan(target, workdir=str(self._workdir))
+        writer = StagedWriter()
+        try:
+            for item, scope in plan:
+                result = next(results) if isinstance(item, ManifestTask) else item
+                for update in self._handle(result, index, writer, []):
+                    if isinstance(update, ManifestError):
+                        self._errors.append(update)
+                    else:
+                        self._modifications.append(update, *scope)
+                if result.splices and result.sha256 and result.error is None:
+                    edits = [
+                        PlannedEdit(s.start, s.end, s.text) for s in result.splices
+                    ]
+                    planned.manifests.append(
+                        PlannedManifest(
+                            result.path, result.sha256, edits, result.modifications
+                        )
+                    )
+        finally:
+            if index:
+                with timed(self._hooks, "index"):
+                    index.save()
+        return planned
+
+    def get_status(
+        self,
+        repository: str | None = None,
+        environment: str | None = None,
+        labels: list[str] | None = None,
+    ) -> list[DeployedImage]:
+        """Returns the images currently in the selected manifests, per environment
+
+        Nothing is written, so manifests are scanned with the fast loader, and
+        not at all if they are in the index. Manifests that can't be read are added
+        to `errors`.
+        """
+        from .status import DeployedImage
+
+        index: ManifestIndex | None = None
+        if self._use_index:
+            with timed(self._hooks, "index"):
+                index = ManifestIndex(self._workdir)
+                index.load()
 
+        # Manifests can occur in several environments, but are scanned only once
+        scanned: dict[str, list[Image] | None] = {}
+        deployed: list[DeployedImage] = []
+        names = (
+            [environment] if environment else [e["name"] for e in self._environments]
+        )
+        for name in dict.fromkeys(names):
+            for manifest_config in self.select(name, labels):
+                path = manifest_config["path"]
+                if path not in scanned:
+                    scanned[path] = self._scan(manifest_config, index, repository)
+                for image in scanned[path] or []:
+                    if repository is None or image["repository"] == repository:
+                        deployed.append(
+                            DeployedImage(
+                                environment=name,
+                                path=path,
+                                labels=manifest_config["labels"],
+                                repository=image["repository"],
+                                tag=image["tag"],
+                            )
+                        )
+        if index:
+            with timed(self._hooks, "index"):
+                index.save()
+        return deployed
+
+    def _scan(
+        self,
+        manifest_config: ManifestConfig,
+        index: ManifestIndex | None,
+        repository: str | None,
+    ) -> list[Image] | None:
+        path, manifest_type = manifest_config["path"], manifest_config["type"]
+        images = index.lookup(path, manifest_type) if index else None
+        if images is not None:
+            self._stats.resolved_by_index += 1
+            return images
+        full_path = str(self._workdir / path)
+        try:
+            with timed(self._hooks, "load", full_path):
+                manifest = get_manifest(path, manifest_type, workdir=self._workdir)
+                if repository and not manifest.prefilter([repository]):
+                    self._stats.skipped_by_prefilter += 1
+                    return []
+                images = manifest.scan_images(self._loader)
+        except Exception as e:
+            self._errors.append(ManifestError(full_path, str(e) or type(e).__name__))
+            return None
+        self._stats.parsed += 1
+        if index:
+            index.update(path, manifest_type, images)
+        return images
+
+    def _plan(
+        self,
+        tags: dict[str, str],
+        environment: str | None,
+        labels: list[str] | None,
+        planning: bool = False,
+    ) -> tuple[ManifestIndex | None, list[tuple[ManifestTask | ManifestResult, Scope]]]:
+        """Determines which manifests need to be processed, and their scopes
+
+        Manifests that are known not to contain any of the repositories are skipped,
+        and dry runs of indexed manifests are resolved right away. When planning,
+        manifests are always processed, as the plan needs their edits.
+        """
         # Get all relevant manifests
-        manifests: list[ManifestConfig] = []
-        for env in environments:
-            manifests += self._get_manifests(env, labels)
+        plan: list[tuple[ManifestTask | ManifestResult, Scope]] = []
+        with timed(self._hooks, "select"):
+            # A manifest in several environments is processed once, for all of them
+            scopes: dict[str, Scope] = {}
+            manifests: list[ManifestConfig] = []
+            for name, manifest in self._selection.select_with_environments(
+                environment, labels
+            ):
+                if manifest["path"] not in scopes:
+                    manifests.append(manifest)
+                _add_scope(
+                    scopes, manifest["path"], ((name,), tuple(manifest["labels"]))
+                )
+            file_tags: dict[str, dict[str, str]] = {}
+            if self._resolve_kustomize:
+                from .kustomize import KustomizeGraph, resolve_kustomizations
+
+                graph = KustomizeGraph(self._workdir, self._loader)
+                scopes = self._resolve_scopes(graph, manifests, scopes, tags)
+                manifests, file_tags, errors = resolve_kustomizations(
+                    graph, manifests, tags
+                )
+                plan += [
+                    (ManifestResult(path, "kustomize", error=error), scopes[path])
+                    for path, error in errors
+                ]
+            self._shard_selection = None
+            if self._shard[1] > 1:
+                manifests, plan = self._select_shard(manifests, plan)
+
+        index: ManifestIndex | None = None
+        if self._use_index:
+            with timed(self._hooks, "index"):
+                index = ManifestIndex(self._workdir)
+                index.load()
 
-        # Modify manifests
         for manifest_config in manifests:
-            manifest = get_manifest(
-                manifest_config["path"],
-                manifest_config["type"],
-                workdir=self._workdir,
+            path, type = manifest_config["path"], manifest_config["type"]
+            scope = scopes[path]
+            manifest_tags = file_tags.get(path, tags)
+            images = index.lookup(path, type) if index else None
+            task = ManifestTask(
+                path,
+                type,
+                self._workdir,
+                manifest_tags,
+                prefilter=images is None,
+                collect_images=index is not None,
+                dry_run=self._dry_run or planning,
+                write_mode=self._write_mode,
+                timings=bool(self._hooks),
+                plan=planning,
+                loader=self._loader,
             )
-            manifest.load()
-            manifest.modify(repository, new_tag)
-            if len(manifest.modifications) > 0:
-                if not self._dry_run:
-                    manifest.write()
-            self._modifications += manifest.modifications
-
-    def _get_environments(self, environment: str | None) -> list[EnvironmentConfig]:
-        envs: list[EnvironmentConfig] = []
-        for env in self._environments:
-            if not environment or env["name"] == environment:
-                envs.append(env)
-        return envs
-
-    def _get_manifests(
-        self, env: EnvironmentConfig, labels: list[str] | None = None
+            if images is None:
+                plan.append((task, scope))
+            elif not any(image["repository"] in manifest_tags for image in images):
+                self._stats.skipped_by_index += 1
+                self._emit(TimingEvent("skip", path=str(self._workdir / path)))
+            elif self._dry_run and not planning:
+                plan.append((resolve_from_index(task, images), scope))
+            else:
+                plan.append((task, scope))
+        return index, plan
+
+    def _select_shard(
+        self,
+        manifests: list[ManifestConfig],
+        errors: list[tuple[ManifestTask | ManifestResult, Scope]],
+    ) -> tuple[list[ManifestConfig], list[tuple[ManifestTask | ManifestResult, Scope]]]:
+        """Keeps the manifests and errors in the shard, and records which those are"""
+        from .sharding import ShardSelection, assign_shard, fingerprint, select_shard
+
+        index, count = self._shard
+        selected = [m["path"] for m in manifests] + [item.path for item, _ in errors]
+        manifests = select_shard(manifests, self._shard)
+        errors = [e for e in errors if assign_shard(e[0].path, count) == index]
+        self._shard_selection = ShardSelection(
+            fingerprint(selected),
+            [m["path"] for m in manifests] + [item.path for item, _ in errors],
+        )
+        return manifests, errors
+
+    def _resolve_scopes(
+        self,
+        graph: KustomizeGraph,
+        manifests: list[ManifestConfig],
+        scopes: dict[str, Scope],
+        tags: dict[str, str],
+    ) -> dict[str, Scope]:
+        """Returns the scopes of the manifests after resolving kustomizations, by path
+
+        Resolved files are only processed once, so they get the environments and
+        labels of all manifests they are found from.
+        """
+        resolved: dict[str, Scope] = {}
+        for manifest in manifests:
+            paths = [manifest["path"]]
+            if manifest["type"] == "kustomize":
+                try:
+                    located = graph.locate(
+                        posixpath.normpath(manifest["path"]), set(tags)
+                    )
+                except Exception:
+                    # Reported when the manifests are resolved
+                    located = {}
+                paths += located
+            for path in paths:
+                _add_scope(resolved, path, scopes[manifest["path"]])
+        return resolved
+
+    def _handle(
+        self,
+        result: ManifestResult,
+        index: ManifestIndex | None,
+        writer: StagedWriter,
+        staged: list[ManifestResult],
+    ) -> Iterator[Modification | ManifestError]:
+        """Records the result of a manifest, and stages its new contents"""
+        for event in result.events:
+            self._emit(event)
+        if result.error is not None:
+            yield ManifestError(str(self._workdir / result.path), result.error)
+            return
+        if result.resolved_by_index:
+            self._stats.resolved_by_index += 1
+        elif result.resolved_by_scan:
+            self._stats.resolved_by_scan += 1
+        elif not result.parsed:
+            self._stats.skipped_by_prefilter += 1
+            return
+        else:
+            self._stats.parsed += 1
+        if result.content is not None:
+            # Indexed once written, so the index never describes unwritten files
+            writer.stage(self._workdir / result.path, result.content)
+            staged.append(result)
+        elif index and result.images is not None:
+            index.update(result.path, result.type, result.images)
+        yield from result.modifications
+
+    def _commit(
+        self,
+        writer: StagedWriter,
+        staged: list[ManifestResult],
+        index: ManifestIndex | None,
+    ) -> Iterator[ManifestError]:
+        from .writer import CommitError
+
+        start = time.perf_counter()
+        try:
+            written = writer.commit()
+        except CommitError as e:
+            for result in staged:
+                path = str(self._workdir / result.path)
+                if path == e.path:
+                    yield ManifestError(path, str(e.cause) or type(e.cause).__name__)
+                else:
+                    yield ManifestError(
+                        path, f"not written, as writing {e.path} failed"
+                    )
+            return
+        if self._hooks:
+            self._emit(
+                TimingEvent("commit", time.perf_counter() - start, None, written)
+            )
+        if index:
+            for result in staged:
+                if result.images is not None:
+                    index.update(result.path, result.type, result.images)
+
+    def _emit(self, event: TimingEvent) -> None:
+        for hook in self._hooks:
+            hook(event)
+
+    def select(
+        self, environment: str | None = None, labels: list[str] | None = None
     ) -> list[ManifestConfig]:
-        manifests: list[ManifestConfig] = []
-        for manifest in env["manifests"]:
-            if not labels or (
-                "labels" in manifest and set(labels).issubset(set(manifest["labels"]))
-            ):
-                manifests.append(manifest)
-        return manifests
+        """Returns the configs of the manifests matching environment and labels"""
+        return self._selection.select(environment, labels)
+
+
+def _add_scope(scopes: dict[str, Scope], path: str, scope: Scope) -> None:
+    """Adds the environments and labels of a scope to those of a path"""
+    environments, labels = scopes.get(path, ((), ()))
+    scopes[path] = (
+        tuple(dict.fromkeys((*environments, *scope[0]))),
+        tuple(dict.fromkeys((*labels, *scope[1]))),
+    )
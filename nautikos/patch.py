@@ -0,0 +1,103 @@
+import re
+from dataclasses import dataclass
+from typing import Union
+
+from .yaml import is_plain
+
+# Line breaks as counted by the YAML reader when it reports positions
+_LINE_BREAK = re.compile("\r\n|[\n\r\x85\u2028\u2029]")
+# Characters that end a plain scalar in flow collections, and so can't be in one
+_FLOW_INDICATORS = frozenset(",[]{}")
+
+
+@dataclass
+class Edit:
+    """Replacement of a scalar value at a (0-based) line and column in the source"""
+
+    line: int
+    column: int
+    old: str
+    new: str
+
+
+@dataclass
+class Splice:
+    """Replacement of the characters between start and end in the source"""
+
+    start: int
+    end: int
+    text: str
+
+
+def patch(text: str, edits: list[Edit]) -> Union[str, None]:
+    """Applies edits to the source text of a YAML document
+
+    Returns None if any of the edits can't be located, so callers can fall back to
+    re-serializing the whole document.
+    """
+    splices = locate_all(text, edits)
+    if splices is None:
+        return None
+    return apply_splices(text, splices)
+
+
+def locate_all(text: str, edits: list[Edit]) -> Union[list[Splice], None]:
+    line_starts = [0, *(match.end() for match in _LINE_BREAK.finditer(text))]
+    splices: list[Splice] = []
+    for edit in edits:
+        if not 0 <= edit.line < len(line_starts):
+            return None
+        splice = locate(text, line_starts[edit.line] + edit.column, edit)
+        if splice is None:
+            return None
+        splices.append(splice)
+    return splices
+
+
+def locate(text: str, start: int, edit: Edit) -> Union[Splice, None]:
+    """Finds the scalar starting at `start`, and checks that it holds the old value"""
+    quote = text[start : start + 1]
+    if quote == "'":
+        end = start + 1
+        while True:
+            end = text.find("'", end)
+            if end == -1:
+                return None
+            if text[end + 1 : end + 2] != "'":
+                break
+            end += 2
+        end += 1
+        if text[start + 1 : end - 1].replace("''", "'") != edit.old:
+            return None
+        return Splice(start, end, _single_quoted(edit.new))
+    elif quote == '"':
+        end = text.find('"', start + 1)
+        token = text[start + 1 : end]
+        if end == -1 or "\\" in token or "\n" in token or token != edit.old:
+            return None
+        if '"' in edit.new or "\\" in edit.new:
+            return None
+        return Splice(start, end + 1, f'"{edit.new}"')
+    else:
+        end = start + len(edit.old)
+        if text[start:end] != edit.old or text[end : end + 1] not in (
+            "",
+            *" \t\r\n",
+            *_FLOW_INDICATORS,
+        ):
+            return None
+        # The scalar may be in a flow collection, where these would end it
+        if is_plain(edit.new) and _FLOW_INDICATORS.isdisjoint(edit.new):
+            return Splice(start, end, edit.new)
+        return Splice(start, end, _single_quoted(edit.new))
+
+
+def apply_splices(text: str, splices: list[Splice]) -> str:
+    for splice in sorted(splices, key=lambda s: s.start, reverse=True):
+        text = text[: splice.start] + splice.text + text[splice.end :]
+    return text
+
+
+def _single_quoted(value: str) -> str:
+    escaped = value.replace("'", "''")
+    return f"'{escaped}'"
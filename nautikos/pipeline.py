@@ -0,0 +1,192 @@
+import os
+import pathlib
+import time
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, Union
+
+from .cache import content_hash
+from .manifests import Image, Modification, get_manifest
+from .patch import Splice
+from .timings import TimingEvent
+
+
+@dataclass
+class ManifestTask:
+    path: str
+    type: str
+    workdir: pathlib.Path
+    tags: dict[str, str]
+    prefilter: bool = True
+    collect_images: bool = False
+    dry_run: bool = False
+    write_mode: str = "dump"
+    timings: bool = False
+    # Plans the edits instead of rendering the new contents
+    plan: bool = False
+    # Loader that checks whether the manifest is up to date, before loading it
+    loader: str = "auto"
+
+
+@dataclass
+class ManifestResult:
+    path: str
+    type: str
+    parsed: bool = False
+    resolved_by_index: bool = False
+    # Up to date according to the fast loader, so not loaded for modification
+    resolved_by_scan: bool = False
+    modifications: list[Modification] = field(default_factory=list)
+    # Images in the manifest as it is on disk after processing, if collected
+    images: Union[list[Image], None] = None
+    error: Union[str, None] = None
+    # New contents of the manifest, if it changed; written by the caller
+    content: Union[bytes, None] = None
+    # Edits to the file as read, with its content hash, if planned
+    splices: Union[list[Splice], None] = None
+    sha256: Union[str, None] = None
+    # Phases of processing, if timings were requested
+    events: list[TimingEvent] = field(default_factory=list)
+
+
+@dataclass
+class ManifestError:
+    path: str
+    message: str
+
+    def __str__(self) -> str:
+        return f"{self.path} -> ERROR - {self.message}"
+
+    def to_dict(self) -> dict[str, str]:
+        return {"path": self.path, "message": self.message}
+
+
+def process_manifest(
+    task: ManifestTask, raw: Union[bytes, None] = None
+) -> ManifestResult:
+    """Loads and modifies a single manifest, and renders its new contents
+
+    The manifest is read from disk, unless its contents are passed as `raw`. It is
+    scanned with the fast loader first, and only loaded with the round-trip loader if
+    that shows it needs updating, or can't tell. It isn't written: if its contents
+    changed, they are returned, so the caller can write all manifests at once.
+    Exceptions are returned as part of the result rather than raised, so that a
+    failing manifest doesn't prevent the others from being processed.
+    """
+    result = ManifestResult(task.path, task.type)
+    path = str(pathlib.Path(task.workdir) / pathlib.Path(task.path))
+
+    def record(phase: str, start: float, size: int = 0) -> None:
+        if task.timings:
+            event = TimingEvent(phase, time.perf_counter() - start, path, size)
+            result.events.append(event)
+
+    try:
+        manifest = get_manifest(task.path, task.type, workdir=task.workdir, raw=raw)
+        start = time.perf_counter()
+        record("read", start, len(manifest.read()))
+        if task.prefilter and not manifest.prefilter(task.tags):
+            if task.timings:
+                result.events.append(TimingEvent("skip", path=path))
+            return result
+        start = time.perf_counter()
+        images = manifest.scan(task.loader)
+        record("scan", start)
+        if images is not None:
+            modifications = _get_modifications(path, images, task.tags)
+            if not any(mod.updated for mod in modifications):
+                result.resolved_by_scan = True
+                result.modifications = modifications
+                if task.collect_images:
+                    result.images = images
+                return result
+        start = time.perf_counter()
+        manifest.load()
+        result.parsed = True
+        record("load", start)
+        start = time.perf_counter()
+        manifest.modify_batch(task.tags)
+        record("modify", start)
+        updated = any(mod.updated for mod in manifest.modifications)
+        if updated and task.plan:
+            start = time.perf_counter()
+            result.sha256 = content_hash(manifest.read())
+            result.splices = manifest.get_splices(task.write_mode)
+            record("render", start)
+        elif updated and not task.dry_run:
+            start = time.perf_counter()
+            original = manifest.read()
+            content = manifest.apply_edits(task.write_mode)
+            record("render", start, len(content))
+            if content != original:
+                result.content = content
+        if task.collect_images:
+            result.images = manifest.get_images()
+        result.modifications = manifest.modifications
+    except Exception as e:
+        result.error = str(e) or type(e).__name__
+    return result
+
+
+def read_task(task: ManifestTask) -> bytes:
+    with open(pathlib.Path(task.workdir) / pathlib.Path(task.path), "rb") as f:
+        return f.read()
+
+
+def resolve_from_index(task: ManifestTask, images: list[Image]) -> ManifestResult:
+    """Determines the modifications a dry run would make, using indexed images only
+
+    This gives the same modifications as `process_manifest`, without reading the file
+    or loading the YAML machinery.
+    """
+    path = str(pathlib.Path(task.workdir) / pathlib.Path(task.path))
+    result = ManifestResult(task.path, task.type, resolved_by_index=True)
+    result.modifications = _get_modifications(path, images, task.tags)
+    return result
+
+
+def _get_modifications(
+    path: str, images: list[Image], tags: dict[str, str]
+) -> list[Modification]:
+    """Returns the modifications of an update, like the manifest would make them
+
+    Like in the manifest, an image is modified at most once, under the first of its
+    names that is updated.
+    """
+    modifications: list[Modification] = []
+    matched = False
+    for image in images:
+        if not image.get("alias"):
+            matched = False
+        if matched or image["repository"] not in tags:
+            continue
+        matched = True
+        modifications.append(
+            Modification(
+                path=path,
+                repository=image["repository"],
+                previous=image["tag"] or "",
+                new=tags[image["repository"]],
+            )
+        )
+    return modifications
+
+
+def run_tasks(tasks: Iterable[ManifestTask], jobs: int = 1) -> Iterator[ManifestResult]:
+    """Processes manifests, in parallel if jobs > 1
+
+    Results are yielded in the same order as the tasks. If jobs is 0, one worker
+    process per CPU is used.
+    """
+    tasks = list(tasks)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(tasks))
+    if jobs <= 1:
+        yield from map(process_manifest, tasks)
+        return
+    # Imported here, as it is relatively expensive and not needed for a single job
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunksize = max(1, len(tasks) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(process_manifest, tasks, chunksize=chunksize)
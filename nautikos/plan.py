@@ -0,0 +1,149 @@
+import json
+import pathlib
+from dataclasses import dataclass, field
+from typing import Any, Union
+
+from .cache import content_hash
+from .manifests import Modification
+from .pipeline import ManifestError
+from .writer import CommitError, StagedWriter
+
+PLAN_VERSION = 1
+
+
+@dataclass
+class PlannedEdit:
+    """Replacement of the bytes between start and end of a file"""
+
+    start: int
+    end: int
+    new: str
+
+
+@dataclass
+class PlannedManifest:
+    # Path relative to the config, and hash of the contents the plan is based on
+    path: str
+    sha256: str
+    edits: list[PlannedEdit] = field(default_factory=list)
+    modifications: list[Modification] = field(default_factory=list)
+
+
+@dataclass
+class Plan:
+    """Edits that an update would make, to be reviewed and applied later
+
+    Applying a plan doesn't need any YAML parsing: the edits are spliced into the
+    files, after checking that they didn't change since the plan was made.
+    """
+
+    target: str
+    manifests: list[PlannedManifest] = field(default_factory=list)
+    # Directory of the config the plan was made with, which paths are relative to
+    workdir: str = "."
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "version": PLAN_VERSION,
+            "target": self.target,
+            "workdir": self.workdir,
+            "manifests": [
+                {
+                    "path": m.path,
+                    "sha256": m.sha256,
+                    "edits": [[e.start, e.end, e.new] for e in m.edits],
+                    "modifications": [mod.to_dict() for mod in m.modifications],
+                }
+                for m in self.manifests
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "Plan":
+        if not isinstance(data, dict) or data.get("version") != PLAN_VERSION:
+            raise Exception("not a plan of this version of nautikos")
+        return cls(
+            target=data["target"],
+            workdir=data.get("workdir", "."),
+            manifests=[
+                PlannedManifest(
+                    path=m["path"],
+                    sha256=m["sha256"],
+                    edits=[PlannedEdit(*edit) for edit in m["edits"]],
+                    modifications=[
+                        Modification(
+                            mod["path"], mod["repository"], mod["previous"], mod["new"]
+                        )
+                        for mod in m["modifications"]
+                    ],
+                )
+                for m in data["manifests"]
+            ],
+        )
+
+    @property
+    def modifications(self) -> list[Modification]:
+        return [mod for m in self.manifests for mod in m.modifications]
+
+
+def write_plan(path: str, plan: Plan) -> None:
+    with open(path, "w") as f:
+        json.dump(plan.to_dict(), f, indent=1)
+
+
+def read_plan(path: str) -> Plan:
+    with open(path, "r") as f:
+        try:
+            return Plan.from_dict(json.load(f))
+        except (ValueError, KeyError, TypeError) as e:
+            raise Exception(f"{path} is not a correct plan: {e}")
+
+
+def splice(content: bytes, edits: list[PlannedEdit]) -> bytes:
+    """Applies edits to the contents of a file"""
+    parts: list[bytes] = []
+    position = 0
+    for edit in sorted(edits, key=lambda e: e.start):
+        if not position <= edit.start <= edit.end <= len(content):
+            raise Exception(f"edit at byte {edit.start} doesn't fit in the file")
+        parts += [content[position : edit.start], edit.new.encode()]
+        position = edit.end
+    parts.append(content[position:])
+    return b"".join(parts)
+
+
+def apply_plan(
+    plan: Plan, workdir: Union[str, pathlib.Path], fsync: bool = False
+) -> tuple[list[Modification], list[ManifestError]]:
+    """Applies a plan to the files in workdir, and returns what was modified
+
+    Files that changed since the plan was made are refused, and reported as errors;
+    all other files are written together, like in an update.
+    """
+    writer = StagedWriter(fsync=fsync)
+    staged: list[PlannedManifest] = []
+    errors: list[ManifestError] = []
+    for manifest in plan.manifests:
+        path = pathlib.Path(workdir) / manifest.path
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+            if content_hash(content) != manifest.sha256:
+                raise Exception("changed since the plan was made; not applied")
+            writer.stage(path, splice(content, manifest.edits))
+        except Exception as e:
+            errors.append(ManifestError(str(path), str(e) or type(e).__name__))
+            continue
+        staged.append(manifest)
+    try:
+        writer.commit()
+    except CommitError as e:
+        for manifest in staged:
+            path = pathlib.Path(workdir) / manifest.path
+            if str(path) == e.path:
+                message = str(e.cause) or type(e.cause).__name__
+            else:
+                message = f"not written, as writing {e.path} failed"
+            errors.append(ManifestError(str(path), message))
+        return [], errors
+    return [mod for m in staged for mod in m.modifications], errors
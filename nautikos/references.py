@@ -0,0 +1,80 @@
+import functools
+import re
+from dataclasses import dataclass
+from typing import Union
+
+# Grammar of image references, following the distribution project
+_PATH_COMPONENT = r"[a-z0-9]+(?:(?:[._]|__|-+)[a-z0-9]+)*"
+_DOMAIN_COMPONENT = r"(?:[a-zA-Z0-9]|[a-zA-Z0-9][a-zA-Z0-9-]*[a-zA-Z0-9])"
+_DOMAIN = rf"(?:{_DOMAIN_COMPONENT}(?:\.{_DOMAIN_COMPONENT})*|\[[0-9a-fA-F:]+\])"
+_TAG = r"[\w][\w.-]{0,127}"
+_DIGEST = r"[A-Za-z][A-Za-z0-9]*(?:[-_+.][A-Za-z][A-Za-z0-9]*)*:[0-9a-fA-F]{32,}"
+_REFERENCE = re.compile(
+    rf"(?:(?P<domain>{_DOMAIN})(?::(?P<port>[0-9]+))?/)?"
+    rf"(?P<path>{_PATH_COMPONENT}(?:/{_PATH_COMPONENT})*)"
+    rf"(?::(?P<tag>{_TAG}))?"
+    rf"(?:@(?P<digest>{_DIGEST}))?"
+)
+_DIGEST_ONLY = re.compile(_DIGEST)
+_PATH_COMPONENT_ONLY = re.compile(_PATH_COMPONENT)
+
+REFERENCE_CACHE_SIZE = 4096
+
+
+@dataclass(frozen=True)
+class Reference:
+    """Parsed image reference, like 'registry:5000/team/app:1.2@sha256:...'
+
+    The repository is kept as it is written: 'app' and 'docker.io/library/app' are
+    different repositories to nautikos.
+    """
+
+    registry: Union[str, None]
+    path: str
+    tag: Union[str, None] = None
+    digest: Union[str, None] = None
+
+    @property
+    def repository(self) -> str:
+        return f"{self.registry}/{self.path}" if self.registry else self.path
+
+    def __str__(self) -> str:
+        s = self.repository
+        if self.tag:
+            s += f":{self.tag}"
+        if self.digest:
+            s += f"@{self.digest}"
+        return s
+
+
+@functools.lru_cache(maxsize=REFERENCE_CACHE_SIZE)
+def parse_reference(image: str) -> Reference:
+    """Parses an image reference
+
+    Results are cached, as the same images occur in many manifests. Strings that
+    aren't valid references, like names with capitals, are split loosely instead.
+    """
+    match = _REFERENCE.fullmatch(image)
+    if match is None:
+        return _parse_loosely(image)
+    domain, port, path = match["domain"], match["port"], match["path"]
+    registry = f"{domain}:{port}" if port else domain
+    if registry and not ("." in registry or ":" in registry or registry == "localhost"):
+        # Without a dot or port, the first component is part of the path on Docker Hub
+        if not _PATH_COMPONENT_ONLY.fullmatch(registry):
+            return _parse_loosely(image)
+        path, registry = f"{registry}/{path}", None
+    return Reference(registry, path, match["tag"], match["digest"])
+
+
+def _parse_loosely(image: str) -> Reference:
+    name, _, digest = image.partition("@")
+    tag = None
+    if name.rfind(":") > name.rfind("/"):
+        name, _, tag = name.rpartition(":")
+    return Reference(None, name, tag or None, digest or None)
+
+
+def is_digest(value: str) -> bool:
+    """Checks whether a new 'tag' is a digest, like 'sha256:...'"""
+    return _DIGEST_ONLY.fullmatch(value) is not None
@@ -0,0 +1,128 @@
+import json
+from collections import Counter
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Union
+
+from .manifests import Modification
+from .nautikos import Statistics
+from .pipeline import ManifestError
+from .sharding import fingerprint
+from .store import Summary
+
+RESULTS_VERSION = 2
+
+
+@dataclass
+class RunResults:
+    """Outcome of an update run, as stored in a result file
+
+    Results of the shards of a run can be merged into the results of the whole run.
+    """
+
+    target: str
+    modifications: list[Modification] = field(default_factory=list)
+    errors: list[ManifestError] = field(default_factory=list)
+    stats: Statistics = field(default_factory=Statistics)
+    # Counts per environment and label, which the modifications don't record
+    summary: Summary = field(default_factory=Summary)
+    # Shard as (index, count), or None for a run over all manifests
+    shard: Union[tuple[int, int], None] = None
+    # Fingerprint of the manifests selected by all shards, and those in this shard
+    selection: Union[str, None] = None
+    paths: list[str] = field(default_factory=list)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "version": RESULTS_VERSION,
+            "target": self.target,
+            "shard": list(self.shard) if self.shard else None,
+            "selection": self.selection,
+            "paths": self.paths,
+            "modifications": [mod.to_dict() for mod in self.modifications],
+            "errors": [error.to_dict() for error in self.errors],
+            "stats": asdict(self.stats),
+            "summary": {
+                "total": self.summary.total.to_dict(),
+                **self.summary.to_dict(),
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "RunResults":
+        if not isinstance(data, dict) or data.get("version") != RESULTS_VERSION:
+            raise Exception("not a result file of this version of nautikos")
+        shard = data["shard"]
+        return cls(
+            target=data["target"],
+            modifications=[
+                Modification(m["path"], m["repository"], m["previous"], m["new"])
+                for m in data["modifications"]
+            ],
+            errors=[ManifestError(e["path"], e["message"]) for e in data["errors"]],
+            stats=Statistics(**data["stats"]),
+            summary=Summary.from_dict(data["summary"]),
+            shard=(shard[0], shard[1]) if shard else None,
+            selection=data["selection"],
+            paths=list(data["paths"]),
+        )
+
+
+def write_results(path: str, results: RunResults) -> None:
+    with open(path, "w") as f:
+        json.dump(results.to_dict(), f)
+
+
+def read_results(path: str) -> RunResults:
+    with open(path, "r") as f:
+        try:
+            return RunResults.from_dict(json.load(f))
+        except (ValueError, KeyError, TypeError) as e:
+            raise Exception(f"{path} is not a correct result file: {e}")
+
+
+def merge_results(results: list[RunResults]) -> RunResults:
+    """Combines the results of all shards of a run, in shard order
+
+    Raises if the results aren't of the same run, if shards are missing or occur more
+    than once, or if the shards don't process every selected manifest exactly once.
+    """
+    if not results:
+        raise Exception("No results to merge.")
+    targets = {r.target for r in results}
+    if len(targets) > 1:
+        raise Exception(f"Results are of different runs: {sorted(targets)}")
+    counts = {r.shard[1] if r.shard else 1 for r in results}
+    if len(counts) > 1:
+        raise Exception("Results are of runs with different numbers of shards.")
+    count = counts.pop()
+    indices = sorted(r.shard[0] if r.shard else 1 for r in results)
+    if indices != list(range(1, count + 1)):
+        missing = sorted(set(range(1, count + 1)) - set(indices))
+        duplicate = sorted({i for i in indices if indices.count(i) > 1})
+        raise Exception(
+            f"Results don't cover all {count} shards "
+            f"(missing: {missing}, duplicate: {duplicate})."
+        )
+    selections = {r.selection for r in results}
+    if len(selections) > 1:
+        raise Exception("Results are of runs that selected different manifests.")
+    paths = [path for r in results for path in r.paths]
+    if len(set(paths)) < len(paths):
+        overlap = sorted(path for path, n in Counter(paths).items() if n > 1)
+        raise Exception(f"Manifests were processed by several shards: {overlap}")
+    selection = selections.pop()
+    if selection is not None and fingerprint(paths) != selection:
+        raise Exception("Shards don't cover all selected manifests.")
+    merged = RunResults(target=results[0].target, selection=selection)
+    for r in sorted(results, key=lambda r: r.shard or (1, 1)):
+        merged.paths += r.paths
+        merged.modifications += r.modifications
+        merged.errors += r.errors
+        merged.summary.merge(r.summary)
+        for f in fields(Statistics):
+            setattr(
+                merged.stats,
+                f.name,
+                getattr(merged.stats, f.name) + getattr(r.stats, f.name),
+            )
+    return merged
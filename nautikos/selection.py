@@ -0,0 +1,92 @@
+import bisect
+from typing import Union
+
+from .config import EnvironmentConfig, ManifestConfig
+
+
+class SelectionIndex:
+    """Inverted index from environments and labels to manifests
+
+    Manifests are numbered in config order, and sets of manifests are represented as
+    bitsets (Python ints), so selecting manifests comes down to a few intersections.
+    """
+
+    def __init__(self, environments: list[EnvironmentConfig]) -> None:
+        self._manifests: list[ManifestConfig] = []
+        # Environment of each manifest
+        self._names: list[str] = []
+        self._environments: dict[str, int] = {}
+        self._labels: dict[str, int] = {}
+        for env in environments:
+            for manifest in env["manifests"]:
+                bit = 1 << len(self._manifests)
+                self._manifests.append(manifest)
+                self._names.append(env["name"])
+                self._environments[env["name"]] = (
+                    self._environments.get(env["name"], 0) | bit
+                )
+                for label in manifest.get("labels") or []:
+                    self._labels[label] = self._labels.get(label, 0) | bit
+        self._all = (1 << len(self._manifests)) - 1
+        self._sorted_labels = sorted(self._labels)
+
+    def select(
+        self,
+        environment: Union[str, None] = None,
+        labels: Union[list[str], None] = None,
+    ) -> list[ManifestConfig]:
+        """Returns the manifests in an environment that match all label expressions
+
+        Each label expression is a '|'-separated list of alternatives, of which at
+        least one must match. An alternative is a label, optionally prefixed with '!'
+        to negate it, or ending in '*' to match all labels with that prefix.
+        """
+        return [self._manifests[i] for i in self._ids(environment, labels)]
+
+    def select_with_environments(
+        self,
+        environment: Union[str, None] = None,
+        labels: Union[list[str], None] = None,
+    ) -> list[tuple[str, ManifestConfig]]:
+        """Returns the manifests like `select`, with the environment each is in"""
+        return [
+            (self._names[i], self._manifests[i]) for i in self._ids(environment, labels)
+        ]
+
+    def _ids(
+        self, environment: Union[str, None], labels: Union[list[str], None]
+    ) -> list[int]:
+        bits = self._environments.get(environment, 0) if environment else self._all
+        for expression in labels or []:
+            if not bits:
+                break
+            bits &= self._evaluate(expression)
+        ids: list[int] = []
+        while bits:
+            lowest = bits & -bits
+            ids.append(lowest.bit_length() - 1)
+            bits ^= lowest
+        return ids
+
+    def _evaluate(self, expression: str) -> int:
+        bits = 0
+        for alternative in expression.split("|"):
+            alternative = alternative.strip()
+            if alternative.startswith("!"):
+                bits |= self._all & ~self._match(alternative[1:].strip())
+            else:
+                bits |= self._match(alternative)
+        return bits
+
+    def _match(self, pattern: str) -> int:
+        if not pattern.endswith("*"):
+            return self._labels.get(pattern, 0)
+        prefix = pattern[:-1]
+        bits = 0
+        i = bisect.bisect_left(self._sorted_labels, prefix)
+        while i < len(self._sorted_labels) and self._sorted_labels[i].startswith(
+            prefix
+        ):
+            bits |= self._labels[self._sorted_labels[i]]
+            i += 1
+        return bits
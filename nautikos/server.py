@@ -0,0 +1,201 @@
+import json
+import os
+import queue
+import socketserver
+import stat
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Union
+
+from .manifests import Modification
+from .pipeline import ManifestError
+from .session import Session
+
+
+@dataclass
+class UpdateRequest:
+    tags: dict[str, str]
+    environment: Union[str, None] = None
+    labels: Union[list[str], None] = None
+    dry_run: bool = False
+
+
+@dataclass
+class UpdateResponse:
+    modifications: list[Modification] = field(default_factory=list)
+    errors: list[ManifestError] = field(default_factory=list)
+
+    @property
+    def status(self) -> int:
+        if self.errors:
+            return 500
+        if not self.modifications:
+            return 404
+        return 200
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "modifications": [mod.to_dict() for mod in self.modifications],
+            "errors": [error.to_dict() for error in self.errors],
+        }
+
+
+@dataclass
+class _Pending:
+    request: UpdateRequest
+    response: UpdateResponse = field(default_factory=UpdateResponse)
+    done: threading.Event = field(default_factory=threading.Event)
+
+
+class Updater:
+    """Applies update requests, coalescing concurrent requests into batches
+
+    Requests that arrive within `window` seconds of each other are handled together:
+    each manifest they touch is modified for all of them, and written once.
+    """
+
+    def __init__(
+        self, config: str, write_mode: str = "dump", window: float = 0.05
+    ) -> None:
+        self._config = config
+        self._window = window
+        self._queue: "queue.Queue[_Pending]" = queue.Queue()
+        self._session = Session(config, write_mode)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, request: UpdateRequest) -> UpdateResponse:
+        pending = _Pending(request)
+        self._queue.put(pending)
+        pending.done.wait()
+        return pending.response
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            time.sleep(self._window)
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._process(batch)
+            except Exception as e:
+                for pending in batch:
+                    pending.response.errors.append(ManifestError(self._config, str(e)))
+            for pending in batch:
+                pending.done.set()
+
+    def _process(self, batch: list[_Pending]) -> None:
+        for pending in batch:
+            request = pending.request
+            result = self._session.update_manifests_batch(
+                request.tags, request.environment, request.labels, request.dry_run
+            )
+            pending.response.modifications += result.modifications
+            pending.response.errors += result.errors
+
+        # Each manifest is written once, for all requests in the batch
+        for error in self._session.flush():
+            for pending in batch:
+                if not pending.request.dry_run and any(
+                    mod.path == error.path and mod.updated
+                    for mod in pending.response.modifications
+                ):
+                    pending.response.errors.append(error)
+
+
+def _parse_request(data: Any) -> UpdateRequest:
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+    if "tags" in data:
+        tags = data["tags"]
+        if not isinstance(tags, dict):
+            raise ValueError("'tags' should map repositories to tags")
+        tags = {str(k): str(v) for k, v in tags.items()}
+    elif "repository" in data and "tag" in data:
+        tags = {str(data["repository"]): str(data["tag"])}
+    else:
+        raise ValueError("pass a 'repository' and 'tag', or 'tags'")
+    labels = data.get("labels")
+    if isinstance(labels, str):
+        labels = labels.split(",")
+    return UpdateRequest(
+        tags=tags,
+        environment=data.get("env"),
+        labels=labels or None,
+        dry_run=bool(data.get("dry_run", False)),
+    )
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    updater: Updater
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._respond(200, {"status": "ok"})
+        else:
+            self._respond(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        if self.path != "/update":
+            self._respond(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = _parse_request(json.loads(self.rfile.read(length) or b"{}"))
+        except ValueError as e:
+            self._respond(400, {"error": str(e)})
+            return
+        response = self.updater.submit(request)
+        self._respond(response.status, response.to_dict())
+
+    def _respond(self, status: int, body: dict[str, Any]) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self) -> str:
+        # Clients connecting over a Unix socket don't have an address
+        return str(self.client_address[0]) if self.client_address else "unix"
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ThreadingUnixHTTPServer(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    daemon_threads = True
+
+
+def make_server(
+    updater: Updater,
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    socket: Union[str, None] = None,
+) -> socketserver.BaseServer:
+    """Creates a server for update requests, on a TCP port or Unix socket"""
+    handler = type("Handler", (RequestHandler,), {"updater": updater})
+    if socket:
+        _remove_socket(socket)
+        return ThreadingUnixHTTPServer(socket, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def _remove_socket(path: str) -> None:
+    """Removes a socket left behind by an earlier server; other files are kept"""
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} already exists, and isn't a socket")
+    os.unlink(path)
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import collections
+import pathlib
+from dataclasses import dataclass, field
+from types import TracebackType
+
+from .cache import stat_key
+from .manifests import AbstractManifest, Modification, get_manifest
+from .nautikos import Nautikos, Statistics
+from .pipeline import ManifestError
+from .writer import CommitError, StagedWriter
+
+
+@dataclass
+class SessionResult:
+    """Modifications and errors of a single update in a session"""
+
+    modifications: list[Modification] = field(default_factory=list)
+    errors: list[ManifestError] = field(default_factory=list)
+
+
+@dataclass
+class _Entry:
+    manifest: AbstractManifest
+    type: str
+    # Modification time and size of the file when it was loaded or last written
+    key: tuple[int, int]
+    dirty: bool = False
+
+
+class ManifestCache:
+    """Loaded manifests, least recently used first
+
+    Manifests are loaded again when their file changed on disk, unless they have
+    modifications that weren't written yet. Those are never evicted either.
+    """
+
+    def __init__(self, max_size: int = 1024) -> None:
+        self._max_size = max_size
+        self._entries: collections.OrderedDict[
+            pathlib.Path, _Entry
+        ] = collections.OrderedDict()
+        self.loads = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, path: pathlib.Path, type: str) -> _Entry:
+        entry = self._entries.get(path)
+        if entry is not None and entry.type == type:
+            if entry.dirty or stat_key(path) == entry.key:
+                self._entries.move_to_end(path)
+                return entry
+        key = stat_key(path)
+        manifest = get_manifest(path, type, keep_parsed=True)
+        manifest.load()
+        self.loads += 1
+        entry = _Entry(manifest, type, key)
+        self._entries[path] = entry
+        self._entries.move_to_end(path)
+        self._evict()
+        return entry
+
+    def dirty(self) -> list[tuple[pathlib.Path, _Entry]]:
+        return [(path, entry) for path, entry in self._entries.items() if entry.dirty]
+
+    def discard(self, path: pathlib.Path) -> None:
+        self._entries.pop(path, None)
+
+    def _evict(self) -> None:
+        # The most recently used manifest is never evicted
+        for path in list(self._entries)[:-1]:
+            if len(self._entries) <= self._max_size:
+                break
+            if not self._entries[path].dirty:
+                del self._entries[path]
+
+
+class Session:
+    """Applies many updates to the same manifests, writing each of them once
+
+    Manifests are parsed on first use and kept in memory, so repeated updates of a
+    file don't read or parse it again. Modifications are returned per update, and
+    only written by `flush`. Used as a context manager, the session is flushed at
+    the end, unless an exception was raised.
+    """
+
+    def __init__(
+        self,
+        config: str,
+        write_mode: str = "dump",
+        max_manifests: int = 1024,
+        fsync: bool = False,
+    ) -> None:
+        self._config = config
+        self._workdir = pathlib.Path(config).parent
+        self._nautikos: Nautikos | None = None
+        self._config_key: tuple[int, int] | None = None
+        self._write_mode = write_mode
+        self._fsync = fsync
+        self._cache = ManifestCache(max_manifests)
+        self._stats = Statistics()
+
+    @property
+    def stats(self) -> Statistics:
+        return self._stats
+
+    @property
+    def dirty(self) -> list[str]:
+        """Paths of manifests with modifications that weren't written yet"""
+        return [str(path) for path, _ in self._cache.dirty()]
+
+    def __enter__(self) -> Session:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if exc_type is None:
+            self.flush()
+
+    def update_manifests(
+        self,
+        repository: str,
+        new_tag: str,
+        environment: str | None = None,
+        labels: list[str] | None = None,
+        dry_run: bool = False,
+    ) -> SessionResult:
+        """Updates image tags of a repository, like `Nautikos.update_manifests`"""
+        return self.update_manifests_batch(
+            {repository: new_tag}, environment, labels, dry_run
+        )
+
+    def update_manifests_batch(
+        self,
+        tags: dict[str, str],
+        environment: str | None = None,
+        labels: list[str] | None = None,
+        dry_run: bool = False,
+    ) -> SessionResult:
+        """Updates image tags of multiple repositories, like `Nautikos`
+
+        A dry run returns the modifications as they would be, based on the manifests
+        including modifications that weren't flushed yet, without changing them.
+        """
+        result = SessionResult()
+        # A manifest in several environments is updated once, like in `Nautikos`
+        seen: set[str] = set()
+        for config in self._get_nautikos().select(environment, labels):
+            if config["path"] in seen:
+                continue
+            seen.add(config["path"])
+            path = self._workdir / config["path"]
+            try:
+                self._update(path, config["type"], tags, dry_run, result)
+            except Exception as e:
+                self._cache.discard(path)
+                result.errors.append(
+                    ManifestError(str(path), str(e) or type(e).__name__)
+                )
+        return result
+
+    def flush(self) -> list[ManifestError]:
+        """Writes all manifests with modifications, all of them or none
+
+        Returns the manifests that couldn't be written. If a file changed on disk
+        after it was loaded, its modifications are dropped instead of overwriting it.
+        """
+        errors: list[ManifestError] = []
+        writer = StagedWriter(fsync=self._fsync)
+        staged: list[tuple[pathlib.Path, _Entry]] = []
+        for path, entry in self._cache.dirty():
+            try:
+                changed = stat_key(path) != entry.key
+            except OSError:
+                changed = True
+            if changed:
+                self._cache.discard(path)
+                message = "changed on disk since it was loaded; modifications dropped"
+                errors.append(ManifestError(str(path), message))
+                continue
+            writer.stage(path, entry.manifest.read())
+            staged.append((path, entry))
+        try:
+            writer.commit()
+        except CommitError as e:
+            for path, _ in staged:
+                self._cache.discard(path)
+                message = str(e.cause) if str(path) == e.path else "not written"
+                errors.append(ManifestError(str(path), message))
+            return errors
+        for path, entry in staged:
+            entry.dirty = False
+            entry.key = stat_key(path)
+        return errors
+
+    def _update(
+        self,
+        path: pathlib.Path,
+        type: str,
+        tags: dict[str, str],
+        dry_run: bool,
+        result: SessionResult,
+    ) -> None:
+        loads = self._cache.loads
+        entry = self._cache.get(path, type)
+        if self._cache.loads > loads:
+            self._stats.parsed += 1
+        manifest = entry.manifest
+        if not manifest.prefilter(tags):
+            self._stats.skipped_by_prefilter += 1
+            return
+        if dry_run:
+            # Modify a copy, so the cached manifest stays as it is
+            manifest = get_manifest(path, type, raw=manifest.read())
+            manifest.load()
+        manifest.clear_modifications()
+        manifest.modify_batch(tags)
+        result.modifications += manifest.modifications
+        if not dry_run and any(mod.updated for mod in manifest.modifications):
+            original = manifest.read()
+            if manifest.apply_edits(self._write_mode) != original:
+                entry.dirty = True
+
+    def _get_nautikos(self) -> Nautikos:
+        """Returns the Nautikos instance with the config, loading it again if changed"""
+        key = stat_key(self._config)
+        if self._nautikos is None or key != self._config_key:
+            nautikos = Nautikos()
+            nautikos.load_config(self._config)
+            self._nautikos, self._config_key = nautikos, key
+        return self._nautikos
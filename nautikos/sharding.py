@@ -0,0 +1,52 @@
+import hashlib
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from .config import ManifestConfig
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """Parses a shard like '2/4': the second of four shards"""
+    index, _, count = value.partition("/")
+    try:
+        shard = int(index), int(count)
+    except ValueError:
+        raise Exception(f"'{value}' is not a correct shard; use 'index/count'.")
+    if not 1 <= shard[0] <= shard[1]:
+        raise Exception(f"'{value}' is not a correct shard; use 'index/count'.")
+    return shard
+
+
+def fingerprint(paths: Iterable[str]) -> str:
+    """Returns a hash of a set of paths, regardless of their order"""
+    return hashlib.sha1("\n".join(sorted(set(paths))).encode()).hexdigest()
+
+
+def assign_shard(path: str, count: int) -> int:
+    """Returns the shard (1 to count) of a manifest
+
+    The shard only depends on a hash of the path, so every runner arrives at the same
+    shards, regardless of the order of the config, and of the contents of the files,
+    which earlier shards may already have changed. A file that occurs in several
+    environments is always in a single shard. Shards get about the same number of
+    manifests, but aren't balanced by file size, as sizes change while shards run.
+    """
+    return int(hashlib.sha1(path.encode()).hexdigest(), 16) % count + 1
+
+
+def select_shard(
+    manifests: list[ManifestConfig], shard: tuple[int, int]
+) -> list[ManifestConfig]:
+    """Returns the manifests in a shard, in their original order"""
+    index, count = shard
+    if count == 1:
+        return manifests
+    return [m for m in manifests if assign_shard(m["path"], count) == index]
+
+
+@dataclass
+class ShardSelection:
+    """Paths of the manifests in a shard, and a fingerprint of those of all shards"""
+
+    fingerprint: str
+    paths: list[str] = field(default_factory=list)
@@ -0,0 +1,39 @@
+from dataclasses import asdict, dataclass
+from typing import Any, Union
+
+
+@dataclass
+class DeployedImage:
+    """An image as it currently occurs in a manifest of an environment"""
+
+    environment: str
+    path: str
+    labels: list[str]
+    repository: str
+    tag: Union[str, None]
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+COLUMNS = ("environment", "repository", "tag", "path", "labels")
+
+
+def format_table(images: list[DeployedImage]) -> str:
+    """Formats images as a table with aligned columns"""
+    rows = [[column.upper() for column in COLUMNS]]
+    for image in images:
+        rows.append(
+            [
+                image.environment,
+                image.repository,
+                image.tag or "",
+                image.path,
+                ",".join(image.labels),
+            ]
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(COLUMNS))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+        for row in rows
+    )
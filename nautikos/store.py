@@ -0,0 +1,171 @@
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator, Sequence, Union, overload
+
+from .manifests import Modification
+
+
+@dataclass
+class Counts:
+    """Numbers of images that were updated, and that were already up to date"""
+
+    updated: int = 0
+    up_to_date: int = 0
+
+    @property
+    def found(self) -> int:
+        return self.updated + self.up_to_date
+
+    def add(self, updated: bool) -> None:
+        if updated:
+            self.updated += 1
+        else:
+            self.up_to_date += 1
+
+    def merge(self, other: "Counts") -> None:
+        self.updated += other.updated
+        self.up_to_date += other.up_to_date
+
+    def to_dict(self) -> dict[str, int]:
+        return {
+            "found": self.found,
+            "updated": self.updated,
+            "up_to_date": self.up_to_date,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "Counts":
+        return cls(updated=data["updated"], up_to_date=data["up_to_date"])
+
+
+@dataclass
+class Summary:
+    """Counts of modifications, in total and per environment and label
+
+    A manifest in several environments, or with several labels, counts for each.
+    """
+
+    total: Counts = field(default_factory=Counts)
+    environments: dict[str, Counts] = field(default_factory=dict)
+    labels: dict[str, Counts] = field(default_factory=dict)
+
+    def add(
+        self,
+        updated: bool,
+        environments: Iterable[str] = (),
+        labels: Iterable[str] = (),
+    ) -> None:
+        self.total.add(updated)
+        for environment in environments:
+            self.environments.setdefault(environment, Counts()).add(updated)
+        for label in labels:
+            self.labels.setdefault(label, Counts()).add(updated)
+
+    def merge(self, other: "Summary") -> None:
+        """Adds the counts of another summary, such as that of another shard"""
+        self.total.merge(other.total)
+        for name, counts in other.environments.items():
+            self.environments.setdefault(name, Counts()).merge(counts)
+        for label, counts in other.labels.items():
+            self.labels.setdefault(label, Counts()).merge(counts)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "environments": {k: v.to_dict() for k, v in self.environments.items()},
+            "labels": {k: v.to_dict() for k, v in self.labels.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "Summary":
+        """Reads a summary from `to_dict`, with its total added as 'total'"""
+        return cls(
+            total=Counts.from_dict(data["total"]),
+            environments={
+                k: Counts.from_dict(v) for k, v in data["environments"].items()
+            },
+            labels={k: Counts.from_dict(v) for k, v in data["labels"].items()},
+        )
+
+
+class ModificationStore(Sequence[Modification]):
+    """Modifications of a run, stored compactly, with a running summary
+
+    Paths, repositories and tags repeat a lot in large runs, so each distinct string
+    is stored once, and a modification takes four indices into the strings in an
+    array. Modifications are recreated when they are accessed. With `keep=False`,
+    only the summary is kept.
+    """
+
+    def __init__(
+        self, modifications: Iterable[Modification] = (), keep: bool = True
+    ) -> None:
+        self._keep = keep
+        self._strings: list[str] = []
+        self._ids: dict[str, int] = {}
+        # Indices of path, repository, previous and new tag of each modification
+        self._rows = array("I")
+        self.summary = Summary()
+        for modification in modifications:
+            self.append(modification)
+
+    def append(
+        self,
+        modification: Modification,
+        environments: Iterable[str] = (),
+        labels: Iterable[str] = (),
+    ) -> None:
+        """Adds a modification of a manifest in environments, with labels"""
+        self.summary.add(modification.updated, environments, labels)
+        if self._keep:
+            self._rows.append(self._intern(modification.path))
+            self._rows.append(self._intern(modification.repository))
+            self._rows.append(self._intern(modification.previous))
+            self._rows.append(self._intern(modification.new))
+
+    def _intern(self, string: str) -> int:
+        number = self._ids.get(string)
+        if number is None:
+            number = self._ids[string] = len(self._strings)
+            self._strings.append(string)
+        return number
+
+    def __len__(self) -> int:
+        return len(self._rows) // 4
+
+    @overload
+    def __getitem__(self, index: int) -> Modification:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Modification]:
+        ...
+
+    def __getitem__(
+        self, index: Union[int, slice]
+    ) -> Union[Modification, list[Modification]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("modification index out of range")
+        strings, row = self._strings, self._rows[4 * index : 4 * index + 4]
+        return Modification(*(strings[number] for number in row))
+
+    def __iter__(self) -> Iterator[Modification]:
+        strings, rows = self._strings, self._rows
+        for i in range(0, len(rows), 4):
+            yield Modification(
+                strings[rows[i]],
+                strings[rows[i + 1]],
+                strings[rows[i + 2]],
+                strings[rows[i + 3]],
+            )
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (list, tuple, ModificationStore)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ModificationStore({list(self)!r})"
@@ -0,0 +1,86 @@
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Union
+
+# Phases of an update, in the order they happen
+PHASES = (
+    "load_config",
+    "discover",
+    "select",
+    "index",
+    "read",
+    "scan",
+    "load",
+    "modify",
+    "render",
+    "commit",
+)
+
+
+@dataclass
+class TimingEvent:
+    """A phase of an update, or of the processing of a single manifest
+
+    Per-manifest phases ('read', 'scan', 'load', 'modify' and 'render') have a path,
+    and 'read' and 'render' the number of bytes. Manifests are written together in a
+    single 'commit', with the number of bytes written. Manifests that didn't need to
+    be parsed are reported as a 'skip' without duration.
+    """
+
+    phase: str
+    seconds: float = 0.0
+    path: Union[str, None] = None
+    bytes: int = 0
+
+
+Hook = Callable[[TimingEvent], None]
+
+
+@contextmanager
+def timed(
+    hooks: list[Hook], phase: str, path: Union[str, None] = None
+) -> Iterator[None]:
+    """Reports the duration of the block to the hooks, if there are any"""
+    if not hooks:
+        yield
+        return
+    start = time.perf_counter()
+    yield
+    event = TimingEvent(phase, time.perf_counter() - start, path)
+    for hook in hooks:
+        hook(event)
+
+
+@dataclass
+class Timings:
+    """Totals per phase; an instance can be used as a hook"""
+
+    seconds: dict[str, float] = field(default_factory=dict)
+    counts: dict[str, int] = field(default_factory=dict)
+    bytes_read: int = 0
+    bytes_written: int = 0
+
+    @property
+    def files_skipped(self) -> int:
+        return self.counts.get("skip", 0)
+
+    def __call__(self, event: TimingEvent) -> None:
+        self.seconds[event.phase] = self.seconds.get(event.phase, 0.0) + event.seconds
+        self.counts[event.phase] = self.counts.get(event.phase, 0) + 1
+        if event.phase == "read":
+            self.bytes_read += event.bytes
+        elif event.phase == "commit":
+            self.bytes_written += event.bytes
+
+    def __str__(self) -> str:
+        lines = ["Timings:"]
+        for phase in PHASES:
+            if phase in self.counts:
+                ms = self.seconds[phase] * 1000
+                lines.append(f"  {phase:12} {ms:10.1f} ms  ({self.counts[phase]}x)")
+        lines.append(
+            f"  Read {self.bytes_read} bytes, wrote {self.bytes_written} bytes, "
+            f"skipped {self.files_skipped} files"
+        )
+        return "\n".join(lines)
@@ -0,0 +1,149 @@
+import os
+import pathlib
+import shutil
+from typing import Union
+
+Path = Union[str, pathlib.Path]
+
+
+class CommitError(Exception):
+    """Writing one of the staged files failed; none of them were changed"""
+
+    def __init__(self, path: Path, cause: BaseException) -> None:
+        super().__init__(f"{path}: {cause}")
+        self.path = str(path)
+        self.cause = cause
+
+
+def write_atomic(path: Path, content: bytes, fsync: bool = False) -> None:
+    """Replaces the contents of a file, so that readers see either old or new content
+
+    If path is a symbolic link, the file it points to is replaced, and the link kept.
+    """
+    path = _resolve(path)
+    tmp = _write_temp(path, content, fsync)
+    try:
+        os.replace(tmp, path)
+    except BaseException:
+        _unlink(tmp)
+        raise
+
+
+def _write_temp(path: pathlib.Path, content: bytes, fsync: bool) -> pathlib.Path:
+    """Writes content to a temporary file next to path, with the same permissions"""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(content)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if path.exists():
+            shutil.copymode(path, tmp)
+    except BaseException:
+        _unlink(tmp)
+        raise
+    return tmp
+
+
+def _resolve(path: Path) -> pathlib.Path:
+    """The file that is written for path, following symbolic links"""
+    return pathlib.Path(os.path.realpath(path))
+
+
+def _unlink(path: pathlib.Path) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        ...
+
+
+def _fsync_dir(path: pathlib.Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return  # Not supported on all platforms
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class StagedWriter:
+    """Buffers the new contents of files, and writes all of them at once
+
+    On commit, all files whose contents changed are first written to temporary files,
+    which are then renamed over the originals. If anything fails, or the commit is
+    interrupted, files that were already replaced get their original contents back,
+    so either all files are written or none.
+    """
+
+    def __init__(self, fsync: bool = False) -> None:
+        self._fsync = fsync
+        self._staged: dict[pathlib.Path, bytes] = {}
+        self._originals: dict[pathlib.Path, bytes] = {}
+        self._temps: dict[pathlib.Path, pathlib.Path] = {}
+
+    @property
+    def staged(self) -> list[pathlib.Path]:
+        return list(self._staged)
+
+    def stage(self, path: Path, content: bytes) -> None:
+        self._staged[pathlib.Path(path)] = content
+
+    def prepare(self, path: Path) -> None:
+        """Writes the temporary file of a staged file, ahead of the commit
+
+        This can be called from other threads, for different files. If it fails, the
+        commit will try again, and report the error.
+        """
+        path = pathlib.Path(path)
+        if path in self._originals:
+            return
+        with open(path, "rb") as f:
+            original = f.read()
+        if self._staged[path] != original:
+            self._temps[path] = _write_temp(
+                _resolve(path), self._staged[path], self._fsync
+            )
+        self._originals[path] = original
+
+    def commit(self) -> int:
+        """Writes all staged files that changed; returns the number of bytes written"""
+        replaced: list[pathlib.Path] = []
+        path: Union[pathlib.Path, None] = None
+        try:
+            for path in self._staged:
+                self.prepare(path)
+            for path, tmp in self._temps.items():
+                os.replace(tmp, _resolve(path))
+                replaced.append(path)
+            if self._fsync:
+                for directory in {_resolve(path).parent for path in replaced}:
+                    _fsync_dir(directory)
+        except BaseException as e:
+            self._rollback(replaced)
+            if isinstance(e, Exception):
+                raise CommitError(path or "", e) from e
+            raise
+        written = sum(len(self._staged[path]) for path in replaced)
+        self._reset()
+        return written
+
+    def discard(self) -> None:
+        """Drops all staged files, without writing them"""
+        self._rollback([])
+
+    def _rollback(self, replaced: list[pathlib.Path]) -> None:
+        for path in replaced:
+            try:
+                write_atomic(path, self._originals[path], self._fsync)
+            except OSError:
+                ...  # Nothing more we can do; the commit error is raised anyway
+        for path, tmp in self._temps.items():
+            if path not in replaced:
+                _unlink(tmp)
+        self._reset()
+
+    def _reset(self) -> None:
+        self._staged, self._originals, self._temps = {}, {}, {}
@@ -1,4 +1,108 @@
-from ruamel.yaml import YAML
+"""YAML instances, created on first use so that importing nautikos stays cheap"""
+import functools
+from typing import TYPE_CHECKING, Any
 
-yaml = YAML()
-yaml.default_flow_style = False
+if TYPE_CHECKING:
+    from ruamel.yaml import YAML
+
+# Loaders for data that is only read; 'auto' uses libyaml when it is installed
+LOADERS = ("auto", "libyaml", "ruamel")
+
+
+@functools.lru_cache(maxsize=None)
+def get_yaml() -> "YAML":
+    """Round-trip instance, which preserves comments and ordering"""
+    from ruamel.yaml import YAML
+
+    yaml = YAML()
+    yaml.default_flow_style = False
+    return yaml
+
+
+@functools.lru_cache(maxsize=None)
+def get_safe_yaml() -> "YAML":
+    """Safe instance for data that is only read; uses the C loader when available"""
+    from ruamel.yaml import YAML
+
+    return YAML(typ="safe")
+
+
+@functools.lru_cache(maxsize=None)
+def _get_base_yaml() -> "YAML":
+    from ruamel.yaml import YAML
+
+    return YAML(typ="base")
+
+
+@functools.lru_cache(maxsize=None)
+def has_libyaml() -> bool:
+    """Checks whether PyYAML is installed with its libyaml bindings"""
+    try:
+        import yaml
+    except ImportError:
+        return False
+    return bool(yaml.__with_libyaml__)
+
+
+def resolve_loader(loader: str) -> str:
+    """Returns the loader to use for a configured one; raises if it isn't available"""
+    if loader not in LOADERS:
+        raise Exception(
+            f"'{loader}' is not a correct loader; use one of {', '.join(LOADERS)}."
+        )
+    if loader == "auto":
+        return "libyaml" if has_libyaml() else "ruamel"
+    if loader == "libyaml" and not has_libyaml():
+        raise Exception("The libyaml loader needs PyYAML, built with libyaml.")
+    return loader
+
+
+def load_text(stream: bytes, loader: str = "auto") -> list[Any]:
+    """Loads all documents, with every scalar as the text it is written as
+
+    No types are resolved, so this is a lot faster than the round-trip loader, even
+    with the pure Python loader of ruamel. Scalars that aren't strings for the
+    round-trip loader, like numbers and nulls, can be told apart with `is_plain`.
+    Merge keys ('<<') are kept as they are.
+    """
+    if resolve_loader(loader) == "libyaml":
+        import yaml
+
+        return list(yaml.load_all(stream, Loader=yaml.CBaseLoader))
+    return list(_get_base_yaml().load_all(stream))
+
+
+@functools.lru_cache(maxsize=4096)
+def is_plain(value: str) -> bool:
+    """Checks whether a value can be written as a plain scalar and read back as is"""
+    if not value or "\n" in value:
+        return False
+    try:
+        return get_safe_yaml().load(value) == value
+    except Exception:
+        return False
+
+
+@functools.lru_cache(maxsize=4096)
+def is_textual(value: str) -> bool:
+    """Checks whether a scalar loaded as text is as the round-trip loader reads it
+
+    That is, whether it converts to the same non-empty string, quoted or not: '1.0'
+    does, but '1.10', 'null' and 'true' don't.
+    """
+    if not value or "\n" in value:
+        return False
+    try:
+        loaded = get_safe_yaml().load(value)
+    except Exception:
+        return False
+    return bool(loaded) and str(loaded) == value
+
+
+def __getattr__(name: str) -> Any:
+    # Module attributes of earlier versions
+    if name == "yaml":
+        return get_yaml()
+    if name == "safe_yaml":
+        return get_safe_yaml()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,43 @@
+import os
+import tempfile
+from typing import Any, Callable, Generator
+
+import pytest
+
+
+@pytest.fixture()
+def workdir(request: pytest.FixtureRequest) -> Generator[str, None, None]:
+    """A temporary directory holding the `FILES` of the requesting test module."""
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, content in request.module.FILES.items():
+            write(workdir, name, content)
+        yield workdir
+
+
+def read(workdir: str, name: str) -> str:
+    with open(os.path.join(workdir, name), "r") as f:
+        return f.read()
+
+
+def write(workdir: str, name: str, content: str) -> None:
+    os.makedirs(os.path.dirname(os.path.join(workdir, name)), exist_ok=True)
+    with open(os.path.join(workdir, name), "w") as f:
+        f.write(content)
+
+
+def record_calls(
+    monkeypatch: pytest.MonkeyPatch,
+    cls: type,
+    name: str,
+    key: Callable[..., Any],
+) -> list:
+    """Wrap method `name` of `cls` to record `key(self, *args)` of each call."""
+    calls: list = []
+    method = getattr(cls, name)
+
+    def recording(self: Any, *args: Any) -> Any:
+        calls.append(key(self, *args))
+        return method(self, *args)
+
+    monkeypatch.setattr(cls, name, recording)
+    return calls
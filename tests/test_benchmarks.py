@@ -0,0 +1,44 @@
+import pathlib
+import tempfile
+
+from benchmarks.generate import RepoSpec, generate
+from benchmarks.run import compare, run
+from nautikos.nautikos import Nautikos
+
+SPEC = RepoSpec(
+    environments=2,
+    kubernetes_manifests=3,
+    kustomize_manifests=2,
+    containers=2,
+    repositories=3,
+    labels=4,
+    file_size=2000,
+)
+
+
+def test_generate():
+    with tempfile.TemporaryDirectory() as tmp:
+        config = generate(pathlib.Path(tmp), SPEC)
+        nautikos = Nautikos()
+        nautikos.load_config(str(config))
+        assert len(nautikos.select()) == 10
+        assert len(nautikos.select(labels=["label-*"])) == 10
+        for manifest in nautikos.select():
+            assert (pathlib.Path(tmp) / manifest["path"]).stat().st_size >= 2000
+        nautikos.update_manifests_batch(
+            {f"registry.example.com/team/repo-{i}": "1.2.3" for i in range(3)}
+        )
+        assert len(nautikos.modifications) == 20
+        assert not nautikos.errors
+
+
+def test_run_and_compare(capsys):
+    results = run(SPEC, repeat=1, names=["load_config", "update_manifests_cold", "cli"])
+    assert set(results["results"]) == {"load_config", "update_manifests_cold", "cli"}
+    assert compare(results, results, threshold=0.2) == []
+
+    baseline = {
+        "spec": results["spec"],
+        "results": {"cli": {"median": results["results"]["cli"]["median"] / 2}},
+    }
+    assert compare(results, baseline, threshold=0.2) == ["cli"]
@@ -1,4 +1,8 @@
-from unittest.mock import MagicMock
+import json
+import os
+import tempfile
+from typing import Any, Iterator
+from unittest.mock import ANY, AsyncMock, MagicMock
 
 import pytest
 from typer.testing import CliRunner
@@ -6,6 +10,9 @@ from typer.testing import CliRunner
 from nautikos import cli
 from nautikos.manifests import Modification
 from nautikos.nautikos import Nautikos
+from nautikos.pipeline import ManifestError
+from nautikos.status import DeployedImage
+from nautikos.store import ModificationStore
 
 runner = CliRunner()
 
@@ -13,23 +20,30 @@ runner = CliRunner()
 @pytest.fixture()
 def mocked_nautikos():
     mock_set_dry_run = MagicMock()
+    mock_set_use_index = MagicMock()
     mock_load_config = MagicMock()
     mock_update_manifests = MagicMock()
+    mock_update_manifests_batch = MagicMock()
+    mock_add_hook = MagicMock()
     cli.nautikos.set_dry_run = mock_set_dry_run  # type: ignore
+    cli.nautikos.set_use_index = mock_set_use_index  # type: ignore
     cli.nautikos.load_config = mock_load_config  # type: ignore
     cli.nautikos.update_manifests = mock_update_manifests  # type: ignore
+    cli.nautikos.update_manifests_batch = mock_update_manifests_batch  # type: ignore
+    cli.nautikos.add_hook = mock_add_hook  # type: ignore
     return cli.nautikos
 
 
 def test_app(mocked_nautikos: Nautikos):
-    mocked_nautikos._modifications = [
-        Modification(path="", repository="", previous="1", new="2")
-    ]
+    mocked_nautikos._modifications = ModificationStore(
+        [Modification(path="", repository="", previous="1", new="2")]
+    )
     result = runner.invoke(
         cli.app,
         ["repo-a", "1.2.3", "--env", "prod", "--labels", "app1,app2", "--dry-run"],
     )
     mocked_nautikos.set_dry_run.assert_called_once_with(True)  # type: ignore
+    mocked_nautikos.set_use_index.assert_called_once_with(True)  # type: ignore
     mocked_nautikos.load_config.assert_called_once_with("nautikos.yaml")  # type: ignore
     mocked_nautikos.update_manifests.assert_called_once_with(  # type: ignore
         "repo-a", "1.2.3", environment="prod", labels=["app1", "app2"]
@@ -38,7 +52,7 @@ def test_app(mocked_nautikos: Nautikos):
 
 
 def test_no_mods(mocked_nautikos: Nautikos):
-    mocked_nautikos._modifications = []
+    mocked_nautikos._modifications = ModificationStore()
     result = runner.invoke(
         cli.app,
         ["repo-a", "1.2.3", "--env", "prod", "--labels", "app1,app2", "--dry-run"],
@@ -52,9 +66,9 @@ def test_no_mods(mocked_nautikos: Nautikos):
 
 
 def test_no_update(mocked_nautikos: Nautikos):
-    mocked_nautikos._modifications = [
-        Modification(path="", repository="", previous="1", new="1")
-    ]
+    mocked_nautikos._modifications = ModificationStore(
+        [Modification(path="", repository="", previous="1", new="1")]
+    )
     result = runner.invoke(
         cli.app,
         ["repo-a", "1.2.3", "--env", "prod", "--labels", "app1,app2", "--dry-run"],
@@ -65,3 +79,312 @@ def test_no_update(mocked_nautikos: Nautikos):
         "repo-a", "1.2.3", environment="prod", labels=["app1", "app2"]
     )
     assert result.exit_code == 0
+
+
+def test_batch(mocked_nautikos: Nautikos):
+    mocked_nautikos._modifications = ModificationStore(
+        [
+            Modification(path="", repository="repo-a", previous="1", new="2"),
+            Modification(path="", repository="repo-b", previous="1", new="1"),
+        ]
+    )
+    result = runner.invoke(
+        cli.app,
+        ["--batch", "-", "--env", "prod"],
+        input="# Comment\nrepo-a 1.2.3\n\nrepo-b 4.5.6\n",
+    )
+    mocked_nautikos.update_manifests_batch.assert_called_once_with(  # type: ignore
+        {"repo-a": "1.2.3", "repo-b": "4.5.6"}, environment="prod", labels=None
+    )
+    mocked_nautikos.update_manifests.assert_not_called()  # type: ignore
+    assert "Updated 1 out of 2 discovered occurences of 2 repositories" in result.stdout
+    assert result.exit_code == 0
+
+
+def test_batch_invalid_line(mocked_nautikos: Nautikos):
+    result = runner.invoke(cli.app, ["--batch", "-"], input="repo-a\n")
+    mocked_nautikos.update_manifests_batch.assert_not_called()  # type: ignore
+    assert result.exit_code == 2
+
+
+def test_batch_missing_file(mocked_nautikos: Nautikos):
+    result = runner.invoke(cli.app, ["--batch", "missing.txt"])
+    mocked_nautikos.update_manifests_batch.assert_not_called()  # type: ignore
+    assert result.exit_code == 2
+    assert "No such file" in result.output
+
+
+def test_missing_arguments(mocked_nautikos: Nautikos):
+    result = runner.invoke(cli.app, ["repo-a"])
+    mocked_nautikos.update_manifests.assert_not_called()  # type: ignore
+    assert result.exit_code == 2
+
+
+def test_no_index(mocked_nautikos: Nautikos):
+    mocked_nautikos._modifications = ModificationStore(
+        [Modification(path="", repository="", previous="1", new="2")]
+    )
+    result = runner.invoke(cli.app, ["repo-a", "1.2.3", "--no-index"])
+    mocked_nautikos.set_use_index.assert_called_once_with(False)  # type: ignore
+    assert result.exit_code == 0
+
+
+def test_errors(mocked_nautikos: Nautikos):
+    mocked_nautikos._modifications = ModificationStore(
+        [Modification(path="", repository="", previous="1", new="2")]
+    )
+    mocked_nautikos._errors = [ManifestError(path="a.yaml", message="Broken")]
+    result = runner.invoke(cli.app, ["repo-a", "1.2.3", "--jobs", "4"])
+    mocked_nautikos._errors = []
+    assert "a.yaml -> ERROR - Broken" in result.stdout
+    assert result.exit_code == 1
+
+
+def test_timings_and_profile(mocked_nautikos: Nautikos):
+    mocked_nautikos._modifications = ModificationStore(
+        [Modification(path="", repository="", previous="1", new="2")]
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        profile = os.path.join(tmp, "out.prof")
+        result = runner.invoke(
+            cli.app, ["repo-a", "1.2.3", "--timings", "--profile", profile]
+        )
+        assert os.path.exists(profile)
+    mocked_nautikos.add_hook.assert_called_once()  # type: ignore
+    assert "Timings:" in result.stdout
+    assert result.exit_code == 0
+
+
+def test_output_ndjson(mocked_nautikos: Nautikos):
+    modification = Modification(
+        path="a.yaml", repository="repo-a", previous="1", new="2"
+    )
+
+    def iter_updates(*args: Any, store: ModificationStore, **kwargs: Any) -> Iterator:
+        store.append(modification)
+        yield modification
+        yield ManifestError(path="b.yaml", message="Broken")
+
+    mocked_nautikos.iter_updates = iter_updates  # type: ignore
+    result = runner.invoke(cli.app, ["repo-a", "1.2.3", "--output", "ndjson"])
+    events = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [event["event"] for event in events] == ["modification", "error", "summary"]
+    assert events[0]["new"] == "2"
+    assert events[1]["message"] == "Broken"
+    assert events[2]["found"] == 1
+    assert events[2]["updated"] == 1
+    assert result.exit_code == 1
+
+
+def test_output_json(mocked_nautikos: Nautikos):
+    mocked_nautikos._modifications = ModificationStore(
+        [Modification(path="a.yaml", repository="repo-a", previous="1", new="1")]
+    )
+    result = runner.invoke(cli.app, ["repo-a", "1.2.3", "--output", "json"])
+    output = json.loads(result.stdout)
+    assert output["modifications"][0]["updated"] is False
+    assert output["message"] == (
+        "Updated 0 out of 1 discovered occurences of 'repo-a' to '1.2.3'"
+    )
+    assert result.exit_code == 0
+
+
+def test_output_json_errors(mocked_nautikos: Nautikos):
+    mocked_nautikos._errors = [
+        ManifestError(path="a.yaml", message="Broken"),
+        ManifestError(path="b.yaml", message="Missing"),
+    ]
+    result = runner.invoke(cli.app, ["repo-a", "1.2.3", "--output", "json"])
+    mocked_nautikos._errors = []
+    output = json.loads(result.stdout)
+    assert output["errors"] == [
+        {"path": "a.yaml", "message": "Broken"},
+        {"path": "b.yaml", "message": "Missing"},
+    ]
+    assert output["failed"] == 2
+    assert result.exit_code == 1
+
+
+def test_engine_async(mocked_nautikos: Nautikos):
+    mocked_nautikos._modifications = ModificationStore(
+        [Modification(path="", repository="", previous="1", new="2")]
+    )
+    mock = AsyncMock()
+    mocked_nautikos.update_manifests_batch_async = mock  # type: ignore
+    result = runner.invoke(
+        cli.app, ["repo-a", "1.2.3", "--engine", "async", "--concurrency", "4"]
+    )
+    mock.assert_awaited_once_with({"repo-a": "1.2.3"}, environment=None, labels=None)
+    mocked_nautikos.update_manifests.assert_not_called()  # type: ignore
+    assert result.exit_code == 0
+
+
+def test_status(mocked_nautikos: Nautikos):
+    image = DeployedImage("prod", "app/deployment.yaml", ["app"], "repo-a", "1.0")
+    mocked_nautikos.get_status = MagicMock(return_value=[image])  # type: ignore
+    mocked_nautikos._errors = []
+    result = runner.invoke(cli.app, ["status", "repo-a", "--env", "prod"])
+    mocked_nautikos.get_status.assert_called_once_with(  # type: ignore
+        "repo-a", environment="prod", labels=None
+    )
+    assert result.stdout.splitlines() == [
+        "ENVIRONMENT  REPOSITORY  TAG  PATH                 LABELS",
+        "prod         repo-a      1.0  app/deployment.yaml  app",
+    ]
+    assert result.exit_code == 0
+
+    result = runner.invoke(cli.app, ["status", "--output", "json"])
+    assert json.loads(result.stdout)["images"] == [image.to_dict()]
+
+    mocked_nautikos.get_status = MagicMock(return_value=[])  # type: ignore
+    result = runner.invoke(cli.app, ["status", "repo-b"])
+    assert result.exit_code == 1
+
+
+def test_shards_and_merge_results():
+    config = "environments:\n- name: prod\n  manifests:\n"
+    manifest = "spec:\n  containers:\n  - image: repo-a:1.0\n"
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(4):
+            config += f"  - path: app{i}.yaml\n    type: kubernetes\n"
+            with open(os.path.join(tmp, f"app{i}.yaml"), "w") as f:
+                f.write(("---\n" + manifest) * (i + 1))
+        with open(os.path.join(tmp, "nautikos.yaml"), "w") as f:
+            f.write(config)
+        files = []
+        for shard in ("1/2", "2/2"):
+            cli._nautikos = None
+            files.append(os.path.join(tmp, f"shard-{shard[0]}.json"))
+            result = runner.invoke(
+                cli.app,
+                ["repo-a", "2.0", "--config", os.path.join(tmp, "nautikos.yaml")]
+                + ["--shard", shard, "--result-file", files[-1]],
+            )
+            assert result.exit_code == 0
+        cli._nautikos = None
+        result = runner.invoke(cli.app, ["merge-results", *files])
+        assert result.exit_code == 0
+        assert "Updated 10 out of 10 discovered occurences of 'repo-a' to '2.0'" in (
+            result.stdout
+        )
+        result = runner.invoke(cli.app, ["merge-results", files[0]])
+        assert result.exit_code == 2
+    cli._nautikos = None
+
+
+def test_shards_with_changing_sizes():
+    # Shards that run after others see files that earlier shards made longer
+    config = "environments:\n- name: prod\n  manifests:\n"
+    manifest = "spec:\n  containers:\n  - image: repo-a:1.0\n"
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(15):
+            config += f"  - path: app{i}.yaml\n    type: kubernetes\n"
+            with open(os.path.join(tmp, f"app{i}.yaml"), "w") as f:
+                f.write(manifest + "# " + "x" * i * 10 + "\n")
+        config += "  - path: broken.yaml\n    type: kubernetes\n"
+        with open(os.path.join(tmp, "broken.yaml"), "w") as f:
+            f.write("repo-a: [\n")
+        with open(os.path.join(tmp, "nautikos.yaml"), "w") as f:
+            f.write(config)
+        files = []
+        for shard in ("1/3", "2/3", "3/3"):
+            cli._nautikos = None
+            files.append(os.path.join(tmp, f"shard-{shard[0]}.json"))
+            runner.invoke(
+                cli.app,
+                ["repo-a", "2.0.0-long-release"]
+                + ["--config", os.path.join(tmp, "nautikos.yaml"), "--no-index"]
+                + ["--shard", shard, "--result-file", files[-1]],
+            )
+        cli._nautikos = None
+        result = runner.invoke(cli.app, ["merge-results", *files, "--output", "json"])
+        output = json.loads(result.stdout)
+        assert output["found"] == output["updated"] == 15
+        assert output["environments"] == {
+            "prod": {"found": 15, "updated": 15, "up_to_date": 0}
+        }
+        assert output["errors"] == [
+            {"path": os.path.join(tmp, "broken.yaml"), "message": ANY}
+        ]
+        assert output["failed"] == 1
+        assert result.exit_code == 1
+        for i in range(15):
+            with open(os.path.join(tmp, f"app{i}.yaml")) as f:
+                assert "repo-a:2.0.0-long-release" in f.read()
+        result = runner.invoke(cli.app, ["merge-results", *files[:2], files[1]])
+        assert result.exit_code == 2
+    cli._nautikos = None
+
+
+def test_shards_without_images():
+    config = "environments:\n- name: prod\n  manifests:\n"
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, repository in enumerate(["repo-a", "repo-b"]):
+            config += f"  - path: app{i}.yaml\n    type: kubernetes\n"
+            with open(os.path.join(tmp, f"app{i}.yaml"), "w") as f:
+                f.write(f"spec:\n  containers:\n  - image: {repository}:1.0\n")
+        with open(os.path.join(tmp, "nautikos.yaml"), "w") as f:
+            f.write(config)
+        for repository, exit_code in [("repo-a", 0), ("repo-c", 1)]:
+            files = []
+            for shard in ("1/2", "2/2"):
+                cli._nautikos = None
+                files.append(os.path.join(tmp, f"shard-{shard[0]}.json"))
+                result = runner.invoke(
+                    cli.app,
+                    [repository, "2.0", "--config", os.path.join(tmp, "nautikos.yaml")]
+                    + ["--shard", shard, "--result-file", files[-1]],
+                )
+                # Whether any images were found is up to merge-results
+                assert result.exit_code == 0
+            cli._nautikos = None
+            result = runner.invoke(cli.app, ["merge-results", *files])
+            assert result.exit_code == exit_code
+    cli._nautikos = None
+
+
+def test_serve_doesnt_remove_other_files():
+    with tempfile.TemporaryDirectory() as tmp:
+        config = os.path.join(tmp, "nautikos.yaml")
+        with open(config, "w") as f:
+            f.write("environments: []\n")
+        result = runner.invoke(
+            cli.app, ["serve", "--config", config, "--socket", config]
+        )
+        assert result.exit_code == 2
+        assert "isn't a socket" in result.output
+        with open(config) as f:
+            assert f.read() == "environments: []\n"
+
+
+def test_plan_and_apply(monkeypatch: pytest.MonkeyPatch):
+    manifest = "spec:\n  containers:\n  - image: repo-a:1.0\n"
+    with tempfile.TemporaryDirectory() as tmp:
+        monkeypatch.chdir(tmp)
+        os.mkdir("sub")
+        config = os.path.join("sub", "nautikos.yaml")
+        with open(config, "w") as f:
+            f.write("environments:\n- name: prod\n  manifests:\n")
+            f.write("  - path: app.yaml\n    type: kubernetes\n")
+        with open(os.path.join("sub", "app.yaml"), "w") as f:
+            f.write(manifest)
+        cli._nautikos = None
+        result = runner.invoke(
+            cli.app, ["plan", "repo-a", "2.0", "--config", config, "--file", "p.json"]
+        )
+        assert result.exit_code == 0
+        assert "Wrote a plan for 1 manifest(s)" in result.stdout
+        with open(os.path.join("sub", "app.yaml")) as f:
+            assert f.read() == manifest
+        # Paths are relative to the config the plan was made with
+        result = runner.invoke(cli.app, ["apply", "p.json"])
+        assert result.exit_code == 0
+        with open(os.path.join("sub", "app.yaml")) as f:
+            assert f.read() == manifest.replace("1.0", "2.0")
+
+        # The file changed since the plan was made
+        result = runner.invoke(cli.app, ["apply", "p.json", "--config", config])
+        assert result.exit_code == 1
+        assert "changed since the plan was made" in result.stdout
+        monkeypatch.chdir("/")
+    cli._nautikos = None
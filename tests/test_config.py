@@ -0,0 +1,116 @@
+import json
+import os
+import re
+import tempfile
+from typing import Any, Generator
+
+import pytest
+
+from nautikos.config import compile_config, read_config
+
+CONFIG_FILE = """environments:
+- name: prod
+  manifests:
+  - path: prod/app1/deployment.yaml  # Comment
+    type: kubernetes
+    labels:
+    - app1
+    - 1.0
+  - path: prod/app2/kustomize.yaml
+    type: kustomize
+"""
+COMPILED = {
+    "environments": [
+        {
+            "name": "prod",
+            "manifests": [
+                {
+                    "path": "prod/app1/deployment.yaml",
+                    "type": "kubernetes",
+                    "labels": ["app1", "1.0"],
+                    "repositories": [],
+                    "ignore": [],
+                },
+                {
+                    "path": "prod/app2/kustomize.yaml",
+                    "type": "kustomize",
+                    "labels": [],
+                    "repositories": [],
+                    "ignore": [],
+                },
+            ],
+        }
+    ]
+}
+
+
+@pytest.fixture()
+def config_path() -> Generator[str, None, None]:
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "nautikos.yaml")
+        with open(path, "w") as f:
+            f.write(CONFIG_FILE)
+        yield path
+
+
+def _cache_file(config_path: str) -> str:
+    return os.path.join(
+        os.path.dirname(config_path), ".nautikos", "config.nautikos.yaml.json"
+    )
+
+
+def test_read_config(config_path: str):
+    assert read_config(config_path) == COMPILED
+    with open(_cache_file(config_path), "r") as f:
+        assert json.load(f)["config"] == COMPILED
+
+
+def test_read_config_from_cache(config_path: str):
+    read_config(config_path)
+    with open(_cache_file(config_path), "r") as f:
+        cached = json.load(f)
+    cached["config"]["environments"][0]["name"] = "cached"
+    with open(_cache_file(config_path), "w") as f:
+        json.dump(cached, f)
+    assert read_config(config_path)["environments"][0]["name"] == "cached"
+    assert read_config(config_path, use_cache=False) == COMPILED
+
+
+def test_read_config_stale_cache(config_path: str):
+    read_config(config_path)
+    with open(config_path, "w") as f:
+        f.write(CONFIG_FILE.replace("prod", "staging"))
+    assert read_config(config_path)["environments"][0]["name"] == "staging"
+
+
+def test_read_config_no_cache(config_path: str):
+    read_config(config_path, use_cache=False)
+    assert not os.path.exists(_cache_file(config_path))
+
+
+@pytest.mark.parametrize(
+    "data,message",
+    [
+        ([], "expected a list of 'environments'"),
+        ({"environments": [{}]}, "environments[0] should have a 'name'"),
+        (
+            {"environments": [{"name": "a", "manifests": [{"type": "kubernetes"}]}]},
+            "environments[0].manifests[0] should have a 'path'",
+        ),
+        (
+            {"environments": [{"name": "a", "manifests": [{"path": "a"}]}]},
+            "environments[0].manifests[0] should have a 'type'",
+        ),
+        (
+            {
+                "environments": [
+                    {"name": "a", "manifests": [{"path": "a", "type": "b"}]}
+                ]
+            },
+            "'b' is not a correct manifest type.",
+        ),
+    ],
+)
+def test_compile_config_invalid(data: Any, message: str):
+    with pytest.raises(Exception, match=re.escape(message)):
+        compile_config(data)
@@ -0,0 +1,145 @@
+import json
+import pathlib
+import re
+import tempfile
+from typing import Generator
+
+import pytest
+
+from nautikos.config import compile_config
+from nautikos.discovery import Discovery, compile_pattern, detect_type
+from nautikos.nautikos import Nautikos
+from nautikos.yaml import get_safe_yaml
+
+DEPLOYMENT = """apiVersion: apps/v1
+kind: Deployment
+spec:
+  template:
+    spec:
+      containers:
+      - image: my-repo:1.0
+"""
+KUSTOMIZATION = """images:
+- name: my-repo
+  newTag: "1.0"
+"""
+SERVICE = """apiVersion: v1
+kind: Service
+"""
+FILES = {
+    "prod/app1/deployment.yaml": DEPLOYMENT,
+    "prod/app1/service.yaml": SERVICE,
+    "prod/app2/kustomization.yaml": KUSTOMIZATION,
+    "prod/app2/README.md": "my-repo",
+    "prod/legacy/deployment.yml": DEPLOYMENT,
+    "prod/.hidden/deployment.yaml": DEPLOYMENT,
+    "dev/app1/deployment.yaml": DEPLOYMENT,
+}
+CONFIG_FILE = """environments:
+- name: prod
+  manifests:
+  - dir: prod/
+    labels: [prod]
+    ignore: [prod/legacy]
+- name: dev
+  manifests:
+  - path: dev/**/deployment.yaml
+    type: kubernetes
+"""
+
+
+@pytest.fixture()
+def workdir() -> Generator[pathlib.Path, None, None]:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = pathlib.Path(tmp)
+        for path, content in FILES.items():
+            (root / path).parent.mkdir(parents=True, exist_ok=True)
+            (root / path).write_text(content)
+        (root / "nautikos.yaml").write_text(CONFIG_FILE)
+        yield root
+
+
+@pytest.mark.parametrize(
+    "pattern,path,matches",
+    [
+        ("prod/**/kustomization.yaml", "prod/kustomization.yaml", True),
+        ("prod/**/kustomization.yaml", "prod/a/b/kustomization.yaml", True),
+        ("prod/**/kustomization.yaml", "dev/a/kustomization.yaml", False),
+        ("prod/*.yaml", "prod/a.yaml", True),
+        ("prod/*.yaml", "prod/a/b.yaml", False),
+        ("prod/app[12]/?.y*ml", "prod/app2/a.yml", True),
+        ("prod/app[!12]/*", "prod/app1/a.yaml", False),
+        ("prod/**", "prod/a/b.yaml", True),
+    ],
+)
+def test_compile_pattern(pattern: str, path: str, matches: bool):
+    assert bool(compile_pattern(pattern).match(path)) == matches
+
+
+def test_detect_type():
+    assert detect_type("kustomization.yaml", b"") == "kustomize"
+    assert detect_type("a.yaml", b"kind: Kustomization\n") == "kustomize"
+    assert detect_type("a.yaml", DEPLOYMENT.encode()) == "kubernetes"
+    assert detect_type("a.yaml", SERVICE.encode()) is None
+
+
+def test_compile_config():
+    config = compile_config(get_safe_yaml().load(CONFIG_FILE))
+    manifests = [env["manifests"][0] for env in config["environments"]]
+    assert manifests[0]["path"] == "prod/**"
+    assert manifests[0]["type"] == "auto"
+    assert manifests[0]["ignore"] == ["prod/legacy"]
+    assert manifests[1]["type"] == "kubernetes"
+
+
+@pytest.mark.parametrize(
+    "manifest,message",
+    [
+        ({"path": "a.yaml"}, "should have a 'type'"),
+        ({"path": "a.yaml", "type": "auto"}, "type 'auto' needs a 'dir'"),
+        ({"path": "a.yaml", "dir": "a"}, "either a 'path' or a 'dir'"),
+    ],
+)
+def test_compile_config_invalid(manifest: dict, message: str):
+    data = {"environments": [{"name": "a", "manifests": [manifest]}]}
+    with pytest.raises(Exception, match=re.escape(message)):
+        compile_config(data)
+
+
+def test_discover(workdir: pathlib.Path):
+    nautikos = Nautikos()
+    nautikos.load_config(str(workdir / "nautikos.yaml"))
+    assert [(m["path"], m["type"], m["labels"]) for m in nautikos.select()] == [
+        ("prod/app1/deployment.yaml", "kubernetes", ["prod"]),
+        ("prod/app2/kustomization.yaml", "kustomize", ["prod"]),
+        ("dev/app1/deployment.yaml", "kubernetes", []),
+    ]
+    nautikos.update_manifests("my-repo", "1.2.3")
+    assert len(nautikos.modifications) == 3
+
+
+def test_discover_cache(workdir: pathlib.Path):
+    config = compile_config(get_safe_yaml().load(CONFIG_FILE))
+    discovery = Discovery(workdir)
+    discovery.expand(config["environments"])
+    discovery.save()
+    with open(workdir / ".nautikos" / "discovery.json") as f:
+        cached = json.load(f)
+    assert cached["dirs"]["prod/app1"]["files"] == ["deployment.yaml", "service.yaml"]
+    assert cached["types"]["prod/app1/service.yaml"]["type"] is None
+
+    # Listings of unchanged directories come from the cache
+    cached["dirs"]["prod/app1"]["files"] = ["deployment.yaml"]
+    cached["types"]["prod/app2/kustomization.yaml"]["type"] = "kubernetes"
+    with open(workdir / ".nautikos" / "discovery.json", "w") as f:
+        json.dump(cached, f)
+    (workdir / "prod" / "app3").mkdir()
+    (workdir / "prod" / "app3" / "deployment.yaml").write_text(DEPLOYMENT)
+    discovery = Discovery(workdir)
+    discovery.load()
+    prod = discovery.expand(config["environments"])[0]["manifests"]
+    assert [(m["path"], m["type"]) for m in prod] == [
+        ("prod/app1/deployment.yaml", "kubernetes"),
+        ("prod/app2/kustomization.yaml", "kubernetes"),
+        ("prod/app3/deployment.yaml", "kubernetes"),
+    ]
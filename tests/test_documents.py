@@ -0,0 +1,178 @@
+import os
+import tempfile
+
+import pytest
+
+from nautikos.manifests import KubernetesManifest, Modification, split_documents
+
+INPUT = """# Bundle
+---
+apiVersion: v1
+kind: Service
+metadata:
+  name: "service"   # Not modified
+--- # Deployment
+apiVersion: apps/v1
+kind: Deployment
+spec:
+  template:
+    spec:
+      containers:
+      - image: some-repository:1.0.0 # Inline comment
+---
+apiVersion: apps/v1
+kind: Deployment
+spec:
+  template:
+    spec:
+      containers:
+      - image:   some-other-repository:1.2.3
+---
+"""
+
+OUTPUT = """# Bundle
+---
+apiVersion: v1
+kind: Service
+metadata:
+  name: "service"   # Not modified
+--- # Deployment
+apiVersion: apps/v1
+kind: Deployment
+spec:
+  template:
+    spec:
+      containers:
+      - image: some-repository:1.1   # Inline comment
+---
+apiVersion: apps/v1
+kind: Deployment
+spec:
+  template:
+    spec:
+      containers:
+      - image:   some-other-repository:1.2.3
+---
+"""
+
+
+@pytest.mark.parametrize(
+    "text",
+    [INPUT, "", "a: 1\n", "---\na: 1\n", "--- {a: 1}\n--- |\n  b\n", "a: '---'\n"],
+)
+def test_split_documents(text: str):
+    documents = split_documents(text)
+    assert "".join(d.header + d.body for d in documents) == text
+
+
+def test_split_documents_headers():
+    headers = [d.header for d in split_documents(INPUT)]
+    assert headers == ["", "---\n", "--- # Deployment\n", "---\n", "---\n"]
+
+
+@pytest.mark.parametrize(
+    "mode,expected",
+    [
+        ("dump", OUTPUT),
+        ("patch", INPUT.replace("some-repository:1.0.0", "some-repository:1.1")),
+    ],
+)
+def test_multiple_documents(mode: str, expected: str):
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "bundle.yaml")
+        with open(path, "w") as f:
+            f.write(INPUT)
+        manifest = KubernetesManifest(path)
+        manifest.load()
+        manifest.modify("some-repository", "1.1")
+        manifest.write(mode)
+        with open(path, "r") as f:
+            assert f.read() == expected
+        assert manifest.modifications == [
+            Modification(path, "some-repository", "1.0.0", "1.1")
+        ]
+        assert manifest.get_images() == [
+            {"repository": "some-repository", "tag": "1.1"},
+            {"repository": "some-other-repository", "tag": "1.2.3"},
+        ]
+
+
+def test_only_matching_documents_are_parsed():
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "bundle.yaml")
+        with open(path, "w") as f:
+            f.write(INPUT)
+        manifest = KubernetesManifest(path)
+        manifest.load()
+        manifest.modify("some-repository", "1.1")
+        assert [d.images is not None for d in manifest.documents] == [
+            False,
+            False,
+            True,
+            False,
+            False,
+        ]
+        assert [d.data is not None for d in manifest.documents] == [
+            False,
+            False,
+            True,
+            False,
+            False,
+        ]
+
+
+@pytest.mark.parametrize("mode", ["dump", "patch"])
+def test_crlf_line_breaks(mode: str):
+    # Escapes can't be patched, so the document is dumped in both modes
+    text = INPUT.replace("some-repository:1.0.0", '"some-repository\\x3a1.0.0"')
+    text = text.replace("\n", "\r\n")
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "bundle.yaml")
+        with open(path, "wb") as f:
+            f.write(text.encode())
+        manifest = KubernetesManifest(path)
+        manifest.load()
+        manifest.modify("some-repository", "1.1")
+        manifest.write(mode)
+        with open(path, "rb") as f:
+            content = f.read()
+        assert b"some-repository:1.1" in content
+        assert content.count(b"\n") == content.count(b"\r\n")
+
+
+def test_document_end_markers():
+    text = "a: 1\n...\n---\nspec:\n  containers:\n  - image: repo:1.0\n... # End\n"
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "bundle.yaml")
+        with open(path, "w") as f:
+            f.write(text)
+        manifest = KubernetesManifest(path)
+        manifest.load()
+        manifest.modify("repo", "2.0")
+        manifest.write("dump")
+        with open(path, "r") as f:
+            assert f.read() == text.replace("repo:1.0", "repo:2.0")
+
+
+@pytest.mark.parametrize("mode", ["dump", "patch"])
+def test_up_to_date_documents_are_kept(mode: str):
+    up_to_date = (
+        'spec:\n  containers:\n  - image:   "repo:2.0"\n    args: ["a",   "b"]\n'
+    )
+    stale = "spec:\n  containers:\n  - image: repo:1.0\n"
+    text = f"{up_to_date}---\n{stale}"
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "bundle.yaml")
+        with open(path, "w") as f:
+            f.write(text)
+        manifest = KubernetesManifest(path)
+        manifest.load()
+        manifest.modify("repo", "2.0")
+        assert [d.edits != [] for d in manifest.documents] == [False, True]
+        manifest.write(mode)
+        with open(path, "r") as f:
+            assert f.read() == text.replace("repo:1.0", "repo:2.0")
+        assert manifest.modifications == [
+            Modification(path, "repo", "2.0", "2.0"),
+            Modification(path, "repo", "1.0", "2.0"),
+        ]
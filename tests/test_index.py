@@ -0,0 +1,173 @@
+import os
+
+import pytest
+from conftest import record_calls, write
+
+from nautikos.index import ManifestIndex
+from nautikos.manifests import KubernetesManifest
+from nautikos.nautikos import Nautikos
+
+CONFIG_FILE = """environments:
+- name: prod
+  manifests:
+  - path: app1.yaml
+    type: kubernetes
+  - path: app2.yaml
+    type: kubernetes
+"""
+APP1_MANIFEST = """spec:
+  template:
+    spec:
+      containers:
+      - image: my-repo:1.0
+"""
+APP2_MANIFEST = """spec:
+  template:
+    spec:
+      containers:
+      - image: my-other-repo:1.0
+"""
+
+
+FILES = {
+    "nautikos.yaml": CONFIG_FILE,
+    "app1.yaml": APP1_MANIFEST,
+    "app2.yaml": APP2_MANIFEST,
+}
+
+
+def test_lookup(workdir: str):
+    index = ManifestIndex(workdir)
+    index.load()
+    assert index.lookup("app1.yaml", "kubernetes") is None
+    index.update("app1.yaml", "kubernetes", [{"repository": "my-repo", "tag": "1.0"}])
+    index.save()
+
+    index = ManifestIndex(workdir)
+    index.load()
+    assert index.lookup("app1.yaml", "kubernetes") == [
+        {"repository": "my-repo", "tag": "1.0"}
+    ]
+    assert index.lookup("app1.yaml", "kustomize") is None
+
+
+def test_lookup_touched_file(workdir: str):
+    index = ManifestIndex(workdir)
+    index.update("app1.yaml", "kubernetes", [{"repository": "my-repo", "tag": "1.0"}])
+    path = os.path.join(workdir, "app1.yaml")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert index.lookup("app1.yaml", "kubernetes") is not None
+
+
+def test_lookup_changed_file(workdir: str):
+    index = ManifestIndex(workdir)
+    index.update("app1.yaml", "kubernetes", [{"repository": "my-repo", "tag": "1.0"}])
+    with open(os.path.join(workdir, "app1.yaml"), "w") as f:
+        f.write(APP1_MANIFEST.replace("1.0", "2.0"))
+    assert index.lookup("app1.yaml", "kubernetes") is None
+
+
+def _count_loads(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    return record_calls(
+        monkeypatch,
+        KubernetesManifest,
+        "load",
+        lambda self: os.path.basename(self.path),
+    )
+
+
+def test_skips_unrelated_manifests(workdir: str, monkeypatch: pytest.MonkeyPatch):
+    loaded = _count_loads(monkeypatch)
+    nautikos = Nautikos()
+    nautikos.load_config(os.path.join(workdir, "nautikos.yaml"))
+    nautikos.update_manifests("my-other-repo", "1.1")
+    assert loaded == ["app2.yaml"]
+    nautikos.update_manifests("my-repo", "1.1")
+    assert loaded == ["app2.yaml", "app1.yaml"]
+    assert nautikos.stats.skipped_by_prefilter == 1
+    assert nautikos.stats.skipped_by_index == 1
+
+    loaded.clear()
+    nautikos.update_manifests("my-repo", "1.2")
+    assert loaded == ["app1.yaml"]
+    assert nautikos.stats.skipped_by_index == 2
+    assert [mod.previous for mod in nautikos.modifications] == ["1.0", "1.0", "1.1"]
+
+
+def test_no_index(workdir: str, monkeypatch: pytest.MonkeyPatch):
+    loaded = _count_loads(monkeypatch)
+    nautikos = Nautikos()
+    nautikos.set_use_index(False)
+    nautikos.load_config(os.path.join(workdir, "nautikos.yaml"))
+    nautikos.update_manifests("my-repo", "1.1")
+    nautikos.update_manifests("my-repo", "1.2")
+    assert loaded == ["app1.yaml", "app1.yaml"]
+    assert nautikos.stats.skipped_by_prefilter == 2
+    assert not os.path.exists(os.path.join(workdir, ".nautikos", "index.json"))
+
+
+def test_dry_run_from_index(workdir: str, monkeypatch: pytest.MonkeyPatch):
+    nautikos = Nautikos()
+    nautikos.set_dry_run(True)
+    nautikos.load_config(os.path.join(workdir, "nautikos.yaml"))
+    nautikos.update_manifests("my-repo", "1.1")
+    assert nautikos.stats.parsed == 1
+
+    loaded = _count_loads(monkeypatch)
+    nautikos.update_manifests("my-repo", "1.1")
+    assert loaded == []
+    assert nautikos.stats.resolved_by_index == 1
+    assert nautikos.modifications[0] == nautikos.modifications[1]
+
+
+def test_renamed_kustomize_image(workdir: str):
+    with open(os.path.join(workdir, "nautikos.yaml"), "w") as f:
+        f.write(
+            "environments:\n- name: prod\n  manifests:\n"
+            "  - path: kustomization.yaml\n    type: kustomize\n"
+        )
+    with open(os.path.join(workdir, "kustomization.yaml"), "w") as f:
+        f.write(
+            "images:\n- name: my-repo\n  newName: mirror/my-repo\n  newTag: '1.0'\n"
+        )
+    nautikos = Nautikos()
+    nautikos.load_config(os.path.join(workdir, "nautikos.yaml"))
+    nautikos.update_manifests("mirror/my-repo", "1.0")
+    # The index lists the image under its original name too, so it isn't skipped
+    nautikos.update_manifests("my-repo", "2.0")
+    assert nautikos.stats.skipped_by_index == 0
+    assert [m.repository for m in nautikos.modifications if m.updated] == ["my-repo"]
+
+
+def test_renamed_kustomize_image_is_modified_once(workdir: str):
+    write(
+        workdir,
+        "nautikos.yaml",
+        "environments:\n- name: prod\n  manifests:\n"
+        "  - path: kustomization.yaml\n    type: kustomize\n",
+    )
+    write(
+        workdir,
+        "kustomization.yaml",
+        "images:\n- name: my-repo\n  newName: mirror/my-repo\n  newTag: '1.0'\n",
+    )
+
+    def run(tags: dict[str, str], use_index: bool = True) -> Nautikos:
+        nautikos = Nautikos()
+        nautikos.set_dry_run(True)
+        nautikos.set_use_index(use_index)
+        nautikos.load_config(os.path.join(workdir, "nautikos.yaml"))
+        nautikos.update_manifests_batch(tags)
+        return nautikos
+
+    # Parsed, resolved from the index, and resolved by the fast scan
+    tags = {"my-repo": "1.0", "mirror/my-repo": "2.0"}
+    cold, warm = run(tags), run(tags)
+    scanned = run({"my-repo": "1.0", "mirror/my-repo": "1.0"}, use_index=False)
+    assert (cold.stats.parsed, warm.stats.resolved_by_index) == (1, 1)
+    assert scanned.stats.resolved_by_scan == 1
+    for nautikos, new in [(cold, "2.0"), (warm, "2.0"), (scanned, "1.0")]:
+        assert [(m.repository, m.previous, m.new) for m in nautikos.modifications] == [
+            ("mirror/my-repo", "1.0", new)
+        ]
@@ -110,3 +110,74 @@ class TestKubernetesManifest:
         with open(file_path, "r") as f:
             s = f.read()
         assert s == OUTPUT
+
+
+def test_prefilter(file_path: str):
+    manifest = KubernetesManifest(file_path)
+    assert manifest.prefilter(["some-other-repository"])
+    assert manifest.prefilter(["unknown-repository", "some-repository"])
+    assert not manifest.prefilter(["unknown-repository"])
+
+
+def test_write_patch(workdir: str):
+    path = os.path.join(workdir, "patch.yaml")
+    with open(path, "w") as f:
+        f.write(INPUT)
+    manifest = KubernetesManifest(path)
+    manifest.load()
+    manifest.modify("some-repository", "1.1")
+    manifest.write("patch")
+    with open(path, "r") as f:
+        s = f.read()
+    assert s == INPUT.replace("some-repository:1.0.0", "some-repository:1.1").replace(
+        "image: some-repository\n", "image: some-repository:1.1\n"
+    )
+
+
+def test_registry_port_and_digest(workdir: str):
+    digest, new_digest = "sha256:" + "a" * 64, "sha256:" + "b" * 64
+    path = os.path.join(workdir, "registry.yaml")
+    with open(path, "w") as f:
+        f.write(
+            f"""spec:
+  template:
+    spec:
+      containers:
+      - image: registry:5000/app:1.2
+      - image: registry:5000/other:1.0@{digest}
+      - image: registry:5000/pinned@{digest}
+"""
+        )
+    manifest = KubernetesManifest(path)
+    manifest.load()
+    manifest.modify_batch(
+        {
+            "registry:5000/app": "1.3",
+            "registry:5000/other": "1.1",
+            "registry:5000/pinned": new_digest,
+        }
+    )
+    manifest.write("patch")
+    with open(path, "r") as f:
+        s = f.read()
+    assert "image: registry:5000/app:1.3\n" in s
+    assert "image: registry:5000/other:1.1\n" in s
+    assert f"image: registry:5000/pinned@{new_digest}\n" in s
+    assert [m.previous for m in manifest.modifications] == ["1.2", digest, digest]
+
+
+def test_scan_images(workdir: str):
+    path = os.path.join(workdir, "scan.yaml")
+    with open(path, "w") as f:
+        f.write(INPUT + "---\n" + INPUT.replace("1.0.0", "2.0.0"))
+    manifest = KubernetesManifest(path)
+    assert manifest.scan_images() == [
+        {"repository": "some-repository", "tag": "1.0.0"},
+        {"repository": "some-repository", "tag": None},
+        {"repository": "some-other-repository", "tag": "1.2.3"},
+        {"repository": "some-repository", "tag": "2.0.0"},
+        {"repository": "some-repository", "tag": None},
+        {"repository": "some-other-repository", "tag": "1.2.3"},
+    ]
+    manifest.load()
+    assert manifest.scan_images() == manifest.get_images()
@@ -0,0 +1,145 @@
+import os
+
+import pytest
+from conftest import read, record_calls, write
+
+from nautikos.kustomize import KustomizeGraph
+from nautikos.nautikos import Nautikos
+from nautikos.store import Counts
+
+FILES = {
+    "nautikos.yaml": """environments:
+- name: prod
+  manifests:
+  - path: overlays/prod/kustomization.yaml
+    type: kustomize
+- name: dev
+  manifests:
+  - path: overlays/dev/kustomization.yaml
+    type: kustomize
+""",
+    "base/kustomization.yaml": """resources:
+- deployment.yaml
+- https://example.com/remote.yaml
+""",
+    "base/deployment.yaml": """kind: Deployment
+spec:
+  template:
+    spec:
+      containers:
+      - image: repo-a:1.0
+      - image: repo-b:1.0
+""",
+    "components/sidecar/kustomization.yaml": """kind: Component
+patches:
+- path: patch.yaml
+- patch: |-
+    - op: remove
+      path: /spec/replicas
+""",
+    "components/sidecar/patch.yaml": """kind: Deployment
+spec:
+  template:
+    spec:
+      containers:
+      - image: repo-c:1.0
+""",
+    "overlays/prod/kustomization.yaml": """resources:
+- ../../base
+components:
+- ../../components/sidecar
+images:
+- name: repo-b
+  newTag: '2.0'
+""",
+    "overlays/dev/kustomization.yaml": """resources:
+- ../../base
+""",
+}
+
+
+def test_locate(workdir: str):
+    graph = KustomizeGraph(workdir)
+    located = graph.locate(
+        "overlays/prod/kustomization.yaml", {"repo-a", "repo-b", "repo-c"}
+    )
+    assert located == {
+        "overlays/prod/kustomization.yaml": {"repo-b"},
+        "base/deployment.yaml": {"repo-a", "repo-c"},
+        "components/sidecar/patch.yaml": {"repo-a", "repo-c"},
+    }
+    assert "base/kustomization.yaml" in graph
+    assert "base/deployment.yaml" not in graph
+
+
+def test_shared_bases_are_parsed_once(workdir: str, monkeypatch: pytest.MonkeyPatch):
+    parsed = record_calls(
+        monkeypatch, KustomizeGraph, "_parse", lambda self, path, data: path
+    )
+    graph = KustomizeGraph(workdir)
+    for overlay in ("prod", "dev", "prod"):
+        graph.locate(f"overlays/{overlay}/kustomization.yaml", {"repo-a"})
+    assert sorted(parsed) == [
+        "base/kustomization.yaml",
+        "components/sidecar/kustomization.yaml",
+        "overlays/dev/kustomization.yaml",
+        "overlays/prod/kustomization.yaml",
+    ]
+
+
+def test_cycle(workdir: str):
+    write(workdir, "base/kustomization.yaml", "resources:\n- ../overlays/dev\n")
+    graph = KustomizeGraph(workdir)
+    with pytest.raises(Exception, match="cycle: overlays/dev/kustomization.yaml -> "):
+        graph.locate("overlays/dev/kustomization.yaml", {"repo-a"})
+
+
+@pytest.mark.parametrize(
+    "repository, environment, changed",
+    [
+        ("repo-b", "prod", "overlays/prod/kustomization.yaml"),
+        ("repo-b", "dev", "base/deployment.yaml"),
+        ("repo-c", "prod", "components/sidecar/patch.yaml"),
+    ],
+)
+def test_update(workdir: str, repository: str, environment: str, changed: str):
+    nautikos = Nautikos()
+    nautikos.set_resolve_kustomize(True)
+    nautikos.load_config(os.path.join(workdir, "nautikos.yaml"))
+    nautikos.update_manifests(repository, "3.0", environment=environment)
+    assert nautikos.errors == []
+    assert [os.path.relpath(mod.path, workdir) for mod in nautikos.modifications] == [
+        changed
+    ]
+    for name, content in FILES.items():
+        if name == changed:
+            assert read(workdir, name) != content
+            assert "3.0" in read(workdir, name)
+        else:
+            assert read(workdir, name) == content
+
+
+def test_update_cycle(workdir: str):
+    write(workdir, "base/kustomization.yaml", "resources:\n- ../overlays/dev\n")
+    nautikos = Nautikos()
+    nautikos.set_resolve_kustomize(True)
+    nautikos.load_config(os.path.join(workdir, "nautikos.yaml"))
+    nautikos.update_manifests("repo-b", "3.0")
+    assert [error.path for error in nautikos.errors] == [
+        os.path.join(workdir, "overlays/dev/kustomization.yaml")
+    ]
+    assert "overlays/prod/kustomization.yaml" in nautikos.modifications[0].path
+
+
+def test_update_summary(workdir: str):
+    nautikos = Nautikos()
+    nautikos.set_resolve_kustomize(True)
+    nautikos.load_config(os.path.join(workdir, "nautikos.yaml"))
+    nautikos.update_manifests("repo-a", "3.0")
+    # The base is updated once, and counts for both overlays that include it
+    assert len(nautikos.modifications) == 1
+    assert nautikos.modifications.summary.total == Counts(updated=1)
+    assert nautikos.modifications.summary.environments == {
+        "prod": Counts(updated=1),
+        "dev": Counts(updated=1),
+    }
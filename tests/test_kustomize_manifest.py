@@ -19,6 +19,9 @@ patchesStrategicMerge:
 - ingress.yml
 """
 
+DIGEST_A = "sha256:" + "0" * 64
+DIGEST_B = "sha256:" + "1" * 64
+
 OUTPUT = """# Comment
 resources:
 - ../some/path
@@ -74,3 +77,82 @@ class TestKustomizeManifest:
                 new="1.1",
             )
         ]
+
+
+def test_write_patch(workdir: str):
+    path = os.path.join(workdir, "patch.yaml")
+    with open(path, "w") as f:
+        f.write(INPUT)
+    manifest = KustomizeManifest(path)
+    manifest.load()
+    manifest.modify("some-repository", "1.1")
+    manifest.write("patch")
+    with open(path, "r") as f:
+        s = f.read()
+    assert s == INPUT.replace("'1.0.0'", "'1.1'")
+
+
+def test_new_name_and_digest(workdir: str):
+    path = os.path.join(workdir, "renamed.yaml")
+    with open(path, "w") as f:
+        f.write(
+            f"""images:
+- name: some-repository
+  newName: registry.example.com/some-repository
+  newTag: 1.0.0
+- name: some-other-repository
+  digest: {DIGEST_A}
+"""
+        )
+    manifest = KustomizeManifest(path)
+    manifest.load()
+    # A renamed image is listed under both names
+    assert manifest.get_images() == [
+        {"repository": "registry.example.com/some-repository", "tag": "1.0.0"},
+        {"repository": "some-repository", "tag": "1.0.0", "alias": True},
+        {"repository": "some-other-repository", "tag": DIGEST_A},
+    ]
+    manifest.modify_batch(
+        {
+            "some-repository": "2.0",
+            "registry.example.com/some-repository": DIGEST_B,
+            "some-other-repository": "1.1",
+        }
+    )
+    manifest.write()
+    assert [(m.repository, m.previous, m.new) for m in manifest.modifications] == [
+        ("registry.example.com/some-repository", "1.0.0", DIGEST_B),
+        ("some-other-repository", DIGEST_A, "1.1"),
+    ]
+    with open(path, "r") as f:
+        assert f.read() == (
+            f"""images:
+- name: some-repository
+  newName: registry.example.com/some-repository
+  digest: {DIGEST_B}
+- name: some-other-repository
+  newTag: '1.1'
+"""
+        )
+
+
+def test_original_name(workdir: str):
+    path = os.path.join(workdir, "renamed.yaml")
+    with open(path, "w") as f:
+        f.write(
+            """images:
+- name: some-repository
+  newName: registry.example.com/some-repository
+  newTag: 1.0.0
+"""
+        )
+    manifest = KustomizeManifest(path)
+    assert manifest.prefilter(["some-repository"])
+    manifest.load()
+    manifest.modify("some-repository", "2.0")
+    manifest.write("patch")
+    assert [(m.repository, m.previous, m.new) for m in manifest.modifications] == [
+        ("some-repository", "1.0.0", "2.0"),
+    ]
+    with open(path, "r") as f:
+        assert "newTag: '2.0'" in f.read()
@@ -0,0 +1,196 @@
+import os
+import pathlib
+import shutil
+import tempfile
+from typing import Generator, Union
+
+import pytest
+
+from nautikos import manifests
+from nautikos.manifests import Modification, get_manifest
+from nautikos.nautikos import Nautikos
+from nautikos.pipeline import ManifestTask, process_manifest
+from nautikos.yaml import has_libyaml, load_text, resolve_loader
+
+LOADERS = [
+    pytest.param(
+        "libyaml", marks=pytest.mark.skipif(not has_libyaml(), reason="no libyaml")
+    ),
+    "ruamel",
+]
+
+KUBERNETES = """# Comment
+kind: Deployment
+spec:
+  template:
+    spec:
+      containers:
+      - image: repo-a:1.0  # Comment
+      - image: "repo-b:1.10"
+---
+kind: List
+items:
+- kind: Pod
+  spec:
+    containers:
+    - image: 'repo-c'
+"""
+KUSTOMIZE = """images:
+- name: repo-a
+  newTag: '1.0'
+- name: repo-b
+  newName: repo-c
+  newTag: 1.0
+- name: repo-d
+  digest: sha256:0000
+"""
+# The text of these differs from what the round-trip loader reads
+NOT_TEXT = [
+    ("kustomize", "images:\n- name: repo-a\n  newTag: 1.10\n"),
+    ("kustomize", "images:\n- name: repo-a\n  newTag: '1.0'\n  digest: null\n"),
+    ("kustomize", "images:\n- name: repo-a\n  newTag: !!float 1\n"),
+    ("kustomize", "kind: ~\nimages:\n- name: repo-a\n"),
+    ("kubernetes", "spec:\n  containers:\n  - image: 12\n"),
+    ("kubernetes", "spec:\n  containers:\n  - image:\n"),
+]
+MERGE_KEY = (
+    "kubernetes",
+    "base: &base\n  image: repo-a\nspec:\n  containers:\n  - <<: *base\n",
+)
+
+
+def round_trip_images(manifest_type: str, content: str) -> list:
+    manifest = get_manifest("manifest.yaml", manifest_type, raw=content.encode())
+    manifest.load()
+    return manifest.get_images()
+
+
+@pytest.mark.parametrize("loader", LOADERS)
+@pytest.mark.parametrize(
+    "manifest_type, content", [("kubernetes", KUBERNETES), ("kustomize", KUSTOMIZE)]
+)
+def test_scan(loader: str, manifest_type: str, content: str):
+    manifest = get_manifest("manifest.yaml", manifest_type, raw=content.encode())
+    assert manifest.scan(loader) == round_trip_images(manifest_type, content)
+
+
+@pytest.mark.parametrize("loader", LOADERS)
+@pytest.mark.parametrize("manifest_type, content", [*NOT_TEXT, MERGE_KEY])
+def test_scan_not_text(loader: str, manifest_type: str, content: str):
+    manifest = get_manifest("manifest.yaml", manifest_type, raw=content.encode())
+    assert manifest.scan(loader) is None
+    assert manifest.scan_images(loader) == round_trip_images(manifest_type, content)
+
+
+@pytest.mark.parametrize("loader", LOADERS)
+def test_load_text(loader: str):
+    assert load_text(b"a: 1\nb: [~, x]\n---\nc:\n", loader) == [
+        {"a": "1", "b": ["~", "x"]},
+        {"c": ""},
+    ]
+
+
+def test_resolve_loader():
+    assert resolve_loader("auto") == ("libyaml" if has_libyaml() else "ruamel")
+    with pytest.raises(Exception):
+        resolve_loader("pyyaml")
+
+
+def process(
+    loader: str, manifest_type: str, content: str, tags: dict[str, str]
+) -> tuple[Union[bytes, None], list[Modification], bool]:
+    task = ManifestTask(
+        "manifest.yaml", manifest_type, pathlib.Path("."), tags, loader=loader
+    )
+    result = process_manifest(task, raw=content.encode())
+    assert result.error is None
+    return result.content, result.modifications, result.resolved_by_scan
+
+
+@pytest.mark.parametrize("loader", LOADERS)
+@pytest.mark.parametrize(
+    "manifest_type, content",
+    [("kubernetes", KUBERNETES), ("kustomize", KUSTOMIZE), *NOT_TEXT],
+)
+@pytest.mark.parametrize(
+    "tags", [{"repo-a": "1.0"}, {"repo-a": "2.0"}, {"repo-c": "1.0", "repo-b": "3"}]
+)
+def test_same_output(
+    loader: str, manifest_type: str, content: str, tags: dict[str, str]
+):
+    # Without the fast loader, every manifest is loaded for modification
+    manifest = get_manifest("manifest.yaml", manifest_type, raw=content.encode())
+    manifest.load()
+    manifest.modify_batch(tags)
+    expected = None
+    if any(mod.updated for mod in manifest.modifications):
+        expected = manifest.apply_edits()
+    new, modifications, _ = process(loader, manifest_type, content, tags)
+    assert new == expected
+    assert modifications == manifest.modifications
+
+
+@pytest.mark.parametrize("loader", LOADERS)
+def test_up_to_date_not_loaded(loader: str, monkeypatch: pytest.MonkeyPatch):
+    def no_yaml() -> None:
+        raise AssertionError("an up to date manifest shouldn't be loaded")
+
+    monkeypatch.setattr(manifests, "get_yaml", no_yaml)
+    new, modifications, resolved = process(
+        loader, "kubernetes", KUBERNETES, {"repo-a": "1.0", "repo-b": "1.10"}
+    )
+    assert resolved
+    assert new is None
+    assert [(mod.repository, mod.previous) for mod in modifications] == [
+        ("repo-a", "1.0"),
+        ("repo-b", "1.10"),
+    ]
+
+
+CONFIG_FILE = """environments:
+- name: prod
+  manifests:
+  - path: deployment.yaml
+    type: kubernetes
+  - path: kustomization.yaml
+    type: kustomize
+"""
+
+
+@pytest.fixture
+def workdir() -> Generator[str, None, None]:
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, content in [
+            ("nautikos.yaml", CONFIG_FILE),
+            ("deployment.yaml", KUBERNETES),
+            ("kustomization.yaml", KUSTOMIZE),
+        ]:
+            with open(os.path.join(workdir, name), "w") as f:
+                f.write(content)
+        yield workdir
+
+
+def update(workdir: str, loader: str) -> tuple[list[str], list[tuple[str, ...]]]:
+    nautikos = Nautikos()
+    nautikos.set_loader(loader)
+    nautikos.set_use_index(False)
+    nautikos.load_config(os.path.join(workdir, "nautikos.yaml"))
+    nautikos.update_manifests_batch({"repo-a": "1.0", "repo-c": "2.0"})
+    contents = []
+    for name in ("deployment.yaml", "kustomization.yaml"):
+        with open(os.path.join(workdir, name)) as f:
+            contents.append(f.read())
+    modifications: list[tuple[str, ...]] = [
+        (os.path.basename(mod.path), mod.repository, mod.previous, mod.new)
+        for mod in nautikos.modifications
+    ]
+    return contents, modifications
+
+
+def test_update_with_loaders(workdir: str):
+    other = os.path.join(workdir, "other")
+    shutil.copytree(workdir, other)
+    contents, modifications = update(workdir, "ruamel")
+    assert "repo-c:2.0" in contents[0]
+    assert "2.0" in contents[1]
+    assert update(other, "auto") == (contents, modifications)
@@ -0,0 +1,104 @@
+import os
+import tempfile
+from typing import Any
+
+import pytest
+
+from nautikos.locators import find_image_holders
+from nautikos.manifests import KubernetesManifest
+from nautikos.yaml import get_yaml
+
+POD_SPEC = {
+    "initContainers": [{"name": "init", "image": "init:1"}],
+    "containers": [{"name": "app", "image": "app:1"}, {"name": "no-image"}],
+    "ephemeralContainers": [{"name": "debug", "image": "debug:1"}],
+}
+IMAGES = ["init:1", "app:1", "debug:1"]
+CRONJOB = """kind: CronJob
+spec:
+  jobTemplate:
+    spec:
+      template:
+        spec:
+          initContainers:
+          - image: my-repo:1.0
+          containers:
+          - image: my-repo:1.0
+"""
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"kind": "Pod", "spec": POD_SPEC},
+        {"kind": "Deployment", "spec": {"template": {"spec": POD_SPEC}}},
+        {"kind": "StatefulSet", "spec": {"template": {"spec": POD_SPEC}}},
+        {
+            "kind": "CronJob",
+            "spec": {"jobTemplate": {"spec": {"template": {"spec": POD_SPEC}}}},
+        },
+        {"kind": "PodTemplate", "template": {"spec": POD_SPEC}},
+        # Unknown kinds are walked
+        {"kind": "Rollout", "spec": {"template": {"spec": POD_SPEC}}},
+        {"spec": {"template": {"spec": POD_SPEC}}},
+    ],
+)
+def test_find_containers(data: Any):
+    assert [c["image"] for c in find_image_holders(data)] == IMAGES
+
+
+def test_find_containers_in_list():
+    data = {
+        "kind": "List",
+        "items": [
+            {"kind": "Service", "spec": {"ports": []}},
+            {"kind": "Pod", "spec": POD_SPEC},
+            {"kind": "Job", "spec": {"template": {"spec": POD_SPEC}}},
+        ],
+    }
+    assert [c["image"] for c in find_image_holders(data)] == IMAGES * 2
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        None,
+        "text",
+        {"kind": "Service", "spec": {"ports": [{"port": 80}]}},
+        {"kind": "Deployment", "spec": None},
+        {"kind": "Deployment", "spec": {"template": {"spec": {"containers": "x"}}}},
+    ],
+)
+def test_find_no_containers(data: Any):
+    assert find_image_holders(data) == []
+
+
+def test_find_kustomize_images():
+    data = {"images": [{"name": "a", "newTag": "1"}, "invalid"]}
+    assert find_image_holders(data, default_kind="Kustomization") == [
+        {"name": "a", "newTag": "1"}
+    ]
+
+
+def test_walk_is_bounded():
+    data: Any = {"containers": [{"image": "deep:1"}]}
+    for _ in range(20):
+        data = {"nested": data}
+    assert find_image_holders(data) == []
+
+
+def test_modify_cronjob():
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "cronjob.yaml")
+        with open(path, "w") as f:
+            f.write(CRONJOB)
+        manifest = KubernetesManifest(path)
+        manifest.load()
+        manifest.modify("my-repo", "2.0")
+        manifest.write()
+        with open(path, "r") as f:
+            data = get_yaml().load(f)
+    spec = data["spec"]["jobTemplate"]["spec"]["template"]["spec"]
+    assert spec["initContainers"][0]["image"] == "my-repo:2.0"
+    assert spec["containers"][0]["image"] == "my-repo:2.0"
+    assert len(manifest.modifications) == 2
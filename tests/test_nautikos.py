@@ -1,3 +1,4 @@
+import asyncio
 import os
 import pathlib
 import tempfile
@@ -8,6 +9,8 @@ import pytest
 from ruamel.yaml import YAML
 
 from nautikos.nautikos import Modification, Nautikos
+from nautikos.store import ModificationStore
+from nautikos.timings import TimingEvent, Timings
 
 CONFIG_FILE = """environments: 
 - name: prod 
@@ -261,3 +264,184 @@ class TestModifyMultipleLabels(BaseTest):
     @pytest.fixture(autouse=True, scope="class")
     def modify(self, nautikos: Nautikos) -> None:
         nautikos.update_manifests("my-repo", "1.2.3", labels=["app1", "refs/head/dev"])
+
+
+class TestModifyBatch(BaseTest):
+    TAGS = {
+        "prod_app_1": ("1.2.3", "2.0", "1.0"),
+        "prod_app_2": ("1.2.3", "2.0", "1.0"),
+        "dev_app_1": ("1.0", "1.0", "1.0"),
+        "dev_app_1_feature_a": ("1.0", "1.0", "1.0"),
+    }
+    MODIFICATIONS = [
+        {
+            "path": "prod/app1/deployment.yaml",
+            "repository": "my-repo",
+            "previous": "1.0",
+            "new": "1.2.3",
+        },
+        {
+            "path": "prod/app1/deployment.yaml",
+            "repository": "my-other-repo",
+            "previous": "1.0",
+            "new": "2.0",
+        },
+        {
+            "path": "prod/app2/kustomize.yaml",
+            "repository": "my-repo",
+            "previous": "1.0",
+            "new": "1.2.3",
+        },
+        {
+            "path": "prod/app2/kustomize.yaml",
+            "repository": "my-other-repo",
+            "previous": "1.0",
+            "new": "2.0",
+        },
+    ]
+
+    @pytest.fixture(autouse=True, scope="class")
+    def modify(self, nautikos: Nautikos) -> None:
+        nautikos.update_manifests_batch(
+            {"my-repo": "1.2.3", "my-other-repo": "2.0"}, environment="prod"
+        )
+
+
+class TestModifyAllParallel(TestModifyAll):
+    @pytest.fixture(autouse=True, scope="class")
+    def modify(self, nautikos: Nautikos) -> None:
+        nautikos.set_jobs(2)
+        nautikos.update_manifests("my-repo", "1.2.3")
+
+
+class TestModifyErrors(BaseTest):
+    TAGS = TestModifyAll.TAGS
+    MODIFICATIONS = TestModifyAll.MODIFICATIONS
+
+    @pytest.fixture(autouse=True, scope="class")
+    def modify(self, nautikos: Nautikos, workdir: str) -> None:
+        create_file(
+            os.path.join(workdir, "prod", "app1"), "broken.yaml", "spec: [my-repo\n"
+        )
+        config = CONFIG_FILE.replace(
+            "  manifests: \n",
+            "  manifests: \n  - path: prod/app1/broken.yaml\n    type: kubernetes\n",
+            1,
+        )
+        config += "  - path: dev/missing.yaml\n    type: kubernetes\n"
+        create_file(workdir, "nautikos-errors.yaml", config)
+        nautikos.load_config(os.path.join(workdir, "nautikos-errors.yaml"))
+        nautikos.set_jobs(2)
+        nautikos.update_manifests("my-repo", "1.2.3")
+
+    def test_errors(self, nautikos: Nautikos, workdir: str) -> None:
+        assert [error.path for error in nautikos.errors] == [
+            str(pathlib.Path(workdir) / "prod/app1/broken.yaml"),
+            str(pathlib.Path(workdir) / "dev/missing.yaml"),
+        ]
+
+
+class TestModifyLabelExpression(BaseTest):
+    TAGS = {
+        "prod_app_1": ("1.0", "1.0", "1.0"),
+        "prod_app_2": ("1.0", "1.0", "1.0"),
+        "dev_app_1": ("1.0", "1.0", "1.0"),
+        "dev_app_1_feature_a": ("1.2.3", "1.0", "1.0"),
+    }
+    MODIFICATIONS = [
+        {
+            "path": "dev/app1/feature-A/deployment.yaml",
+            "repository": "my-repo",
+            "previous": "1.0",
+            "new": "1.2.3",
+        }
+    ]
+
+    @pytest.fixture(autouse=True, scope="class")
+    def modify(self, nautikos: Nautikos) -> None:
+        nautikos.update_manifests(
+            "my-repo",
+            "1.2.3",
+            labels=["app1", "!refs/head/main", "!refs/head/dev|app2"],
+        )
+
+
+class TestModifyAllTimings(TestModifyAll):
+    EVENTS: list[TimingEvent] = []
+    TIMINGS = Timings()
+
+    @pytest.fixture(autouse=True, scope="class")
+    def modify(self, nautikos: Nautikos, workdir: str) -> None:
+        nautikos.add_hook(self.EVENTS.append)
+        nautikos.add_hook(self.TIMINGS)
+        nautikos.load_config(os.path.join(workdir, "nautikos.yaml"))
+        nautikos.update_manifests("my-repo", "1.2.3")
+
+    def test_events(self, workdir: str) -> None:
+        phases = [event.phase for event in self.EVENTS]
+        assert phases[:4] == ["load_config", "discover", "select", "index"]
+        assert phases[-2:] == ["commit", "index"]
+        path = str(pathlib.Path(workdir) / "prod/app1/deployment.yaml")
+        assert [e.phase for e in self.EVENTS if e.path == path] == [
+            "read",
+            "scan",
+            "load",
+            "modify",
+            "render",
+        ]
+
+    def test_timings(self) -> None:
+        assert self.TIMINGS.counts["render"] == 4
+        assert self.TIMINGS.counts["commit"] == 1
+        assert self.TIMINGS.bytes_read > 0
+        assert self.TIMINGS.bytes_written > 0
+        assert self.TIMINGS.files_skipped == 0
+        assert "modify" in str(self.TIMINGS)
+
+
+class TestModifyAllIter(TestModifyAll):
+    ITEMS: list = []
+
+    @pytest.fixture(autouse=True, scope="class")
+    def modify(self, nautikos: Nautikos) -> None:
+        self.ITEMS.extend(nautikos.iter_updates({"my-repo": "1.2.3"}))
+
+    def test_modifications(self, nautikos: Nautikos, workdir: str) -> None:
+        assert nautikos.modifications == []
+        nautikos._modifications = ModificationStore(self.ITEMS)
+        super().test_modifications(nautikos, workdir)
+        assert nautikos.stats.parsed == 4
+
+
+class TestModifyAllAsync(TestModifyAll):
+    @pytest.fixture(autouse=True, scope="class")
+    def modify(self, nautikos: Nautikos) -> None:
+        nautikos.set_concurrency(2)
+        asyncio.run(nautikos.update_manifests_async("my-repo", "1.2.3"))
+
+    def test_no_temporary_files(self, workdir: str) -> None:
+        for _, _, files in os.walk(workdir):
+            assert not [name for name in files if name.endswith(".tmp")]
+
+
+class TestStatus:
+    def test_status(self, nautikos: Nautikos) -> None:
+        images = nautikos.get_status("my-repo")
+        assert [(i.environment, i.path, i.tag) for i in images] == [
+            ("prod", "prod/app1/deployment.yaml", "1.0"),
+            ("prod", "prod/app2/kustomize.yaml", "1.0"),
+            ("dev", "dev/app1/deployment.yaml", "1.0"),
+            ("dev", "dev/app1/feature-A/deployment.yaml", "1.0"),
+        ]
+        assert images[0].labels == ["app1", "refs/head/main"]
+        assert nautikos.stats.parsed == 4
+
+    def test_status_from_index(self, nautikos: Nautikos) -> None:
+        images = nautikos.get_status(environment="dev", labels=["refs/head/dev"])
+        assert [(i.repository, i.tag) for i in images] == [
+            ("my-repo", "1.0"),
+            ("my-other-repo", "1.0"),
+            ("some-other-repo", "1.0"),
+        ]
+        assert nautikos.stats.parsed == 4
+        assert nautikos.stats.resolved_by_index == 1
@@ -0,0 +1,51 @@
+import pytest
+
+from nautikos.patch import Edit, patch
+
+INPUT = """a: plain  # Comment
+b: 'single ''quoted'''
+c: "double"
+d: {e: flow}
+"""
+
+
+@pytest.mark.parametrize(
+    "edit,expected",
+    [
+        (Edit(0, 3, "plain", "new"), "a: new  # Comment"),
+        (Edit(0, 3, "plain", "1.0"), "a: '1.0'  # Comment"),
+        (Edit(0, 3, "plain", "x: y"), "a: 'x: y'  # Comment"),
+        (Edit(1, 3, "single 'quoted'", "it's"), "b: 'it''s'"),
+        (Edit(2, 3, "double", "new"), 'c: "new"'),
+        (Edit(3, 7, "flow", "new"), "d: {e: new}"),
+        (Edit(3, 7, "flow", "a,b"), "d: {e: 'a,b'}"),
+    ],
+)
+def test_patch(edit: Edit, expected: str):
+    result = patch(INPUT, [edit])
+    assert result is not None
+    line = result.splitlines()[edit.line]
+    assert line == expected
+    assert result.splitlines()[: edit.line] == INPUT.splitlines()[: edit.line]
+
+
+@pytest.mark.parametrize(
+    "edit",
+    [
+        Edit(0, 3, "other", "new"),  # Old value doesn't match
+        Edit(0, 3, "pla", "new"),  # Old value is only a prefix
+        Edit(2, 3, "double", 'with "quotes"'),  # Can't be written double-quoted
+        Edit(3, 7, "flo", "new"),  # Old value is only a prefix, in a flow mapping
+        Edit(10, 0, "plain", "new"),  # Line out of range
+        Edit(-1, -1, "plain", "new"),  # Position unknown
+    ],
+)
+def test_patch_not_located(edit: Edit):
+    assert patch(INPUT, [edit]) is None
+
+
+def test_patch_multiple():
+    result = patch(
+        INPUT, [Edit(0, 3, "plain", "first"), Edit(2, 3, "double", "second")]
+    )
+    assert result == INPUT.replace("plain", "first").replace("double", "second")
@@ -0,0 +1,133 @@
+import os
+
+import pytest
+from conftest import read, write
+
+from nautikos import manifests, patch
+from nautikos.manifests import KubernetesManifest, KustomizeManifest
+from nautikos.nautikos import Nautikos
+from nautikos.plan import (
+    Plan,
+    PlannedEdit,
+    apply_plan,
+    read_plan,
+    splice,
+    write_plan,
+)
+
+CONFIG_FILE = """environments:
+- name: prod
+  manifests:
+  - path: deployment.yaml
+    type: kubernetes
+  - path: kustomization.yaml
+    type: kustomize
+"""
+KUBERNETES_MANIFEST = """# Käse
+spec:
+  template:
+    spec:
+      containers:
+      - image: repo-a:1.0  # Comment
+      - image: "repo-b:1.0"
+---
+kind: Pod
+spec:
+  containers:
+  - image: repo-a:1.0
+"""
+KUSTOMIZE_MANIFEST = """images:
+- name: repo-a
+  newTag: '1.0'
+- name: repo-b
+  digest: sha256:{digest}
+""".format(
+    digest="a" * 64
+)
+
+
+FILES = {
+    "nautikos.yaml": CONFIG_FILE,
+    "deployment.yaml": KUBERNETES_MANIFEST,
+    "kustomization.yaml": KUSTOMIZE_MANIFEST,
+}
+
+
+def test_splices(workdir: str):
+    path = os.path.join(workdir, "deployment.yaml")
+    manifest = KubernetesManifest(path)
+    manifest.load()
+    manifest.modify_batch({"repo-a": "2.0", "repo-b": "2.0"})
+    splices = manifest.get_splices("patch")
+    edits = [PlannedEdit(s.start, s.end, s.text) for s in splices]
+    assert len(edits) == 3
+    new = splice(manifest.read(), edits)
+    manifest.write("patch")
+    assert new.decode() == read(workdir, "deployment.yaml")
+
+
+def test_splices_of_removed_keys(workdir: str):
+    # Setting a tag removes the digest, which can only be dumped
+    path = os.path.join(workdir, "kustomization.yaml")
+    manifest = KustomizeManifest(path)
+    manifest.load()
+    manifest.modify_batch({"repo-a": "2.0", "repo-b": "2.0"})
+    edits = [PlannedEdit(s.start, s.end, s.text) for s in manifest.get_splices()]
+    new = splice(manifest.read(), edits)
+    manifest.write()
+    assert new.decode() == read(workdir, "kustomization.yaml")
+
+
+def update_and_plan(workdir: str, write_mode: str) -> tuple[str, str, Plan]:
+    """Returns the results of an update, and a plan for it made beforehand"""
+    config = os.path.join(workdir, "nautikos.yaml")
+    tags = {"repo-a": "2.0", "repo-b": "2.0"}
+    nautikos = Nautikos()
+    nautikos.set_write_mode(write_mode)
+    nautikos.load_config(config)
+    plan = nautikos.make_plan(tags, "2 repositories")
+    assert len(nautikos.modifications) == 5
+    assert read(workdir, "deployment.yaml") == KUBERNETES_MANIFEST
+
+    nautikos = Nautikos()
+    nautikos.set_write_mode(write_mode)
+    nautikos.load_config(config)
+    nautikos.update_manifests_batch(tags)
+    deployment = read(workdir, "deployment.yaml")
+    kustomization = read(workdir, "kustomization.yaml")
+    write(workdir, "deployment.yaml", KUBERNETES_MANIFEST)
+    write(workdir, "kustomization.yaml", KUSTOMIZE_MANIFEST)
+    return deployment, kustomization, plan
+
+
+@pytest.mark.parametrize("write_mode", ["dump", "patch"])
+def test_apply(workdir: str, write_mode: str, monkeypatch: pytest.MonkeyPatch):
+    deployment, kustomization, plan = update_and_plan(workdir, write_mode)
+    path = os.path.join(workdir, "plan.json")
+    write_plan(path, plan)
+
+    def no_yaml() -> None:
+        raise AssertionError("applying a plan shouldn't parse YAML")
+
+    for module in (manifests, patch):
+        for name in ("get_yaml", "get_safe_yaml"):
+            monkeypatch.setattr(module, name, no_yaml, raising=False)
+    modifications, errors = apply_plan(read_plan(path), workdir)
+    assert errors == []
+    assert modifications == plan.modifications
+    assert read(workdir, "deployment.yaml") == deployment
+    assert read(workdir, "kustomization.yaml") == kustomization
+
+
+def test_apply_changed_file(workdir: str):
+    _, kustomization, plan = update_and_plan(workdir, "patch")
+    write(workdir, "deployment.yaml", KUBERNETES_MANIFEST.replace("Comment", "Changed"))
+    modifications, errors = apply_plan(plan, workdir)
+    assert [os.path.basename(error.path) for error in errors] == ["deployment.yaml"]
+    assert "changed since the plan was made" in errors[0].message
+    assert [os.path.basename(mod.path) for mod in modifications] == [
+        "kustomization.yaml",
+        "kustomization.yaml",
+    ]
+    assert "Changed" in read(workdir, "deployment.yaml")
+    assert read(workdir, "kustomization.yaml") == kustomization
@@ -0,0 +1,54 @@
+from typing import Union
+
+import pytest
+
+from nautikos.references import Reference, is_digest, parse_reference
+
+DIGEST = "sha256:" + "a" * 64
+
+
+@pytest.mark.parametrize(
+    "image,registry,path,tag,digest",
+    [
+        ("app", None, "app", None, None),
+        ("app:1.2", None, "app", "1.2", None),
+        ("team/app:1.2", None, "team/app", "1.2", None),
+        ("registry:5000/app:1.2", "registry:5000", "app", "1.2", None),
+        ("localhost/app", "localhost", "app", None, None),
+        ("localhost:5000/team/app", "localhost:5000", "team/app", None, None),
+        ("my.registry.io/team/app:v1", "my.registry.io", "team/app", "v1", None),
+        (f"app@{DIGEST}", None, "app", None, DIGEST),
+        (f"registry:5000/app:1.2@{DIGEST}", "registry:5000", "app", "1.2", DIGEST),
+        ("[::1]:5000/app:1", "[::1]:5000", "app", "1", None),
+        # Invalid references are split loosely
+        ("MyApp:1.0", None, "MyApp", "1.0", None),
+        ("{{ .Values.image }}", None, "{{ .Values.image }}", None, None),
+    ],
+)
+def test_parse_reference(
+    image: str,
+    registry: Union[str, None],
+    path: str,
+    tag: Union[str, None],
+    digest: Union[str, None],
+):
+    reference = parse_reference(image)
+    assert reference == Reference(registry, path, tag, digest)
+    assert str(reference) == image
+
+
+def test_repository():
+    assert parse_reference("registry:5000/app:1.2").repository == "registry:5000/app"
+    assert parse_reference("team/app:1.2").repository == "team/app"
+
+
+def test_parse_reference_is_cached():
+    assert parse_reference("registry:5000/app:1.2") is parse_reference(
+        "registry:5000/app:1.2"
+    )
+
+
+def test_is_digest():
+    assert is_digest(DIGEST)
+    assert not is_digest("1.2.3")
+    assert not is_digest("sha256:abc")
@@ -0,0 +1,50 @@
+from typing import Union
+
+import pytest
+
+from nautikos.config import EnvironmentConfig
+from nautikos.selection import SelectionIndex
+
+ENVIRONMENTS: list[EnvironmentConfig] = [
+    {
+        "name": "prod",
+        "manifests": [
+            {"path": "prod/app1", "type": "kubernetes", "labels": ["app1", "refs/heads/main"]},  # type: ignore # noqa: E501
+            {"path": "prod/app2", "type": "kustomize"},  # type: ignore
+        ],
+    },
+    {
+        "name": "dev",
+        "manifests": [
+            {"path": "dev/app1", "type": "kubernetes", "labels": ["app1", "refs/heads/dev"]},  # type: ignore # noqa: E501
+            {"path": "dev/app2", "type": "kubernetes", "labels": ["app2", "refs/heads/feature-A"]},  # type: ignore # noqa: E501
+        ],
+    },
+]
+
+
+@pytest.mark.parametrize(
+    "environment,labels,expected",
+    [
+        (None, None, ["prod/app1", "prod/app2", "dev/app1", "dev/app2"]),
+        ("prod", None, ["prod/app1", "prod/app2"]),
+        ("staging", None, []),
+        (None, ["app1"], ["prod/app1", "dev/app1"]),
+        (None, ["app1", "refs/heads/dev"], ["dev/app1"]),
+        ("prod", ["app1", "refs/heads/dev"], []),
+        (None, ["app1|app2"], ["prod/app1", "dev/app1", "dev/app2"]),
+        (None, ["!app1"], ["prod/app2", "dev/app2"]),
+        (None, ["refs/heads/*"], ["prod/app1", "dev/app1", "dev/app2"]),
+        (None, ["refs/heads/*", "!refs/heads/main"], ["dev/app1", "dev/app2"]),
+        (None, ["refs/heads/feature-*|app1"], ["prod/app1", "dev/app1", "dev/app2"]),
+        ("dev", ["!refs/heads/feature-*"], ["dev/app1"]),
+        (None, ["unknown*"], []),
+    ],
+)
+def test_select(
+    environment: Union[str, None],
+    labels: Union[list[str], None],
+    expected: list[str],
+):
+    index = SelectionIndex(ENVIRONMENTS)
+    assert [m["path"] for m in index.select(environment, labels)] == expected
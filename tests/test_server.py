@@ -0,0 +1,167 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from typing import Any, Generator
+
+import pytest
+from conftest import read, record_calls
+
+from nautikos.server import Updater, UpdateRequest, make_server
+from nautikos.writer import StagedWriter
+
+CONFIG_FILE = """environments:
+- name: prod
+  manifests:
+  - path: deployment.yaml
+    type: kubernetes
+  - path: kustomization.yaml
+    type: kustomize
+"""
+KUBERNETES_MANIFEST = """spec:
+  template:
+    spec:
+      containers:
+      - image: repo-a:1.0
+      - image: repo-b:1.0
+      - image: repo-c:1.0
+"""
+KUSTOMIZE_MANIFEST = """images:
+- name: repo-a
+  newTag: '1.0'
+"""
+
+
+FILES = {
+    "nautikos.yaml": CONFIG_FILE,
+    "deployment.yaml": KUBERNETES_MANIFEST,
+    "kustomization.yaml": KUSTOMIZE_MANIFEST,
+}
+
+
+@pytest.fixture()
+def updater(workdir: str) -> Updater:
+    return Updater(os.path.join(workdir, "nautikos.yaml"), window=0.01)
+
+
+@pytest.fixture()
+def url(updater: Updater) -> Generator[str, None, None]:
+    server = make_server(updater, port=0)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+    )
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"  # type: ignore
+    server.shutdown()
+    server.server_close()
+
+
+def post(url: str, body: Any) -> tuple[int, Any]:
+    request = urllib.request.Request(
+        f"{url}/update", data=json.dumps(body).encode(), method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def test_update(url: str, workdir: str):
+    status, body = post(url, {"repository": "repo-a", "tag": "2.0", "env": "prod"})
+    assert status == 200
+    assert [(m["path"], m["previous"], m["new"]) for m in body["modifications"]] == [
+        (os.path.join(workdir, "deployment.yaml"), "1.0", "2.0"),
+        (os.path.join(workdir, "kustomization.yaml"), "1.0", "2.0"),
+    ]
+    assert "repo-a:2.0" in read(workdir, "deployment.yaml")
+
+
+def test_update_dry_run(url: str, workdir: str):
+    status, body = post(url, {"repository": "repo-a", "tag": "2.0", "dry_run": True})
+    assert status == 200
+    assert len(body["modifications"]) == 2
+    assert read(workdir, "deployment.yaml") == KUBERNETES_MANIFEST
+
+
+def test_update_not_found(url: str):
+    status, body = post(url, {"repository": "repo-x", "tag": "2.0"})
+    assert status == 404
+    assert body["modifications"] == []
+
+
+def test_invalid_request(url: str):
+    status, body = post(url, {"repository": "repo-a"})
+    assert status == 400
+
+
+def test_external_change(url: str, workdir: str):
+    post(url, {"repository": "repo-a", "tag": "2.0"})
+    with open(os.path.join(workdir, "deployment.yaml"), "w") as f:
+        f.write(KUBERNETES_MANIFEST.replace("repo-a:1.0", "repo-a:3.0"))
+    status, body = post(url, {"repository": "repo-a", "tag": "4.0"})
+    assert body["modifications"][0]["previous"] == "3.0"
+
+
+def test_coalesced_writes(workdir: str, monkeypatch: pytest.MonkeyPatch):
+    updater = Updater(os.path.join(workdir, "nautikos.yaml"), window=0.2)
+    writes = record_calls(
+        monkeypatch,
+        StagedWriter,
+        "stage",
+        lambda self, path, content: os.path.basename(path),
+    )
+    threads = [
+        threading.Thread(
+            target=updater.submit, args=(UpdateRequest({repository: "2.0"}),)
+        )
+        for repository in ("repo-a", "repo-b", "repo-c")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(writes) == ["deployment.yaml", "kustomization.yaml"]
+    assert read(workdir, "deployment.yaml") == KUBERNETES_MANIFEST.replace("1.0", "2.0")
+
+
+def test_unix_socket(updater: Updater):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "nautikos.sock")
+        server = make_server(updater, socket=path)
+        thread = threading.Thread(
+            target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+        )
+        thread.start()
+        try:
+            body = json.dumps({"repository": "repo-b", "tag": "2.0"}).encode()
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.connect(path)
+                client.sendall(
+                    b"POST /update HTTP/1.0\r\nContent-Length: "
+                    + str(len(body)).encode()
+                    + b"\r\n\r\n"
+                    + body
+                )
+                response = b""
+                while chunk := client.recv(4096):
+                    response += chunk
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert response.startswith(b"HTTP/1.0 200")
+
+
+def test_socket_replaces_only_sockets(updater: Updater, workdir: str):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "nautikos.sock")
+        # A socket left behind by an earlier server is replaced
+        make_server(updater, socket=path).server_close()
+        make_server(updater, socket=path).server_close()
+    config = os.path.join(workdir, "nautikos.yaml")
+    with pytest.raises(FileExistsError):
+        make_server(updater, socket=config)
+    assert read(workdir, "nautikos.yaml") == CONFIG_FILE
@@ -0,0 +1,124 @@
+import os
+import pathlib
+
+import pytest
+from conftest import read, record_calls, write
+
+from nautikos.manifests import AbstractManifest
+from nautikos.session import ManifestCache, Session
+from nautikos.writer import StagedWriter
+
+CONFIG_FILE = """environments:
+- name: prod
+  manifests:
+  - path: deployment.yaml
+    type: kubernetes
+  - path: kustomization.yaml
+    type: kustomize
+"""
+KUBERNETES_MANIFEST = """spec:
+  template:
+    spec:
+      containers:
+      - image: repo-a:1.0
+      - image: repo-b:1.0
+"""
+KUSTOMIZE_MANIFEST = """images:
+- name: repo-a
+  newTag: '1.0'
+"""
+
+
+FILES = {
+    "nautikos.yaml": CONFIG_FILE,
+    "deployment.yaml": KUBERNETES_MANIFEST,
+    "kustomization.yaml": KUSTOMIZE_MANIFEST,
+}
+
+
+def test_many_updates_parse_and_write_once(
+    workdir: str, monkeypatch: pytest.MonkeyPatch
+):
+    loads = record_calls(
+        monkeypatch, AbstractManifest, "load", lambda self: os.path.basename(self.path)
+    )
+    staged = record_calls(
+        monkeypatch,
+        StagedWriter,
+        "stage",
+        lambda self, path, content: os.path.basename(path),
+    )
+    with Session(os.path.join(workdir, "nautikos.yaml")) as session:
+        for i in range(100):
+            result = session.update_manifests("repo-b", f"{i}.0")
+            assert [(mod.previous, mod.new) for mod in result.modifications] == [
+                (f"{i - 1}.0" if i else "1.0", f"{i}.0")
+            ]
+        assert read(workdir, "deployment.yaml") == KUBERNETES_MANIFEST
+        assert session.dirty == [os.path.join(workdir, "deployment.yaml")]
+    assert loads == ["deployment.yaml", "kustomization.yaml"]
+    assert staged == ["deployment.yaml"]
+    assert read(workdir, "deployment.yaml") == KUBERNETES_MANIFEST.replace(
+        "repo-b:1.0", "repo-b:99.0"
+    )
+    assert session.dirty == []
+
+
+def test_dry_run(workdir: str):
+    session = Session(os.path.join(workdir, "nautikos.yaml"))
+    session.update_manifests("repo-a", "2.0")
+    result = session.update_manifests("repo-a", "3.0", dry_run=True)
+    assert [mod.previous for mod in result.modifications] == ["2.0", "2.0"]
+    assert session.flush() == []
+    assert "repo-a:2.0" in read(workdir, "deployment.yaml")
+
+
+def test_manifest_in_several_environments(workdir: str):
+    write(
+        workdir,
+        "nautikos.yaml",
+        CONFIG_FILE + "- name: dev\n  manifests:\n"
+        "  - path: deployment.yaml\n    type: kubernetes\n",
+    )
+    session = Session(os.path.join(workdir, "nautikos.yaml"))
+    for dry_run in (True, False):
+        result = session.update_manifests("repo-b", "2.0", dry_run=dry_run)
+        assert [(mod.previous, mod.new) for mod in result.modifications] == [
+            ("1.0", "2.0")
+        ]
+
+
+def test_external_change(workdir: str):
+    session = Session(os.path.join(workdir, "nautikos.yaml"))
+    session.update_manifests("repo-a", "2.0")
+    assert session.flush() == []
+    write(workdir, "deployment.yaml", KUBERNETES_MANIFEST.replace("1.0", "3.0"))
+    result = session.update_manifests("repo-a", "4.0")
+    assert result.modifications[0].previous == "3.0"
+
+
+def test_conflicting_change(workdir: str):
+    session = Session(os.path.join(workdir, "nautikos.yaml"))
+    session.update_manifests("repo-a", "2.0")
+    write(workdir, "deployment.yaml", "# changed\n" + KUBERNETES_MANIFEST)
+    errors = session.flush()
+    assert [os.path.basename(error.path) for error in errors] == ["deployment.yaml"]
+    assert read(workdir, "deployment.yaml") == "# changed\n" + KUBERNETES_MANIFEST
+    assert "newTag: '2.0'" in read(workdir, "kustomization.yaml")
+
+
+def test_cache_eviction(workdir: str):
+    cache = ManifestCache(max_size=1)
+    deployment = pathlib.Path(workdir, "deployment.yaml")
+    kustomization = pathlib.Path(workdir, "kustomization.yaml")
+    entry = cache.get(deployment, "kubernetes")
+    assert cache.get(deployment, "kubernetes") is entry
+    cache.get(kustomization, "kustomize")
+    assert len(cache) == 1
+    assert cache.get(deployment, "kubernetes") is not entry
+    assert cache.loads == 3
+
+    # Manifests with unwritten modifications are kept
+    cache.get(deployment, "kubernetes").dirty = True
+    cache.get(kustomization, "kustomize")
+    assert len(cache) == 2
@@ -0,0 +1,101 @@
+import os
+import tempfile
+
+import pytest
+
+from nautikos.config import ManifestConfig
+from nautikos.manifests import Modification
+from nautikos.nautikos import Statistics
+from nautikos.pipeline import ManifestError
+from nautikos.results import RunResults, merge_results, read_results, write_results
+from nautikos.sharding import assign_shard, fingerprint, parse_shard, select_shard
+from nautikos.store import Counts, Summary
+
+
+def manifest(path: str) -> ManifestConfig:
+    return {
+        "path": path,
+        "type": "kubernetes",
+        "labels": [],
+        "repositories": [],
+        "ignore": [],
+    }
+
+
+MANIFESTS = [manifest(f"{i}.yaml") for i in range(100)]
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+    for value in ("0/4", "5/4", "2", "a/b"):
+        with pytest.raises(Exception, match="not a correct shard"):
+            parse_shard(value)
+
+
+def test_spread():
+    shards = [assign_shard(m["path"], 4) for m in MANIFESTS]
+    assert all(shards.count(shard) > 10 for shard in (1, 2, 3, 4))
+
+
+def test_select_shard():
+    # A manifest in several environments is in a single shard
+    manifests = MANIFESTS + [manifest("0.yaml")]
+    selected = [select_shard(manifests, (i, 4)) for i in range(1, 5)]
+    assert sorted(m["path"] for s in selected for m in s) == sorted(
+        m["path"] for m in manifests
+    )
+    assert [[m["path"] for m in s].count("0.yaml") for s in selected].count(2) == 1
+    # Regardless of the order of the config
+    assert select_shard(manifests[::-1], (2, 4)) == selected[1][::-1]
+    assert select_shard(manifests, (1, 1)) == manifests
+
+
+def results(shard: int, count: int = 2) -> RunResults:
+    return RunResults(
+        target="'repo' to '2.0'",
+        modifications=[Modification(f"{shard}.yaml", "repo", "1.0", "2.0")],
+        errors=[ManifestError(f"{shard}.yaml", "broken")] if shard == 2 else [],
+        stats=Statistics(parsed=shard),
+        summary=Summary(Counts(1), {"prod": Counts(1)}, {f"app-{shard}": Counts(1)}),
+        shard=(shard, count),
+        selection=fingerprint(f"{i}.yaml" for i in range(1, count + 1)),
+        paths=[f"{shard}.yaml"],
+    )
+
+
+def test_merge_results():
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "results.json")
+        write_results(path, results(2))
+        read = read_results(path)
+    assert read == results(2)
+    merged = merge_results([read, results(1)])
+    assert merged.paths == ["1.yaml", "2.yaml"]
+    assert [mod.path for mod in merged.modifications] == ["1.yaml", "2.yaml"]
+    assert merged.errors == [ManifestError("2.yaml", "broken")]
+    assert merged.stats.parsed == 3
+    assert merged.summary == Summary(
+        Counts(2), {"prod": Counts(2)}, {"app-1": Counts(1), "app-2": Counts(1)}
+    )
+
+
+def test_merge_incomplete_results():
+    with pytest.raises(Exception, match=r"missing: \[2\]"):
+        merge_results([results(1, 3), results(3, 3)])
+    with pytest.raises(Exception, match="different numbers of shards"):
+        merge_results([results(1), results(2, 3)])
+    with pytest.raises(Exception, match=r"duplicate: \[1\]"):
+        merge_results([results(1), results(1)])
+
+
+def test_merge_results_of_other_manifests():
+    gap, overlap, other = results(2), results(2), results(2)
+    gap.paths = []
+    overlap.paths = ["1.yaml", "2.yaml"]
+    other.selection = fingerprint(["1.yaml", "3.yaml"])
+    with pytest.raises(Exception, match="don't cover all selected manifests"):
+        merge_results([results(1), gap])
+    with pytest.raises(Exception, match=r"several shards: \['1.yaml'\]"):
+        merge_results([results(1), overlap])
+    with pytest.raises(Exception, match="selected different manifests"):
+        merge_results([results(1), other])
@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Union
+
+# Upper bound for importing the CLI on top of typer, relative to importing typer
+# itself; it takes about 0.3 to 0.4 times as long, and the whole import takes 1.4
+# times as long as typer, so a regression of 40% would be about 0.95
+IMPORT_BUDGET = 0.6
+# Imports are timed several times, and the fastest counts, as timings are noisy
+IMPORT_RUNS = 5
+
+CONFIG_FILE = """environments:
+- name: prod
+  manifests:
+  - path: deployment.yaml
+    type: kubernetes
+"""
+KUBERNETES_MANIFEST = """spec:
+  template:
+    spec:
+      containers:
+      - image: my-repo:1.0
+"""
+
+
+def _imported_modules(
+    code: str, *args: str, env: Union[dict[str, str], None] = None
+) -> dict[str, int]:
+    """Runs code in a new interpreter, and returns cumulative import times in µs"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code, *args],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    modules: dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line[len("import time:") :].split("|")
+            if cumulative.strip().isdigit():
+                modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def test_import_cli():
+    modules = _imported_modules("import nautikos.cli")
+    assert "nautikos.cli" in modules
+    assert not [m for m in modules if m.startswith("ruamel")]
+    assert "concurrent.futures.process" not in modules
+    # Modules that only some commands need are imported by those commands
+    assert not [
+        m
+        for m in modules
+        if m.split(".")[-1]
+        in ("discovery", "kustomize", "plan", "results", "sharding", "status", "store")
+    ]
+    assert "nautikos.writer" not in modules
+
+
+def test_import_cli_budget():
+    with tempfile.TemporaryDirectory() as cache:
+        # Timed with compiled modules, as installed packages have them
+        env = {**os.environ, "PYTHONPYCACHEPREFIX": cache}
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        _imported_modules("import nautikos.cli", env=env)
+        # Timed in the same interpreter, so both are as slow as the machine is then
+        runs = [
+            _imported_modules("import typer; import nautikos.cli", env=env)
+            for _ in range(IMPORT_RUNS)
+        ]
+        typer = min(modules["typer"] for modules in runs)
+        cli = min(modules["nautikos.cli"] for modules in runs)
+        assert cli < typer * IMPORT_BUDGET
+
+
+def test_dry_run_from_index():
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, content in [
+            ("nautikos.yaml", CONFIG_FILE),
+            ("deployment.yaml", KUBERNETES_MANIFEST),
+        ]:
+            with open(os.path.join(workdir, name), "w") as f:
+                f.write(content)
+        code = "import sys; from nautikos.cli import app; app(sys.argv[1:])"
+        args = ["my-repo", "1.1", "--dry-run", "--config"]
+        args.append(os.path.join(workdir, "nautikos.yaml"))
+
+        # First run parses the config and manifest, and fills the caches
+        modules = _imported_modules(code, *args)
+        assert "ruamel.yaml" in modules
+
+        modules = _imported_modules(code, *args)
+        assert not [m for m in modules if m.startswith("ruamel")]
@@ -0,0 +1,121 @@
+import json
+import os
+import tempfile
+from typing import Generator
+
+import pytest
+from typer.testing import CliRunner
+
+from nautikos import cli
+from nautikos.manifests import Modification
+from nautikos.nautikos import Nautikos
+from nautikos.store import Counts, ModificationStore
+
+MODIFICATIONS = [
+    Modification("prod/app.yaml", "repo-a", "1.0", "2.0"),
+    Modification("prod/app.yaml", "repo-b", "2.0", "2.0"),
+    Modification("dev/app.yaml", "repo-a", "2.0", "2.0"),
+]
+
+
+def test_store():
+    store = ModificationStore(MODIFICATIONS)
+    assert len(store) == 3
+    assert store == MODIFICATIONS
+    assert list(store) == MODIFICATIONS
+    assert store[0] == MODIFICATIONS[0]
+    assert store[-1] == MODIFICATIONS[-1]
+    assert store[1:] == MODIFICATIONS[1:]
+    with pytest.raises(IndexError):
+        store[3]
+    # Strings are stored once
+    assert store[0].path is store[1].path
+    assert store[1].previous is store[1].new
+    assert store != MODIFICATIONS[:2]
+    assert ModificationStore() == []
+
+
+def test_summary():
+    store = ModificationStore(keep=False)
+    store.append(MODIFICATIONS[0], ["prod"], ["app", "team-a"])
+    store.append(MODIFICATIONS[1], ["prod"], ["app"])
+    store.append(MODIFICATIONS[2], ["dev", "test"], ["app"])
+    assert len(store) == 0
+    assert store.summary.total == Counts(updated=1, up_to_date=2)
+    assert store.summary.environments == {
+        "prod": Counts(1, 1),
+        "dev": Counts(0, 1),
+        "test": Counts(0, 1),
+    }
+    assert store.summary.labels == {"app": Counts(1, 2), "team-a": Counts(1, 0)}
+    assert store.summary.to_dict()["environments"]["prod"] == {
+        "found": 2,
+        "updated": 1,
+        "up_to_date": 1,
+    }
+
+
+CONFIG_FILE = """environments:
+- name: prod
+  manifests:
+  - path: app.yaml
+    type: kubernetes
+    labels: [app]
+  - path: other.yaml
+    type: kubernetes
+    labels: [other]
+- name: dev
+  manifests:
+  - path: app.yaml
+    type: kubernetes
+    labels: [app, dev]
+"""
+APP_MANIFEST = "spec:\n  containers:\n  - image: repo-a:1.0\n  - image: repo-b:2.0\n"
+OTHER_MANIFEST = "spec:\n  containers:\n  - image: repo-a:2.0\n"
+
+
+@pytest.fixture
+def config() -> Generator[str, None, None]:
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, content in [
+            ("nautikos.yaml", CONFIG_FILE),
+            ("app.yaml", APP_MANIFEST),
+            ("other.yaml", OTHER_MANIFEST),
+        ]:
+            with open(os.path.join(workdir, name), "w") as f:
+                f.write(content)
+        yield os.path.join(workdir, "nautikos.yaml")
+
+
+def test_update_summary(config: str):
+    nautikos = Nautikos()
+    nautikos.load_config(config)
+    nautikos.update_manifests_batch({"repo-a": "2.0", "repo-b": "2.0"})
+    summary = nautikos.modifications.summary
+    # The manifest in both environments is processed once, and counts for both
+    assert len(nautikos.modifications) == 3
+    assert nautikos.stats.parsed == 1
+    assert summary.total == Counts(updated=1, up_to_date=2)
+    assert summary.environments == {"prod": Counts(1, 2), "dev": Counts(1, 1)}
+    assert summary.labels == {
+        "app": Counts(1, 1),
+        "dev": Counts(1, 1),
+        "other": Counts(0, 1),
+    }
+    with open(os.path.join(os.path.dirname(config), "app.yaml")) as f:
+        assert f.read() == APP_MANIFEST.replace("repo-a:1.0", "repo-a:2.0")
+
+
+def test_cli_summary(config: str):
+    cli._nautikos = None
+    result = CliRunner().invoke(
+        cli.app,
+        ["repo-a", "2.0", "--config", config, "--env", "dev", "--output", "ndjson"],
+    )
+    cli._nautikos = None
+    summary = json.loads(result.stdout.splitlines()[-1])
+    assert summary["environments"] == {
+        "dev": {"found": 1, "updated": 1, "up_to_date": 0}
+    }
+    assert summary["labels"]["app"]["updated"] == 1
+    assert result.exit_code == 0
@@ -0,0 +1,149 @@
+import os
+import pathlib
+import stat
+import tempfile
+from typing import Generator
+
+import pytest
+
+from nautikos import writer
+from nautikos.nautikos import Nautikos
+from nautikos.writer import CommitError, StagedWriter, write_atomic
+
+MANIFEST = """spec:
+  template:
+    spec:
+      containers:
+      - image: my-repo:1.0
+"""
+CONFIG_FILE = """environments:
+- name: prod
+  manifests:
+  - path: a.yaml
+    type: kubernetes
+  - path: b.yaml
+    type: kubernetes
+"""
+
+
+@pytest.fixture()
+def workdir() -> Generator[pathlib.Path, None, None]:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = pathlib.Path(tmp)
+        (root / "nautikos.yaml").write_text(CONFIG_FILE)
+        (root / "a.yaml").write_text(MANIFEST)
+        (root / "b.yaml").write_text(MANIFEST)
+        yield root
+
+
+def test_write_atomic_keeps_permissions(workdir: pathlib.Path):
+    path = workdir / "a.yaml"
+    os.chmod(path, 0o600)
+    write_atomic(path, b"new")
+    assert path.read_bytes() == b"new"
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert not [name for name in os.listdir(workdir) if name.endswith(".tmp")]
+
+
+def test_commit(workdir: pathlib.Path):
+    staged_writer = StagedWriter(fsync=True)
+    staged_writer.stage(workdir / "a.yaml", b"new")
+    staged_writer.stage(workdir / "b.yaml", MANIFEST.encode())
+    mtime_ns = os.stat(workdir / "b.yaml").st_mtime_ns
+    assert staged_writer.commit() == 3
+    assert (workdir / "a.yaml").read_bytes() == b"new"
+    # Unchanged files aren't written
+    assert os.stat(workdir / "b.yaml").st_mtime_ns == mtime_ns
+    assert staged_writer.staged == []
+
+
+def test_commit_rolls_back(workdir: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    replace = os.replace
+    calls = []
+
+    def failing_replace(src, dst):
+        calls.append(dst)
+        if len(calls) == 2:
+            raise OSError("disk full")
+        replace(src, dst)
+
+    monkeypatch.setattr(writer.os, "replace", failing_replace)
+    staged_writer = StagedWriter()
+    staged_writer.stage(workdir / "a.yaml", b"new a")
+    staged_writer.stage(workdir / "b.yaml", b"new b")
+    with pytest.raises(CommitError, match="b.yaml: disk full"):
+        staged_writer.commit()
+    assert (workdir / "a.yaml").read_text() == MANIFEST
+    assert (workdir / "b.yaml").read_text() == MANIFEST
+    assert not [name for name in os.listdir(workdir) if name.endswith(".tmp")]
+
+
+def test_update_without_changes_doesnt_write(workdir: pathlib.Path):
+    mtime_ns = os.stat(workdir / "a.yaml").st_mtime_ns
+    nautikos = Nautikos()
+    nautikos.load_config(str(workdir / "nautikos.yaml"))
+    nautikos.update_manifests("my-repo", "1.0")
+    assert len(nautikos.modifications) == 2
+    assert not any(mod.updated for mod in nautikos.modifications)
+    assert os.stat(workdir / "a.yaml").st_mtime_ns == mtime_ns
+
+
+def test_update_rolls_back(workdir: pathlib.Path, monkeypatch: pytest.MonkeyPatch):
+    replace = os.replace
+
+    def failing_replace(src, dst):
+        if str(dst).endswith("b.yaml"):
+            raise OSError("disk full")
+        replace(src, dst)
+
+    monkeypatch.setattr(writer.os, "replace", failing_replace)
+    nautikos = Nautikos()
+    nautikos.load_config(str(workdir / "nautikos.yaml"))
+    nautikos.update_manifests("my-repo", "2.0")
+    assert [str(error) for error in nautikos.errors] == [
+        f"{workdir / 'a.yaml'} -> ERROR - not written, as writing "
+        f"{workdir / 'b.yaml'} failed",
+        f"{workdir / 'b.yaml'} -> ERROR - disk full",
+    ]
+    assert (workdir / "a.yaml").read_text() == MANIFEST
+    assert (workdir / "b.yaml").read_text() == MANIFEST
+
+
+def test_writes_through_symlinks(workdir: pathlib.Path):
+    os.mkdir(workdir / "base")
+    os.replace(workdir / "a.yaml", workdir / "base" / "a.yaml")
+    os.symlink(os.path.join("base", "a.yaml"), workdir / "a.yaml")
+    write_atomic(workdir / "a.yaml", b"new")
+    assert os.path.islink(workdir / "a.yaml")
+    assert (workdir / "base" / "a.yaml").read_bytes() == b"new"
+
+    nautikos = Nautikos()
+    nautikos.load_config(str(workdir / "nautikos.yaml"))
+    (workdir / "base" / "a.yaml").write_text(MANIFEST)
+    nautikos.update_manifests("my-repo", "2.0")
+    assert not nautikos.errors
+    assert os.path.islink(workdir / "a.yaml")
+    assert (workdir / "base" / "a.yaml").read_text() == MANIFEST.replace("1.0", "2.0")
+    assert not [name for name in os.listdir(workdir) if name.endswith(".tmp")]
+
+
+def test_rollback_through_symlinks(
+    workdir: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+):
+    os.replace(workdir / "a.yaml", workdir / "c.yaml")
+    os.symlink("c.yaml", workdir / "a.yaml")
+    replace = os.replace
+
+    def failing_replace(src, dst):
+        if str(dst).endswith("b.yaml"):
+            raise OSError("disk full")
+        replace(src, dst)
+
+    monkeypatch.setattr(writer.os, "replace", failing_replace)
+    staged_writer = StagedWriter()
+    staged_writer.stage(workdir / "a.yaml", b"new a")
+    staged_writer.stage(workdir / "b.yaml", b"new b")
+    with pytest.raises(CommitError):
+        staged_writer.commit()
+    assert os.path.islink(workdir / "a.yaml")
+    assert (workdir / "c.yaml").read_text() == MANIFEST